@@ -0,0 +1,58 @@
+"""
+Benchmarks the convolution engine (dsproc.util.convolve) to show where the FFT methods overtake a direct convolution.
+
+Run from the repository root with:
+    python benchmarks/bench_convolve.py
+
+For each signal length n and filter length m every method is timed, and the method picked by choose_method is shown next
+to the fastest one. If they disagree a lot on your machine, adjust FFT_COST in dsproc/util/convolve.py.
+"""
+import argparse
+from time import perf_counter
+import numpy as np
+from dsproc.util.convolve import convolve, choose_method
+
+METHODS = ['direct', 'fft', 'overlap-save']
+
+
+def time_method(x, h, method, repeats):
+    best = np.inf
+    for _ in range(repeats):
+        start = perf_counter()
+        convolve(x, h, method=method)
+        best = min(best, perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, nargs="+", default=[10**4, 10**5, 10**6],
+                        help="signal lengths to test")
+    parser.add_argument("--m", type=int, nargs="+", default=[8, 16, 32, 64, 128, 256, 512, 1024, 4096],
+                        help="filter lengths to test")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'n':>9} {'m':>6} " + " ".join(f"{i:>13}" for i in METHODS) + f" {'fastest':>13} {'auto':>13}")
+
+    for n in args.n:
+        x = (rng.standard_normal(n) + 1j * rng.standard_normal(n)).astype(np.complex64)
+        crossover = None
+        for m in args.m:
+            if m > n:
+                continue
+            h = rng.standard_normal(m)
+            times = {i: time_method(x, h, i, args.repeats) for i in METHODS}
+            fastest = min(times, key=times.get)
+            if crossover is None and fastest != 'direct':
+                crossover = m
+
+            row = " ".join(f"{times[i] * 1e3:>10.2f} ms" for i in METHODS)
+            print(f"{n:>9} {m:>6} {row} {fastest:>13} {choose_method(n, m):>13}")
+
+        print(f"n={n}: FFT methods overtake direct convolution at about {crossover} taps\n")
+
+
+if __name__ == "__main__":
+    main()
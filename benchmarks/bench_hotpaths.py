@@ -0,0 +1,354 @@
+"""
+Benchmarks the hot paths of Mod, Demod, Message and Symbol2bit on synthetic data, reporting throughput (Msamples/s for
+the signal methods, Mbit/s for the message methods) and the peak memory allocated during one call.
+
+Run from the repository root with:
+    python benchmarks/bench_hotpaths.py
+
+The loop heavy methods (Message.LFSR, Message.encode's CRC, Message.apply_decompression, Demod.demod_FSK and
+markify) run on the kernel backend, which --backend picks, e.g. to see what numba buys over numpy:
+    python benchmarks/bench_hotpaths.py --backend numpy
+
+Results can be saved to JSON and compared against an earlier run, e.g. before and after upgrading:
+    python benchmarks/bench_hotpaths.py --save before.json
+    python benchmarks/bench_hotpaths.py --compare before.json
+
+When comparing, any benchmark whose throughput dropped by more than --threshold is reported as a regression and the
+script exits with a non-zero status, so it can be used as a check in CI.
+"""
+import argparse
+import json
+import platform
+import sys
+import tracemalloc
+from datetime import datetime, timezone
+from importlib.metadata import version, PackageNotFoundError
+from time import perf_counter
+import numpy as np
+import dsproc
+from dsproc.message.symbol2bit import Symbol2bit
+
+# Every benchmark is a function taking the size scale and returning (prepare, run, units, unit). prepare makes fresh
+# inputs (so methods that change their object can be rerun), run is the timed call, and units is how many samples or
+# bits one call processes
+BENCHMARKS = {}
+
+FS = 100000
+SPS = 16
+
+
+def benchmark(name):
+    def decorator(func):
+        BENCHMARKS[name] = func
+        return func
+    return decorator
+
+
+def symbols(n, M, seed=0):
+    return np.random.default_rng(seed).integers(0, M, n)
+
+
+def bits(n, seed=0):
+    return np.random.default_rng(seed).integers(0, 2, n).astype(np.uint8)
+
+
+def modulated(method, n, M, sps=SPS, *args):
+    s = dsproc.Mod(fs=FS, message=symbols(n, M), sps=sps, f=FS // 10)
+    getattr(s, method)(*args)
+    return s
+
+
+def demod_of(samples):
+    d = dsproc.Demod(fs=FS)
+    d.samples = samples.copy()
+    return d
+
+
+# ************************************ Mod ************************************
+
+def mod_case(method, *args, M=4):
+    def case(scale):
+        n = int(10000 * scale)
+        message = symbols(n, M)
+
+        def prepare():
+            return dsproc.Mod(fs=FS, message=message, sps=SPS, f=FS // 10)
+
+        def run(s):
+            getattr(s, method)(*args)
+
+        return prepare, run, n * SPS, "samples"
+    return case
+
+
+for _method, _args in [("ASK", ()), ("FSK", (500,)), ("QPSK", ()), ("QAM", ("square",)), ("CPFSK", (500,))]:
+    benchmark(f"Mod.{_method}")(mod_case(_method, *_args))
+
+
+@benchmark("Mod.FHSS")
+def mod_fhss(scale):
+    n = int(10000 * scale)
+    s = modulated("QPSK", n, 4)
+    hops = np.array([-20000, -10000, 0, 10000, 20000])
+
+    def prepare():
+        s2 = dsproc.Mod(fs=FS, message=s.message, sps=SPS, f=s.f)
+        s2.samples = s.samples.copy()
+        return s2
+
+    def run(s2):
+        s2.FHSS(hop_f=100, freqs=hops)
+
+    return prepare, run, n * SPS, "samples"
+
+
+# ************************************ Demod ************************************
+
+@benchmark("Demod.QAM")
+def demod_qam(scale):
+    n = int(100000 * scale)
+    s = modulated("QAM", n, 16, 1, "square")
+    s.baseband()
+    c = dsproc.Constellation(M=16)
+    c.square()
+    c.normalise()
+
+    return lambda: demod_of(s.samples), lambda d: d.QAM(c), n, "samples"
+
+
+@benchmark("Demod.demod_ASK")
+def demod_ask(scale):
+    n = int(100000 * scale)
+    s = modulated("ASK", n, 4, 1)
+    return lambda: demod_of(s.samples), lambda d: d.demod_ASK(4, iterations=10), n, "samples"
+
+
+@benchmark("Demod.demod_FSK")
+def demod_fsk(scale):
+    n = int(10000 * scale)
+    s = modulated("FSK", n, 2, 8, 2000)
+    return lambda: demod_of(s.samples), lambda d: d.demod_FSK(2, sps=8, iterations=10), n * 8, "samples"
+
+
+@benchmark("Demod.transmit_window")
+def demod_transmit_window(scale):
+    n = int(1000000 * scale)
+    rng = np.random.default_rng(0)
+    samples = (0.01 * (rng.standard_normal(n) + 1j * rng.standard_normal(n))).astype(np.complex64)
+    # Mostly idle, with a short burst every so often
+    for start in range(0, n - 2000, 50000):
+        samples[start:start + 2000] += 1
+
+    return lambda: demod_of(samples), lambda d: d.transmit_window(0.5, 100), n, "samples"
+
+
+@benchmark("Demod.find_header")
+def demod_find_header(scale):
+    n = int(100000 * scale)
+    rng = np.random.default_rng(0)
+    sig = rng.standard_normal(n)
+    header = sig[n // 3:n // 3 + 1000].copy()
+
+    return lambda: demod_of(np.zeros(1)), lambda d: d.find_header(header, sig), n, "samples"
+
+
+@benchmark("Demod.freq_search")
+def demod_freq_search(scale):
+    n = int(100000 * scale)
+    s = modulated("QPSK", n // SPS, 4)
+    s.samples = s.samples + dsproc.AWGN(n=len(s.samples), power=0.1)
+
+    return lambda: demod_of(s.samples), lambda d: d.freq_search(0, len(s.samples), bandwidth=FS // 20), n, "samples"
+
+
+# ************************************ Message ************************************
+
+@benchmark("Message.huffman_compress")
+def message_huffman(scale):
+    n = int(80000 * scale)
+    data = bits(n)
+    return lambda: dsproc.Message(data=data.copy()), lambda m: m.huffman_compress(n=8), n, "bits"
+
+
+@benchmark("Message.apply_decompression")
+def message_decompress(scale):
+    n = int(80000 * scale)
+    m = dsproc.Message(data=bits(n))
+    m.huffman_compress(n=8)
+    compressed = m.data.copy()
+    decompression_codes = {v: k for k, v in m.compression_codes.items()}
+
+    def prepare():
+        m2 = dsproc.Message(data=compressed.copy())
+        m2.decompression_codes = decompression_codes
+        return m2
+
+    return prepare, lambda m2: m2.apply_decompression(), len(compressed), "bits"
+
+
+@benchmark("Message.encode")
+def message_encode(scale):
+    n = int(64 * 2000 * scale)
+    data = bits(n)
+    return (lambda: dsproc.Message(data=data.copy()), lambda m: m.encode(encoder="crc", blocksize=64, polynomial="16"),
+            n, "bits")
+
+
+@benchmark("Message.LFSR")
+def message_lfsr(scale):
+    # The register length sets the amount of work, 2**n - 1 states of n bits. Only the two tap registers in the lookup
+    # are used, the sequences from the four tap ones end early so the amount of work isn't known
+    lengths = [int(k) for k, taps in dsproc.Message().lfsr_lookup.items() if len(taps) == 2]
+    target = 15 + np.log2(scale)
+    n = min(lengths, key=lambda i: abs(i - target))
+    return dsproc.Message, lambda m: m.LFSR(n), n * (2 ** n - 1), "bits"
+
+
+@benchmark("markify")
+def markify(scale):
+    n = int(20000 * scale)
+    data = symbols(n, 64)
+    return lambda: data, dsproc.markify, n, "samples"
+
+
+# ************************************ Symbol2bit ************************************
+
+@benchmark("Symbol2bit.pattern_search")
+def s2b_pattern_search(scale):
+    n = int(4000 * scale)
+    sync = "1110010110000110"
+    data = bits(n)
+    # Put the sync word in the message so the search finds something
+    data[n // 2:n // 2 + len(sync)] = [int(i) for i in sync]
+
+    def prepare():
+        s2b = Symbol2bit(sync, bits_per_symbol=2)
+        s2b.load_message(data.copy())
+        s2b.create_symbols()
+        s2b.sync_cuts()
+        s2b.markify_cuts()
+        return s2b
+
+    return prepare, lambda s2b: s2b.pattern_search(), n, "bits"
+
+
+# ************************************ Harness ************************************
+
+def run_benchmark(func, scale, repeats):
+    prepare, run, units, unit = func(scale)
+
+    best = np.inf
+    for _ in range(repeats):
+        state = prepare()
+        start = perf_counter()
+        run(state)
+        best = min(best, perf_counter() - start)
+
+    # Measure memory on a separate call, tracemalloc slows everything down
+    state = prepare()
+    tracemalloc.start()
+    try:
+        run(state)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "seconds": best,
+        "units": units,
+        "unit": unit,
+        "throughput": units / best / 1e6,
+        "peak_bytes": peak,
+    }
+
+
+def metadata(scale, repeats):
+    try:
+        dsproc_version = version("dsproc")
+    except PackageNotFoundError:
+        dsproc_version = "unknown"
+
+    return {
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "dsproc": dsproc_version,
+        "numpy": np.__version__,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "precision": dsproc.get_precision(),
+        "kernels": dsproc.get_backend(),
+        "scale": scale,
+        "repeats": repeats,
+    }
+
+
+def rate_unit(unit):
+    return "Msamples/s" if unit == "samples" else "Mbit/s"
+
+
+def compare(results, baseline, threshold):
+    """
+    Prints the change in throughput against a baseline and returns the names of the benchmarks that got slower by more
+    than the threshold
+    """
+    regressions = []
+    print(f"\n{'benchmark':<30} {'baseline':>14} {'now':>14} {'change':>9}")
+    for name, result in results.items():
+        if name not in baseline:
+            print(f"{name:<30} {'-':>14} {result['throughput']:>14.3f} {'new':>9}")
+            continue
+
+        old = baseline[name]["throughput"]
+        change = result["throughput"] / old - 1
+        flag = ""
+        if change < -threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<30} {old:>14.3f} {result['throughput']:>14.3f} {change:>+8.1%}{flag}")
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filter", default="", help="only run benchmarks whose name contains this")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplies the size of the synthetic data")
+    parser.add_argument("--repeats", type=int, default=3, help="timed calls per benchmark, the best is kept")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="compare against results saved by an earlier run")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="fractional drop in throughput that counts as a regression")
+    parser.add_argument("--backend", choices=["numba", "numpy", "python"],
+                        help="the backend for the loop kernels, defaults to numba if it's installed")
+    args = parser.parse_args()
+    dsproc.set_backend(args.backend)
+
+    results = {}
+    print(f"{'benchmark':<30} {'time':>11} {'throughput':>22} {'peak memory':>14}")
+    for name, func in BENCHMARKS.items():
+        if args.filter not in name:
+            continue
+
+        result = run_benchmark(func, args.scale, args.repeats)
+        results[name] = result
+        print(f"{name:<30} {result['seconds'] * 1e3:>8.2f} ms {result['throughput']:>11.3f} "
+              f"{rate_unit(result['unit']):<10} {result['peak_bytes'] / 2**20:>10.2f} MiB")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"meta": metadata(args.scale, args.repeats), "results": results}, f, indent=2)
+        print(f"\nSaved results to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline["meta"].get("scale") != args.scale:
+            print("Warning: the baseline was run at a different --scale, throughputs may not be comparable")
+
+        regressions = compare(results, baseline["results"], args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Benchmarks how long `import dsproc` takes in a fresh interpreter, and lists the modules that take longest to import.
+
+Run from the repository root with:
+    python benchmarks/bench_import.py
+
+numpy is the only heavy dependency dsproc should import up front, scipy's submodules and matplotlib are imported the
+first time they're used. How long numpy takes varies a lot between machines, so the time dsproc adds on top of numpy
+is what's checked: if it's more than --max-ms the script exits with a non-zero status, so it can be used as a check in
+CI.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+TIMER = "import time; start = time.perf_counter(); import {}; print(time.perf_counter() - start)"
+
+
+def run(code, *flags):
+    # Make sure the fresh interpreter imports the same dsproc as this one
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)}
+    return subprocess.run([sys.executable, *flags, "-c", code], env=env, capture_output=True, text=True, check=True)
+
+
+def import_time(module, repeats):
+    """
+    The best of repeats times to import a module in a fresh interpreter, in seconds
+    """
+    return min(float(run(TIMER.format(module)).stdout) for _ in range(repeats))
+
+
+def slowest_imports(module, n):
+    """
+    The n modules with the biggest cumulative import time, from python -X importtime
+    """
+    times = []
+    for line in run(f"import {module}", "-X", "importtime").stderr.splitlines()[1:]:
+        _, cumulative, name = line.split("|")
+        times.append((int(cumulative), name.strip()))
+
+    return sorted(times, reverse=True)[:n]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=5, help="fresh interpreters to time, the best is kept")
+    parser.add_argument("--top", type=int, default=15, help="how many of the slowest imports to list")
+    parser.add_argument("--max-ms", type=float, default=100,
+                        help="fail if dsproc takes this much longer to import than numpy")
+    args = parser.parse_args()
+
+    numpy_ms = import_time("numpy", args.repeats) * 1e3
+    dsproc_ms = import_time("dsproc", args.repeats) * 1e3
+    print(f"import numpy   {numpy_ms:8.1f} ms")
+    print(f"import dsproc  {dsproc_ms:8.1f} ms  ({dsproc_ms - numpy_ms:.1f} ms more than numpy)")
+
+    print(f"\n{'module':<40} {'cumulative':>12}")
+    for us, name in slowest_imports("dsproc", args.top):
+        print(f"{name:<40} {us / 1e3:>9.1f} ms")
+
+    loaded = run("import sys, dsproc; print(' '.join(sys.modules))").stdout.split()
+    eager = sorted(m for m in loaded if m.startswith(("matplotlib", "scipy.")))
+    if eager:
+        print(f"\nWarning: these should be imported lazily: {', '.join(eager[:10])}")
+
+    if dsproc_ms - numpy_ms > args.max_ms:
+        print(f"\nImporting dsproc took more than {args.max_ms:g} ms longer than numpy")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Benchmarks the stream sources and sinks: how many samples a second a file replay and a loopback TCP and UDP socket can
+push through to a consumer that does nothing, and how many blocks were dropped on the way.
+
+Run from the repository root with:
+    python benchmarks/bench_stream.py
+
+With --speed the replays are paced at that many times real time at --fs, which shows whether a receive chain would keep
+up with an SDR at that rate (dropped should stay at 0).
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import numpy as np
+from dsproc.sig.stream import FileSource, SocketSource, SocketSink, replay
+from dsproc.sig.source import write_iq
+
+
+async def file_rate(fn, args):
+    source = FileSource(fn, fs=args.fs, fmt=args.fmt, block_size=args.block_size, speed=args.speed,
+                        overflow='drop')
+    async for _ in source:
+        pass
+    return source.stats
+
+
+async def socket_rate(fn, args, protocol):
+    source = SocketSource(fs=args.fs, protocol=protocol, fmt=args.fmt, block_size=args.block_size,
+                          queue_size=64, overflow='drop')
+    await source.start()
+    sink = SocketSink(source.port, protocol=protocol, fmt=args.fmt)
+    sending = asyncio.create_task(replay(FileSource(fn, fs=args.fs, fmt=args.fmt, block_size=args.block_size,
+                                                    speed=args.speed), sink))
+    async for _ in source:
+        pass
+    await sending
+    return source.stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", type=int, default=2**24, help="how many samples to stream")
+    parser.add_argument("--fs", type=float, default=10e6, help="the sample rate of the stream")
+    parser.add_argument("--fmt", default="cs16", help="the format of the samples on disk and on the wire")
+    parser.add_argument("--block-size", type=int, default=2**16, help="samples per block")
+    parser.add_argument("--speed", type=float, default=None, help="pace at this many times real time")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    x = ((rng.standard_normal(args.samples) + 1j * rng.standard_normal(args.samples)) / 8).astype(np.complex64)
+    with tempfile.TemporaryDirectory() as tmp:
+        fn = os.path.join(tmp, f"stream.{args.fmt}")
+        write_iq(fn, x, args.fmt)
+
+        print(f"{'stream':<8} {'MS/s':>8} {'dropped':>8} {'max backlog':>12}")
+        for name, run in [("file", file_rate(fn, args)), ("tcp", socket_rate(fn, args, 'tcp')),
+                          ("udp", socket_rate(fn, args, 'udp'))]:
+            stats = asyncio.run(run)
+            print(f"{name:<8} {stats.rate / 1e6:>8.1f} {stats.dropped:>8} {stats.max_backlog:>12}")
+
+
+if __name__ == "__main__":
+    main()
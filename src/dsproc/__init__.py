@@ -7,6 +7,8 @@ dsproc is a toolkit for the processing of digital signals. It contains the follo
 
 For more information on a specific class, call help(dpsroc.Class), e.g. help(dsproc.Mod).
 
+To demodulate a directory of captures on several processes, see dsproc.batch (python -m dsproc.batch --help).
+
 To get started there is an examples folder that contains example programs
 """
 
@@ -16,4 +18,17 @@ from .sig.demod import Demod
 from .util.utils import AWGN, create_message, markify
 from .message.message import Message
 from .sig.constellation import Constellation
+from .sig.source import SampleSource
+from .sig.capture import Capture, CaptureWriter
+from .sig.audio import WavWriter
+from .sig.ring import RingBuffer, Overrun
+from .sig.stream import FileSource, ReplaySource, SocketSource, SocketSink, CaptureSink
+from .sig.filters import SOSFilter, FIRFilter
+from .sig.resample import Resampler
+from .sig.channelizer import Channelizer
+from .sig.burst import BurstDetector
+from .util.precision import set_precision, get_precision, count_allocations
+from .util.parallel import set_threads, get_threads
+from .util.kernels import set_backend, get_backend, available_backends
 
+from .util.profiling import profiling, enable_profiling, disable_profiling
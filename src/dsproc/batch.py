@@ -0,0 +1,276 @@
+"""
+Demodulates a whole directory of captures on a pool of processes. Each capture is opened in a worker with
+Demod(fn=...) and detect_params() (so it needs a JSON sidecar or a gqrx style name), run through a job, and the array
+the job returns is handed back through shared memory rather than being pickled down a pipe.
+
+Every finished capture is recorded in a journal (a JSON lines file), so a run that crashed or was killed can be started
+again and carries on with the captures it hadn't finished. A capture that has changed since it was recorded is done
+again.
+
+From the command line:
+
+    python -m dsproc.batch captures/gqrx_* --out decoded --processes 8
+
+writes decoded/<capture name>.npy for each capture, keeps the journal in decoded/journal.jsonl, and prints the time and
+throughput of each capture and of the whole run. --job takes 'module:function' to run your own job, a function that
+takes the Demod and returns an array.
+"""
+import argparse
+import glob
+import importlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory, resource_tracker
+import numpy as np
+from .sig.demod import Demod
+
+
+def quadrature(d: Demod) -> np.ndarray:
+    """
+    The default job: basebands the capture (if its centre frequency is known) and quadrature demodulates it
+    """
+    if d.f:
+        d.baseband()
+    d.quadrature_demod()
+    return d.samples
+
+
+JOBS = {"quadrature": quadrature}
+
+
+def resolve_job(job):
+    """
+    Turns a job name (see JOBS) or 'module:function' into the function. Functions are passed straight through
+    """
+    if callable(job):
+        return job
+    if job in JOBS:
+        return JOBS[job]
+    if ":" not in job:
+        raise ValueError(f"Unknown job '{job}', must be one of {list(JOBS)} or 'module:function'")
+
+    module, name = job.split(":", 1)
+    return getattr(importlib.import_module(module), name)
+
+
+class FileResult:
+    """
+    What happened to one capture. output is the array the job returned (None if it failed), times are in seconds
+    """
+    def __init__(self, fn: str, output: np.ndarray = None, samples: int = 0, read_time: float = 0.0,
+                 job_time: float = 0.0, error: str = None):
+        self.fn = fn
+        self.output = output
+        self.samples = samples
+        self.read_time = read_time
+        self.job_time = job_time
+        self.error = error
+
+    @property
+    def total_time(self) -> float:
+        return self.read_time + self.job_time
+
+    @property
+    def rate(self) -> float:
+        """
+        Samples of the capture demodulated per second
+        """
+        return self.samples / self.total_time if self.total_time else 0.0
+
+    def summary(self) -> str:
+        name = os.path.basename(self.fn)
+        if self.error:
+            return f"{name:<48} failed: {self.error}"
+        return (f"{name:<48} {self.samples:>12} {self.read_time:>8.3f} {self.job_time:>8.3f} "
+                f"{self.rate / 1e6:>8.2f}")
+
+
+def _to_shared(array: np.ndarray) -> dict:
+    """
+    Copies an array into a new block of shared memory, and returns what the parent needs to find it
+    """
+    array = np.ascontiguousarray(array)
+    info = {"shape": array.shape, "dtype": array.dtype.str, "shm": None}
+    if array.nbytes:
+        shm = shared_memory.SharedMemory(create=True, size=array.nbytes)
+        np.ndarray(array.shape, array.dtype, buffer=shm.buf)[...] = array
+        info["shm"] = shm.name
+        shm.close()
+
+    return info
+
+
+def _from_shared(info: dict) -> np.ndarray:
+    """
+    Copies an array out of shared memory and frees the shared memory
+    """
+    if info["shm"] is None:
+        return np.empty(info["shape"], dtype=info["dtype"])
+
+    shm = shared_memory.SharedMemory(name=info["shm"])
+    try:
+        return np.ndarray(info["shape"], info["dtype"], buffer=shm.buf).copy()
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def _work(fn: str, job, mmap: bool) -> dict:
+    """
+    Runs in a worker process: opens and demodulates one capture
+    """
+    result = {"fn": fn}
+    try:
+        start = time.perf_counter()
+        d = Demod(fs=0, fn=fn, mmap=mmap)
+        d.detect_params()
+        result["samples"] = len(d.samples)
+        result["read_time"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        output = resolve_job(job)(d)
+        output = d.samples if output is None else output
+        result["job_time"] = time.perf_counter() - start
+        result["output"] = _to_shared(output)
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+
+    return result
+
+
+def _stamp(fn: str) -> dict:
+    stat = os.stat(fn)
+    return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def read_journal(journal: str) -> dict:
+    """
+    The captures a journal says were finished, by file name. Half written lines from a crash are ignored
+    """
+    done = {}
+    if journal and os.path.exists(journal):
+        with open(journal) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if not entry.get("error"):
+                    done[entry["fn"]] = entry
+
+    return done
+
+
+def demod_files(files: list, job="quadrature", processes: int = None, journal: str = None, mmap: bool = True,
+                callback=None) -> list:
+    """
+    Demodulates captures on a pool of processes, see the module docstring
+
+    :param files: The capture file names
+    :param job: A function that takes the Demod of a capture and returns an array (or None to keep d.samples), a name
+        from JOBS, or 'module:function'. It has to be importable by the worker processes, so not a lambda
+    :param processes: How many worker processes, defaults to one per CPU
+    :param journal: A file to record finished captures in. Captures it says were finished (and haven't changed since)
+        are skipped, so a crashed run can be resumed by running it again
+    :param mmap: Whether workers memory map the captures rather than reading them in
+    :param callback: Called with each FileResult as it finishes, e.g. to save the output. The journal entry is only
+        written once the callback returns, so a crash while saving means the capture is done again
+    :return: A FileResult for each capture that was demodulated this time, in the order they finished
+    """
+    if not callable(job):
+        resolve_job(job)    # Fail now rather than once per file
+    files = [os.fspath(fn) for fn in files]
+    done = read_journal(journal)
+    todo = [fn for fn in files if fn not in done or {k: done[fn].get(k) for k in ("size", "mtime")} != _stamp(fn)]
+
+    results = []
+    if not todo:
+        return results
+
+    if os.name == "posix":
+        # Start the tracker of shared memory here, so the workers share it rather than each starting their own, which
+        # would warn about (and unlink) the blocks they hand over to this process when they exit
+        resource_tracker.ensure_running()
+
+    log = None
+    if journal:
+        log = open(journal, "a+")
+        end = log.tell()
+        if end:
+            # Start on a new line if a crash left half an entry
+            log.seek(end - 1)
+            if log.read(1) != "\n":
+                log.write("\n")
+    try:
+        with ProcessPoolExecutor(max_workers=min(processes or os.cpu_count() or 1, len(todo))) as pool:
+            futures = [pool.submit(_work, fn, job, mmap) for fn in todo]
+            for future in as_completed(futures):
+                r = future.result()
+                output = _from_shared(r["output"]) if "output" in r else None
+                result = FileResult(r["fn"], output, r.get("samples", 0), r.get("read_time", 0.0),
+                                    r.get("job_time", 0.0), r.get("error"))
+                if callback is not None and result.error is None:
+                    callback(result)
+                results.append(result)
+
+                if log is not None:
+                    entry = {"fn": result.fn, **_stamp(result.fn), "samples": result.samples,
+                             "read_time": result.read_time, "job_time": result.job_time, "error": result.error}
+                    log.write(json.dumps(entry) + "\n")
+                    log.flush()
+    finally:
+        if log is not None:
+            log.close()
+
+    return results
+
+
+def report(results: list, wall_time: float) -> str:
+    """
+    A table of the time and throughput of each capture, and the totals for the run
+    """
+    lines = [f"{'capture':<48} {'samples':>12} {'read s':>8} {'job s':>8} {'MS/s':>8}"]
+    lines += [r.summary() for r in results]
+
+    ok = [r for r in results if not r.error]
+    samples = sum(r.samples for r in ok)
+    busy = sum(r.total_time for r in ok)
+    lines.append(f"\n{len(ok)} captures, {len(results) - len(ok)} failed, {samples} samples in {wall_time:.2f} s: "
+                 f"{samples / wall_time / 1e6 if wall_time else 0:.2f} MS/s overall, "
+                 f"{samples / busy / 1e6 if busy else 0:.2f} MS/s per process")
+
+    return "\n".join(lines)
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m dsproc.batch",
+                                     description="Demodulates many captures on a pool of processes",
+                                     epilog=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="+", help="capture files, or glob patterns for them")
+    parser.add_argument("--out", required=True, help="the directory to save the outputs and the journal in")
+    parser.add_argument("--job", default="quadrature", help="a job from JOBS, or 'module:function'")
+    parser.add_argument("--processes", type=int, default=None, help="worker processes, defaults to one per CPU")
+    parser.add_argument("--no-mmap", action="store_true", help="read the captures in rather than memory mapping them")
+    args = parser.parse_args(argv)
+
+    files = sorted({fn for pattern in args.files for fn in (glob.glob(pattern) or [pattern])
+                    if not fn.endswith(".json")})
+    os.makedirs(args.out, exist_ok=True)
+
+    def save(result):
+        np.save(os.path.join(args.out, os.path.basename(result.fn) + ".npy"), result.output)
+
+    start = time.perf_counter()
+    results = demod_files(files, args.job, args.processes, os.path.join(args.out, "journal.jsonl"),
+                          mmap=not args.no_mmap, callback=save)
+    print(report(results, time.perf_counter() - start))
+    print(f"{len(files) - len(results)} captures were already done")
+
+    return 1 if any(r.error for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -19,6 +19,7 @@ columns that add to zero will be the overall hamming distance of the matrix!
 """
 
 import numpy as np
+from ..util import kernels
 
 
 def hamming(m, n):
@@ -185,7 +186,8 @@ def crc(data: np.ndarray, polynomial: np.ndarray | str = "32"):
             "15": np.array([1, 1, 0, 0, 0, 1, 0, 1, 1, 0, 0, 1, 1, 0, 0, 1]),   # CAN, used to control ECUs
             "16": np.array([1, 0, 0, 0, 1, 0, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0, 1]),
 
-            "32": np.array([0, 0, 0, 0, 0, 1, 0, 0,
+            "32": np.array([1,
+                            0, 0, 0, 0, 0, 1, 0, 0,
                             1, 1, 0, 0, 0, 0, 0, 1,
                             0, 0, 0, 1, 1, 1, 0, 1,
                             1, 0, 1, 1, 0, 1, 1, 1])
@@ -203,28 +205,12 @@ def crc(data: np.ndarray, polynomial: np.ndarray | str = "32"):
     else:
         raise ValueError("Polynomial must be an array or a string index of the polynomial dictionary")
 
-    out = data.copy()
-
     # If the message  is just a 1d vector we can reshape it to a 1,n matrix so that it can take matrix operations
-    if len(out.shape) == 1:
-        out = out.reshape([1, -1])
-
-    len_p = len(poly)
-    len_block = out.shape[1]
-
-    out = np.concatenate([out, np.zeros(shape=(out.shape[0], len_p-1))], axis=1)
-    out = out.astype(np.uint8)
-
-    for row in out:
-        index= np.where(row==1)[0][0]
-
-        while row[0:len_block].sum() > 0:
-            row[index:index+len_p] = row[index:index+len_p] ^ poly
-
-            if row.sum() > 0:
-                index = np.where(row == 1)[0][0]
+    if len(data.shape) == 1:
+        data = data.reshape([1, -1])
 
-    return out[:, len_block:]
+    # The long division of each row by the polynomial runs on the kernel backend, see dsproc.util.kernels
+    return kernels.crc_remainder(data, poly)
 
 
 def BCH():
@@ -8,8 +8,11 @@ from collections import Counter
 from collections import namedtuple
 from heapq import heapify, heappop, heappush
 from .encode import hamming, ldpc, crc
+from ..util import kernels
+from ..util.profiling import instrument
 
 
+@instrument("data")
 class Message:
     """
     Class for handling the input, compression, and encoding of message data. Can read in and encode any file (although the
@@ -278,29 +281,10 @@ class Message:
 
     def apply_decompression(self):
         """
-        Decompresses the data using the known decompression codes
+        Decompresses the data using the known decompression codes. The decoding runs on the kernel backend, see
+        dsproc.util.kernels
         """
-        message = ''.join([str(i) for i in self.data])
-        message_decompress = ""
-        all_keys = self.decompression_codes.keys()
-        max_len = map(len, all_keys)
-        max_len = max(list(max_len))
-
-        i=0
-
-        while i < len(message):
-            for j in range(max_len+1):
-                test_code = message[i:i+j]
-
-                if test_code in all_keys:
-                    message_decompress += self.decompression_codes[test_code]
-                    i += j
-                    break
-
-                if j == max_len:
-                    raise RuntimeError(f"Failed to find decompression codeword in data i is {i} code is {test_code}")
-
-        return message_decompress
+        return "".join(kernels.prefix_decode(self.data, self.decompression_codes))
 
     def generate_huffman_codes(self, node, code="", huffman_codes={}):
         """
@@ -453,7 +437,8 @@ class Message:
     def LFSR(self, n, taps=None):
         """
         Generates a recursive sequence using a linear feedback shift register. Utilises a fast bit shifting algorithm
-        as seen here - https://en.wikipedia.org/wiki/Linear-feedback_shift_register
+        as seen here - https://en.wikipedia.org/wiki/Linear-feedback_shift_register, run on the kernel backend (see
+        dsproc.util.kernels)
 
         Initial fill is all ones
 
@@ -465,32 +450,9 @@ class Message:
         if not taps:
             taps = self.lfsr_lookup[str(n)]
 
-        start_state = (2 ** n) - 1
-        lfsr = start_state
-        random_code = bin(start_state)[2:]
-
-        # Go for the maximal iterations I guess
-        for k in range((2 ** n) - 1):
-
-            # Get the first state, this will then be iterated upon for every tap
-            start = lfsr >> (n - taps[0])
-            bit = lfsr
-
-            for j in range(1, len(taps)):
-                bit = (bit >> (n - taps[j])) ^ start
-
-            bit = bit & 1
-            lfsr = (lfsr >> 1) | (bit << (n - 1))
-
-            if lfsr == start_state:
-                if k < (2 ** n) - 2:
-                    print("non-maximal LFSR detected")
-                break
-            else:
-
-                random_code += f'{lfsr:b}'.zfill(n)
-
-        self.pseudo_rand_sequence = np.array([i for i in random_code], dtype=np.uint8)
+        self.pseudo_rand_sequence = kernels.lfsr(n, taps)
+        if len(self.pseudo_rand_sequence) // n < (2 ** n) - 1:
+            print("non-maximal LFSR detected")
 
         return self.pseudo_rand_sequence
 
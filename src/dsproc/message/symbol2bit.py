@@ -1,13 +1,17 @@
 from random import shuffle
 from math import factorial
 from collections import Counter
-from matplotlib import pyplot as plt
 import numpy as np
-from scipy.ndimage import gaussian_filter
 from .message import Message
 from ..util.utils import markify
+from ..util.profiling import instrument
+from ..util.lazy import lazy_import
 
+plt = lazy_import("matplotlib.pyplot")
+ndimage = lazy_import("scipy.ndimage")
 
+
+@instrument("message.data")
 class Symbol2bit:
     def __init__(self, pattern, bits_per_symbol):
         self.number_of_possible_maps = None     # a deduced count of all the possible maps
@@ -185,7 +189,7 @@ class Symbol2bit:
         """
         Applies a gaussian blur to the probability map with the given standard deviation
         """
-        self.prob_map = gaussian_filter(self.prob_map, sigma=sd, axes=1)
+        self.prob_map = ndimage.gaussian_filter(self.prob_map, sigma=sd, axes=1)
 
     def plot_prob_map(self):
         """
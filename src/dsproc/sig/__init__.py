@@ -6,4 +6,13 @@ These classes are:
     Demod: The demodulation class. Contains tools to demodulate (i.e. decode information from) a signal
     Constellation: A class for working with constellation objects, which are used for Quadrature Amplitude Modulation
     Plot: Contains plotting functions
+    SampleSource: A memory mapped window onto a capture file, for captures that are larger than memory
+    Capture, CaptureWriter: Captures saved as raw complex64 with a JSON sidecar holding fs, f, sps and annotations
+    WavWriter: Streams a signal out as a WAV file that can be listened to
+    RingBuffer: Shares one stream of samples between several consumers without copying it
+    stream: asyncio sources and sinks for live streams of samples, with file and socket replays for testing
+    SOSFilter, FIRFilter: Stateful filters for filtering a signal a block at a time
+    Resampler: Polyphase resampler that can resample a signal a block at a time
+    Channelizer: Polyphase filter bank that splits a wideband signal into many narrowband channels in one pass
+    spectral: Short time FFTs, Welch power spectral densities and spectrograms that return arrays
 """
\ No newline at end of file
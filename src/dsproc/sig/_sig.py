@@ -1,15 +1,75 @@
 from time import time
+from functools import wraps
+import warnings
 from pathlib import Path
 import numpy as np
-from scipy.io.wavfile import write
-from scipy import signal
-from .plot import plot
+from .plot import plot, ENVELOPE_POINTS
+from .nco import NCO
+from .graph import Graph
+from .filters import SOSFilter, FIRFilter, decimation_filter, rrc_taps
+from .resample import Resampler, factorise
+from .spectral import PSD, welch, stft, spectrogram
+from .burst import iter_bursts
+from .capture import CaptureWriter
+from .audio import write_wav
+from ..util.convolve import convolve
+from ..util.precision import complex_dtype, as_complex, track_allocations
+from ..util.profiling import instrument
+from ..util.lazy import lazy_import
 
+signal = lazy_import("scipy.signal")
 
+
+# Which cached properties depend on which attributes. Filled in by cached_property
+_DEPENDENTS = {}
+
+
+def cached_property(*depends_on: str):
+    """
+    Decorator that makes a method into a read only property whose value is worked out once and then cached, until one
+    of the attributes it depends on is reassigned (see Signal.__setattr__).
+
+    :param depends_on: The names of the attributes the value is worked out from
+    """
+    def decorator(func):
+        name = func.__name__
+        for attr in depends_on:
+            _DEPENDENTS.setdefault(attr, set()).add(name)
+
+        @wraps(func)
+        def getter(self):
+            cache = self.__dict__.setdefault("_cache", {})
+            if name not in cache:
+                cache[name] = func(self)
+            return cache[name]
+
+        return property(getter)
+
+    return decorator
+
+
+@instrument("samples")
 class Signal:
     """
     Main class for the modulation and demodulation of data into radio waves. Contains functionality for writing
     waves and performing operations on the waveform such as frequency shifting, phase shifting, and resampling.
+
+    Derived values such as M and t are cached, and recalculated when message, samples, fs, sps or sample_offset are
+    reassigned. Changing the message in place (e.g. s.message[0] = 1) doesn't reassign it, so assign a new array
+    instead.
+
+    A Signal can also hold a batch of signals, one per row of a 2d samples (or message) array of shape (channels, n).
+    f and fs can then be arrays with one value per channel. baseband, freq_offset, phase_offset, normalise_amplitude,
+    butterworth_filter, rrc, quadrature_demod, Demod.QAM and the Mod methods (apart from CPFSK_smoother and FHSS) work
+    on every channel at once.
+
+    >>> s = Signal(10000, message=np.zeros((3, 4), dtype=int), sps=8, f=np.array([1000, 2000, 3000]))
+    >>> s.samples = s.create_samples(s.per_channel(s.f))
+    >>> s.samples.shape, s.n_samples, s.channels
+    ((3, 32), 32, 3)
+    >>> s.baseband()
+    >>> np.allclose(s.samples, 1)
+    True
     """
     def __init__(self, fs: int, message: np.ndarray | list,
                  sps: int = 2,
@@ -19,12 +79,14 @@ class Signal:
         Initialise the signal object.
 
         :param fs: Sampling frequency. How often samples will be created for the wave. A wave with a sampling rate of
-            100Hz would have 100 samples per second.
-        :param message: A numpy array of ints containing the message symbols which will be written into a wave.
+            100Hz would have 100 samples per second. Can be an array with one value per channel for a batch.
+        :param message: A numpy array of ints containing the message symbols which will be written into a wave. A 2d
+            array makes a batch, with one message per row.
         :param sps: How many samples to generate per symbol. Typical values are between 8 and 20. Lowering the samples
             per symbol will increase the data rate at the expense of making it more susceptible to errors.
         :param amplitude: The (approximate) max amplitude of the wave, typically 1.
-        :param f: The centre frequency of the signal. Should be somewhere between -fs/2 and fs/2.
+        :param f: The centre frequency of the signal. Should be somewhere between -fs/2 and fs/2. Can be an array with
+            one value per channel for a batch.
 
         >>> s = Signal(10000, message=np.array([1, 0, 1, 1, 1]), sps=32, f=3000)    # instance a Signal object
         >>> (s.fs, s.message, s.sps, s.f)   # Display the parameters
@@ -32,19 +94,30 @@ class Signal:
 
         """
         # Sampling frequency
-        self.fs = fs
+        self.fs = np.array(fs) if isinstance(fs, (list, tuple)) else fs
         # Message as an array of symbols
         self.message = np.array(message)
         # Samples per symbol
         self.sps = sps
         # Intermediate frequency
-        self.f = f
+        self.f = np.array(f) if isinstance(f, (list, tuple)) else f
         # Mas amplitude of signal
         self.amp = amplitude
 
         # Container for the samples which hold the radio wave
-        self.samples = np.array([], dtype=np.complex64)
+        self.samples = np.array([], dtype=complex_dtype())
+        # The index of the first sample. Non-zero when the samples are one block of a longer capture, which keeps the
+        # time vector (and anything made from it) continuous from block to block
+        self.sample_offset = 0
+
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
 
+        # Throw away any cached values that were worked out from the old value
+        cache = self.__dict__.get("_cache")
+        if cache and name in _DEPENDENTS:
+            for key in _DEPENDENTS[name]:
+                cache.pop(key, None)
 
     @property
     def n_samples(self) -> int:
@@ -59,14 +132,48 @@ class Signal:
         # This first clause occurs if we are coming from the demodulation side, because we will have loaded in
         # samples but not a message
         # TODO: Consider overwriting this instead in the child classes
-        if len(self.message) == 0:
-            if len(self.samples) == 0:  # It's nice to be able to init the demod class without any data sometimes
+        if self.message.size == 0:
+            if self.samples.size == 0:  # It's nice to be able to init the demod class without any data sometimes
                 return 0
 
-        if len(self.samples) == 0:
-            return self.sps * len(self.message)
+        # The last axis is time, so this works for batches too
+        if self.samples.size == 0:
+            return self.sps * self.message.shape[-1]
 
-        return len(self.samples)
+        return self.samples.shape[-1]
+
+    @property
+    def channels(self) -> int:
+        """
+        The number of signals in the batch, 1 if the samples are a 1d array
+
+        >>> s = Signal(10000, message=np.zeros((4, 10), dtype=int), sps=2)
+        >>> s.channels
+        4
+        """
+        if self.samples.ndim == 2:
+            return self.samples.shape[0]
+        if self.message.ndim == 2:
+            return self.message.shape[0]
+
+        return 1
+
+    @staticmethod
+    def per_channel(value):
+        """
+        Shapes a per channel parameter (f, fs, a phase) so that it broadcasts against samples of shape (channels, n).
+        Arrays become columns, scalars are returned as they are.
+
+        >>> Signal.per_channel(np.array([100, 200]))
+        array([[100],
+               [200]])
+        >>> Signal.per_channel(100)
+        100
+        """
+        if np.ndim(value):
+            return np.asarray(value)[:, None]
+
+        return value
 
     @property
     def dur(self) -> float:
@@ -79,11 +186,11 @@ class Signal:
         """
         return self.n_samples / self.fs
 
-    @property
+    @cached_property("message")
     def M(self) -> int:
         """
         The number of unique symbols in the message, which is how many different levels the modulation scheme
-        should have.
+        should have. Cached until the message is reassigned.
 
         >>> s = Signal(10000, message=np.array([1, 0, 1, 1, 1]), sps=32, f=3000)
         >>> s.M # Two symbols, 0 and 1
@@ -91,17 +198,39 @@ class Signal:
         """
         return len(np.unique(self.message))  # The number of symbols
 
-    @property
+    @cached_property("message")
+    def channel_M(self) -> int | np.ndarray:
+        """
+        The number of unique symbols in each channel's message. For a batch this is a column (see per_channel), so
+        each channel is modulated with as many levels as it would be on its own. Otherwise it's the same as M.
+
+        >>> s = Signal(10000, message=np.array([[1, 0, 1, 1], [0, 1, 2, 3]]), sps=32, f=3000)
+        >>> s.M, s.channel_M.ravel()
+        (4, array([2, 4]))
+        """
+        if np.ndim(self.message) < 2:
+            return self.M
+
+        return self.per_channel(np.array([len(np.unique(row)) for row in self.message]))
+
+    @cached_property("fs", "sample_offset", "message", "samples", "sps")
     def t(self) -> np.ndarray:
         """
-        A 1d array which contains when the samples occur. This is used to construct the wave.
+        A 1d array which contains when the samples occur. This is used to construct the wave. Cached, so the array is
+        read only. If fs is an array (one per channel) then t has one row per channel.
 
         >>> s = Signal(10000, message=np.array([1, 0, 1, 1, 1]), sps=32, f=3000)
         >>> s.t[0:5]
         array([0.    , 0.0001, 0.0002, 0.0003, 0.0004])
-
+        >>> s.t is s.t
+        True
+        >>> s.fs = 20000    # Changing the sample rate changes t
+        >>> s.t[0:2]
+        array([0.e+00, 5.e-05])
         """
-        return 1 / self.fs * np.arange(self.n_samples)
+        t = 1 / self.per_channel(self.fs) * np.arange(self.sample_offset, self.sample_offset + self.n_samples)
+        t.setflags(write=False)
+        return t
 
     def create_samples(self, freq: int | np.ndarray,
                        theta: int | np.ndarray = 0,
@@ -122,6 +251,9 @@ class Signal:
         :param theta: The phase value/s in radians. Int or np array
         :param amp: The amplitude values. Float or np array
 
+        Arrays are per sample, along the last axis. For a batch they can be 2d (channels, n), or a column (channels, 1)
+        made with per_channel to give each channel its own value.
+
         # TODO: Might be best if this lived in the Mod class
         >>> s = Signal(10000, message=np.array([1, 0, 2]), sps=3, f=3000)
         >>> # Make an array of amplitudes to do amplitude shift keying, Add one to the message to avoid a zero amplitude
@@ -137,21 +269,14 @@ class Signal:
          -0.80902+0.58779j]
 
         """
-        z = np.ndarray([])
-        # Create a copy of t, because we may need to alter it
-        t = self.t.copy()
-
-        # If we're supplying a frequency vector (for FSK) then the length might not be compatible with t
-        if isinstance(freq, np.ndarray):
-            t = t[0:len(freq)]
-
-        # Same for phase
-        if isinstance(theta, np.ndarray):
-            t = t[0:len(theta)]
+        # Slicing t below only makes views of it, so there's no need to copy it
+        t = self.t
 
-        # same for amplitude
-        if isinstance(amp, np.ndarray):
-            t = t[0:len(amp)]
+        # If we're supplying a frequency vector (for FSK) then the length might not be compatible with t. Same for
+        # phase and amplitude. Per channel columns have length 1 and broadcast instead
+        for value in (freq, theta, amp):
+            if isinstance(value, np.ndarray) and value.ndim and value.shape[-1] != 1:
+                t = t[..., 0:value.shape[-1]]
 
         # Frequency has to be a non-zero value
         if isinstance(freq, int):
@@ -164,19 +289,46 @@ class Signal:
         angle = 2 * np.pi * freq * t + theta
 
         # equivalent to z = amp * np.exp(1j * (2 * np.pi * freq * t + theta))
-        # but this way is faster
-        z = amp * np.cos(angle) + 1j * amp * np.sin(angle)
-
-        # If the dtype has changed due to different input dtypes
-        if z.dtype != np.complex64:
-            z = z.astype(np.complex64)
+        # but this way is faster, and writing the parts straight into the output array skips making a complex128 wave
+        # and casting it down (see dsproc.set_precision)
+        z = np.empty(np.broadcast_shapes(np.shape(angle), np.shape(amp)), dtype=complex_dtype())
+        np.multiply(amp, np.cos(angle), out=z.real)
+        np.multiply(amp, np.sin(angle, out=angle), out=z.imag)
 
         return z
 
+    def lazy(self) -> Graph:
+        """
+        Returns a Graph that records operations on this signal instead of running them straight away. Call compute()
+        on the graph to run them all in one chunked pass, and explain() to see how it plans to do that. See Graph.
+
+        >>> s = Signal(10000, message=np.array([1, 0, 1, 1]), sps=8, f=3000)
+        >>> s.samples = s.create_samples(s.f)
+        >>> _ = s.lazy().baseband().phase_offset(90).compute()
+        >>> s.f
+        0
+        """
+        return Graph(self)
+
+    def _writeable_samples(self) -> np.ndarray:
+        """
+        Makes sure the samples can be modified in place, i.e. they are a writeable array of the complex dtype set by
+        dsproc.set_precision. Copies them if they aren't (for example if they are memory mapped from a file)
+        """
+        if not isinstance(self.samples, np.ndarray):
+            # e.g. an IQView of a memory mapped quantised capture, which is converted to complex as it's read
+            self.samples = as_complex(np.asarray(self.samples))
+        if self.samples.dtype != complex_dtype() or not self.samples.flags.writeable:
+            self.samples = self.samples.astype(complex_dtype())
+
+        return self.samples
+
+    @track_allocations
     def baseband(self) -> None:
         """
-        Basebands the signal by shifting the centre frequency to zero. This function works by creating a wave of
-        appropriate length with the centre frequency of -1*self.f, and multiplying the signal by this wave.
+        Basebands the signal by shifting the centre frequency to zero. This function works by mixing the signal with
+        a tone of frequency -1*self.f, generated block by block by a numerically controlled oscillator (see NCO).
+        The samples are modified in place.
 
         >>> s = Signal(10000, message=np.array([1, 0, 1, 0, 1, 1]), sps=16, f=3000)
         >>> # Make an array of amplitudes to do amplitude shift keying, Add one to the message to avoid a zero amplitude
@@ -190,18 +342,19 @@ class Signal:
         >>> s.f
         0
         """
-        if not self.f:
+        if self.f is None or not np.all(self.f):
             raise ValueError("Cannot baseband signal because the center frequency is unknown. Set the attribute 'f' to "
                              "some integer value")
 
-        offset = self.create_samples(freq=-1*self.f)
-        self.samples = self.samples * offset
+        NCO(f=-1*self.f, fs=self.fs, start=self.sample_offset).mix(self._writeable_samples())
         self.f = 0
 
+    @track_allocations
     def normalise_amplitude(self) -> None:
         """
         normalises the amplitude of the signal to be between 0 and 1. This means that the real and imaginary parts
-        will be between -1.0 and 1.0
+        will be between -1.0 and 1.0. The samples are modified in place. Each channel of a batch is normalised on its
+        own.
 
         Example
         >>> s = Signal(10000, message=np.array([1, 0, 1, 0, 1, 1]), sps=16, f=3000)
@@ -209,48 +362,53 @@ class Signal:
         >>> s.samples = np.array([6.6+0.j, 5.3+3.9j, 2.0+6.3j, -2.0+6.3j, -5.39+3.9j])
         >>> s.normalise_amplitude()
         >>> np.round((max(s.samples.real), min(s.samples.real), max(s.samples.imag), max(s.samples.imag)), 2)
-        array([ 1.  , -0.82,  0.95,  0.95])
+        array([ 1.  , -0.82,  0.95,  0.95], dtype=float32)
         """
-        max_real = max(abs(self.samples.real))
-        max_imag = max(abs(self.samples.imag))
+        samples = self._writeable_samples()
+        # max(|x|) without making an array of |x|
+        peaks = [np.max(part, axis=-1, keepdims=True) for part in (samples.real, samples.imag)]
+        troughs = [np.min(part, axis=-1, keepdims=True) for part in (samples.real, samples.imag)]
+        max_real = np.maximum(peaks[0], -troughs[0])
+        max_imag = np.maximum(peaks[1], -troughs[1])
 
-        max_val = max(max_imag, max_real)
-        self.samples = (self.samples / max_val)
+        max_val = np.maximum(max_imag, max_real)
+        np.divide(samples, max_val, out=samples)
 
+    @track_allocations
     def phase_offset(self, angle: int = 40) -> None:
         """
-        Adds a phase offset of x degrees to the signal
+        Adds a phase offset of x degrees to the signal. The samples are modified in place.
 
-        :param angle: Phase offset in degrees
+        :param angle: Phase offset in degrees. Can be an array with one angle per channel for a batch
         """
         # degrees to radians
-        phase_offset = angle*np.pi / 180
+        phase_offset = np.asarray(angle)*np.pi / 180
         z = 1 * np.cos(phase_offset) + 1j * np.sin(phase_offset)
 
-        self.samples = self.samples * z
-        # The type gets coerced to complex 128, so lets fix that
-        self.samples = self.samples.astype(np.complex64)
+        # Multiplying by a python complex would promote complex64 samples to complex128, so match the dtype first
+        samples = self._writeable_samples()
+        np.multiply(samples, self.per_channel(z.astype(samples.dtype)), out=samples)
 
+    @track_allocations
     def freq_offset(self, freq: int = 1000) -> None:
         """
         Moves the signal up by the given frequency. Adds the frequency offset to the 'f' attribute. Note that the
         frequency components of a signal are (kind of) bounded to between -fs/2 and fs/2, so shifting a signal up in
-        frequency may cause it to wrap around to a negative frequency.
+        frequency may cause it to wrap around to a negative frequency. The samples are modified in place.
 
         :param freq: Int, the frequency to shift the signal by. Can be negative.
         """
-        freq_offset = self.create_samples(freq=freq, theta=0, amp=1)
-        freq_offset = freq_offset[0:len(self.samples)]  # In case it's a bit longer
-
-        self.samples = self.samples * freq_offset
-        if self.f:
-            self.f += freq
-        else:
+        NCO(f=freq, fs=self.fs, start=self.sample_offset).mix(self._writeable_samples())
+        if self.f is None:
             self.f = freq
+        else:
+            self.f = self.f + freq
 
+    @track_allocations
     def resample(self, up: int = 16, down: int = 1) -> None:
         """
-        A simple wrapper for scipy's resample. Resamples the signal a factor equal to up/down.
+        Resamples the signal by a factor equal to up/down with a polyphase filter, see dsproc.Resampler. Large pure
+        up or down sampling factors are done in stages.
 
         :param up: Factor to upsample by
         :param down: Factor to downsample by
@@ -272,15 +430,19 @@ class Signal:
         >>> s.fs, s.sps, len(s.samples)
         (1000, 7, 70)
         """
-        self.samples = signal.resample_poly(self.samples, up, down)
+        self.samples = Resampler(up, down).resample(self.samples)
         self.fs = int(self.fs * up/down)
         self.sps = int(self.sps * (up/down))
 
+    @track_allocations
     def decimate(self, n: int, filter_order: int = 8, ftype: str = 'iir') -> None:
         """
-        wrapper for scipy's decimate. First filters out high frequency components and then takes every nth sample
+        Works like scipy's decimate: first filters out high frequency components (forwards and backwards, so without
+        a phase shift) and then takes every nth sample. The filter designs are cached. Factors greater than 13 are split
+        into stages of at most 13, as the filter becomes unstable for large factors. A prime factor greater than 13
+        can't be split, so it's done in one stage with a warning
 
-        :param n: The down sampling factor. If greater than 13 it is reccommended to decimate in stages
+        :param n: The down sampling factor
         :param filter_order: The order of the filter, defaults to 8 for iir
         :param ftype: The filter type, 'iir' (infinite impulse response) or 'fir' (finite impulse response)
 
@@ -291,63 +453,156 @@ class Signal:
         >>> s.resample(up=1, down=10)
         >>> s.fs, s.sps, len(s.samples)
         (1000, 7, 70)
-        """
 
-        if n > 13:
-            raise Warning("it is recommended to call decimate multiple times for downsampling factors greater than 13")
+        # Large factors are done in stages
+        >>> s = Signal(64000, message=np.array([1, 0, 1, 0]), sps=640, f=3000)
+        >>> s.samples = s.create_samples(freq=s.f, theta=0, amp=1)
+        >>> s.decimate(64)
+        >>> s.fs, s.sps, len(s.samples)
+        (1000, 10, 40)
+        """
+        factors = factorise(n, 13)
+        if max(factors, default=1) > 13:
+            warnings.warn(f"Decimating by {max(factors)} in one stage, which may be unstable. Factors greater than 13 "
+                          f"should be avoided", RuntimeWarning, stacklevel=2)
+
+        samples = self.samples
+        for factor in factors:
+            filt = decimation_filter(factor, filter_order, ftype)
+            if ftype == 'iir':
+                samples = signal.sosfiltfilt(filt, samples, axis=-1)[..., ::factor]
+            else:
+                samples = signal.resample_poly(samples, 1, factor, axis=-1, window=filt)
 
-        self.samples = signal.decimate(self.samples, n, n=filter_order, ftype=ftype)
+        self.samples = as_complex(samples)
         self.fs = int(self.fs / n)
         self.sps = int(self.sps / n)
 
-    def efficiency(self):
+    def spectrum(self, nfft: int = 1024, window: str = 'hann') -> PSD:
         """
-        Calculates bandwidth efficiency of the signal. This is the total area under the curve of the signals fft plot
+        Estimates the power spectral density of the samples by Welch's method (see dsproc.sig.spectral.welch), in
+        bounded memory however long the capture is. The PSD can be passed to efficiency and power_spill, so one pass
+        over the samples can answer several questions.
+
+        :param nfft: The FFT size, which sets the frequency resolution to fs / nfft
+        :param window: The window applied to each frame
+
+        >>> s = Signal(fs=1000, message=np.array([0]), sps=1000, f=100)
+        >>> s.samples = s.create_samples(s.f)
+        >>> psd = s.spectrum(nfft=200)
+        >>> psd.peak(), round(float(psd.total_power()), 2)
+        (100.0, 1.0)
         """
-        ft = np.abs(np.fft.fft(self.samples))
-        integral = np.sum(ft)
-        return integral
+        return welch(self.samples, self.fs, nfft=nfft, window=window)
 
-    def power_spill(self, band_low, band_high):
+    def stft(self, nfft: int = 1024, window: str = 'hann') -> tuple:
+        """
+        The short time FFT of the samples, frames overlapping by half, see dsproc.sig.spectral.stft
+
+        :param nfft: The length of each frame and FFT
+        :param window: The window applied to each frame
+        :return: (frequencies, times, spectra), spectra has one row per frame
+        """
+        return stft(self.samples, self.fs, nfft=nfft, window=window)
+
+    @track_allocations
+    def efficiency(self, nfft: int = 1024, psd: PSD = None):
+        """
+        Calculates bandwidth efficiency of the signal. This is the total area under the curve of the signal's
+        amplitude spectrum, the square root of its PSD
+
+        :param nfft: The FFT size of the PSD
+        :param psd: A PSD from spectrum, to save working it out again
+        """
+        if psd is None:
+            psd = self.spectrum(nfft)
+
+        amplitude = psd.amplitude()
+        return amplitude.sum(dtype=amplitude.dtype) * amplitude.dtype.type(psd.df)
+
+    @track_allocations
+    def power_spill(self, band_low, band_high, nfft: int = 1024, psd: PSD = None):
         """
         Returns the power of the signal that lies outside the given bands. Use this when looking at the harmonics being
-        generated by a signal
+        generated by a signal. As with a bandstop filter, the band is kept at both positive and negative frequencies
+
+        :param band_low: The bottom of the band in Hz
+        :param band_high: The top of the band in Hz
+        :param nfft: The FFT size of the PSD
+        :param psd: A PSD from spectrum, to save working it out again
         """
-        sos = signal.butter(5, (band_low, band_high), "bandstop", fs=self.fs, output="sos")
-        filtered = signal.sosfilt(sos, self.samples)
-        filtered = filtered.astype(np.complex64)
-        power = np.sum(np.abs(filtered))
+        if psd is None:
+            psd = self.spectrum(nfft)
+
+        # One mask for both bands, so a band that crosses 0 Hz (and overlaps its mirror image) is only kept once
+        freqs = psd.freqs
+        kept = ((freqs >= band_low) & (freqs <= band_high)) | ((freqs >= -band_high) & (freqs <= -band_low))
+        power = psd.density[~kept].sum(dtype=psd.density.dtype) * psd.density.dtype.type(psd.df)
         return power
 
+    @track_allocations
     def butterworth_filter(self, frequencies: int | list | tuple,
                            filter_type: str,
                            order: int = 5) \
             -> tuple[np.ndarray, np.ndarray | float, np.ndarray]:
         """
         Generic wrapper for scipy's butterworth filter. Creates and applies a digital butterworth filter to the signal,
-        Returns the filter taps for investigation of the filter parameters.
+        Returns the filter taps for investigation of the filter parameters. Filter designs are cached, so calling this
+        repeatedly with the same parameters doesn't redesign the filter. To filter a capture block by block use a
+        SOSFilter with apply_filter instead.
 
         :param frequencies: int, or tuple/list of length 2. The frequencies to apply the filter at
         :param filter_type: String, the direction the filter works in. One of
             ['lowpass', 'highpass', 'bandpass', 'bandstop']
         :param order: the order of the filter (how many taps it has)
 
-        :return: the filter taps as an np.ndarray
+        :return: the filter taps as an np.ndarray. For a batch with one fs per channel, the taps for each channel
+            stacked into a (channels, sections, 6) array
         """
-        filt = signal.butter(N=order, Wn=frequencies, btype=filter_type, analog=False, output='sos', fs=self.fs)
-        self.samples = signal.sosfilt(filt, self.samples)
-        self.samples = self.samples.astype(np.complex64)
+        if np.ndim(self.fs) == 0:
+            filt = SOSFilter.butterworth(frequencies, filter_type, fs=self.fs, order=order)
+            self.samples = filt.process(self.samples)
 
-        return filt
+            return filt.sos
 
-    def _gen_rrc(self, alpha: float, N: int):
+        # Channels with different sample rates need different filters, so filter each group of channels that share a
+        # sample rate in one go
+        fs = np.asarray(self.fs)
+        samples = np.empty(self.samples.shape, dtype=complex_dtype())
+        sos = None
+        for rate in np.unique(fs):
+            rows = fs == rate
+            filt = SOSFilter.butterworth(frequencies, filter_type, fs=rate.item(), order=order)
+            samples[rows] = filt.process(self.samples[rows])
+            if sos is None:
+                sos = np.empty((len(fs),) + filt.sos.shape)
+            sos[rows] = filt.sos
+
+        self.samples = samples
+        return sos
+
+    @track_allocations
+    def apply_filter(self, filt: SOSFilter | FIRFilter) -> None:
         """
-        TODO: Get this working correctly
-        **** UNTESTED ****
+        Runs the samples through a stateful filter object. Because the filter remembers where it got up to, the same
+        filter can be applied to each block of a capture in turn (see Demod.chunks) and the output is identical to
+        filtering the whole capture at once.
 
-        Code adapted from: https://github.com/veeresht/CommPy/blob/master/commpy/filters.py
+        :param filt: A SOSFilter or FIRFilter
 
-        Generates a root raised cosine (RRC) filter (FIR) impulse response.
+        >>> s = Signal(10000, message=np.array([1, 0, 1, 1]), sps=8, f=3000)
+        >>> s.samples = s.create_samples(s.f)
+        >>> filt = SOSFilter.butterworth(1000, 'lowpass', fs=s.fs)
+        >>> s.apply_filter(filt)
+        >>> len(s.samples)
+        32
+        """
+        self.samples = filt.process(self.samples)
+
+    def _gen_rrc(self, alpha: float, N: int):
+        """
+        Generates a root raised cosine (RRC) filter (FIR) impulse response for this signal's samples per symbol and
+        sampling frequency. See filters.rrc_taps, which caches the taps.
 
         Parameters
         ----------
@@ -363,35 +618,12 @@ class Signal:
         rrc : 1-D ndarray of floats
             Impulse response of the root raised cosine filter.
         """
-        Ts = self.sps/self.fs
-        T_delta = 1 / float(self.fs)
-        sample_num = np.arange(N)
-
-        rrc = np.zeros(N, dtype=float)
-
-        for x in sample_num:
-            t = (x - N / 2) * T_delta
-            if t == 0.0:
-                rrc[x] = 1.0 - alpha + (4 * alpha / np.pi)
-
-            elif alpha != 0 and t == Ts / (4 * alpha):
-                rrc[x] = (alpha / np.sqrt(2)) * (((1 + 2 / np.pi) * \
-                                                    (np.sin(np.pi / (4 * alpha)))) + (
-                                                               (1 - 2 / np.pi) * (np.cos(np.pi / (4 * alpha)))))
-
-            elif alpha != 0 and t == -Ts / (4 * alpha):
-                rrc[x] = (alpha / np.sqrt(2)) * (((1 + 2 / np.pi) * \
-                                                    (np.sin(np.pi / (4 * alpha)))) + (
-                                                               (1 - 2 / np.pi) * (np.cos(np.pi / (4 * alpha)))))
-
-            else:
-                rrc[x] = (np.sin(np.pi * t * (1 - alpha) / Ts) + \
-                            4 * alpha * (t / Ts) * np.cos(np.pi * t * (1 + alpha) / Ts)) / \
-                           (np.pi * t * (1 - (4 * alpha * t / Ts) * (4 * alpha * t / Ts)) / Ts)
+        # The taps only depend on fs through t / Ts, which doesn't depend on fs at all, so a batch with one fs per
+        # channel can share the taps of its first channel
+        return rrc_taps(alpha, N, self.sps, np.ravel(self.fs)[0].item())
 
-        return rrc
-
-    def rrc(self, alpha: float = 0.4, N: int = 0):
+    @track_allocations
+    def rrc(self, alpha: float = 0.4, N: int = 0, normalise: bool = True):
         """
         TODO: Get this working correctly
         **** UNTESTED ****
@@ -406,6 +638,10 @@ class Signal:
         alpha : float
             Roll off factor (Valid values are [0, 1]).
 
+        normalise : bool
+            Rescale the output amplitude. Turn this off when filtering a capture block by block, otherwise each block
+            is scaled differently
+
         Returns
         ----------
         rcc_vals : 1d array of floats
@@ -415,41 +651,50 @@ class Signal:
             N = 10*self.sps + 1
 
         rrc_vals = self._gen_rrc(alpha, N)
-        self.samples = np.convolve(self.samples, rrc_vals, mode='valid')
+        self.samples = convolve(self.samples, rrc_vals, mode='valid')
         # Rescale the samples
-        self.normalise_amplitude()
+        if normalise:
+            self.normalise_amplitude()
 
         # Return the filter values
         return rrc_vals
 
-    def trim_by_power(self, padding: int = 0, std_cut: float = 1.5,
-                      n: int = 10, drop: bool = True):
+    @track_allocations
+    def trim_by_power(self, padding: int = 0, threshold: float = 10.0, n: int = 10, drop: bool = True,
+                      std_cut: float = None):
         """
-        Trims low power noise from the beginning and end of a signal. Runs a moving average over the samples first.
-        When recording a signal manually there will always be unwanted noise before the signal and after the signal.
-        Use this function to cut it out.
+        Trims low power noise from the beginning and end of a signal. When recording a signal manually there will
+        always be unwanted noise before the signal and after the signal. Use this function to cut it out.
+
+        Everything from the start of the first burst of power to the end of the last one is kept, see BurstDetector.
+        The capture is looked at a chunk at a time, so trimming a memory mapped capture doesn't read it all in.
 
         :param padding: n sample padding either side of the cut
-        :param std_cut: The threshold that is used to decide if a sample is part of the signal or not, measured in
-                        standard deviations from the mean
-        :param n: The length of the moving average that is applied to the samples before cutting
+        :param threshold: How far above the noise floor, in dB, the (averaged) power has to rise to count as signal
+        :param n: The length of the moving average that is applied to the power of the samples before cutting
         :param drop: If drop is True then the samples are cut out from the signal, otherwise they are set to 0+0j
-        """
-        # If we do a moving average over the abs value of the samples (the abs value being the power) we get a
-        # clear spike where the sig begins
-        av = np.convolve(np.abs(self.samples), np.ones(n), 'valid') / n
-        sdev = np.std(av)
-
-        index = np.arange(len(av))[abs(av) > std_cut * sdev]
+        :param std_cut: Deprecated, use threshold. The old threshold, in standard deviations of the averaged
+            amplitude. It's turned into a fixed power level, so signals are cut about where they used to be
+        """
+        if std_cut is not None:
+            warnings.warn("std_cut is deprecated, use threshold (in dB above the noise floor) instead",
+                          DeprecationWarning, stacklevel=2)
+            # The level the averaged amplitude had to rise above, as a power
+            level = (std_cut * np.std(convolve(np.abs(self.samples), np.ones(n) / n, mode='valid'))) ** 2
+            bursts = list(iter_bursts(self.samples, on=0, off=0, n=n, noise_floor=level))
+        else:
+            bursts = list(iter_bursts(self.samples, on=threshold, n=n))
+        if not bursts:
+            raise ValueError("No signal was found above the noise floor")
 
         # first is the turn on, last is turn off
-        first_ind = index[0] - int(padding)
-        first_ind = max(first_ind, 0)
-
-        last_ind = index[-1] + int(padding)
+        first_ind = max(bursts[0].start - int(padding), 0)
+        last_ind = bursts[-1].stop + int(padding)
 
         if drop:
             self.samples = self.samples[first_ind:last_ind]
+            # Keep the time of each sample, so frequency shifts carry on lining up with the rest of the capture
+            self.sample_offset += first_ind
         else:
             self.samples[:first_ind] = 0 + 0j
             self.samples[last_ind:] = 0 + 0j
@@ -458,53 +703,70 @@ class Signal:
     # ************************************ Plotting Functions ************************************
     # *************************************                    ************************************
 
-    def phase_view(self, n: int = 4000000, start_sample: int = 0):
+    def _plot_slice(self, n: int | None, start_sample: int) -> np.ndarray:
+        """
+        The samples a plot covers. Slicing makes a view, so nothing is copied (or read, for memory mapped samples)
+        """
+        stop = None if n is None else start_sample + n
+        return self.samples[start_sample:stop]
+
+    def phase_view(self, n: int = None, start_sample: int = 0, points: int = ENVELOPE_POINTS):
         """
-        Generates and displays a phase trace plot. This is the phase of each samples.
+        Generates and displays a phase trace plot. This is the phase of each samples. Long stretches of samples are
+        drawn as a min/max envelope, so even a whole capture plots quickly.
 
-        :param n: How many samples to plot
+        :param n: How many samples to plot, defaults to the rest of the signal
         :param start_sample: The sample to start plotting from
+        :param points: The most points to draw, about one per pixel is plenty
         """
         kwargs = {
             "type": "view",
             "subtype": "phase",
-            "start": start_sample
+            "start": start_sample,
+            "points": points
             }
-        plot(self.samples[start_sample:start_sample + n], **kwargs)
+        plot(self._plot_slice(n, start_sample), **kwargs)
 
-    def freq_view(self, n: int = 4000000, start_sample: int = 0):
+    def freq_view(self, n: int = None, start_sample: int = 0, points: int = ENVELOPE_POINTS):
         """
         TODO: Fix the big freq spikes somehow
-        Generates and displays a frequency trace plot. This is the instantaneous frequencies of the samples.
+        Generates and displays a frequency trace plot. This is the instantaneous frequencies of the samples. Long
+        stretches of samples are drawn as a min/max envelope, so even a whole capture plots quickly.
 
-        :param n: How many samples to plot
+        :param n: How many samples to plot, defaults to the rest of the signal
         :param start_sample: The sample to start plotting from
+        :param points: The most points to draw, about one per pixel is plenty
         """
         kwargs = {
             "type": "view",
             "subtype": "freq",
             "fs": self.fs,
-            "start": start_sample
+            "start": start_sample,
+            "points": points
             }
-        plot(self.samples[start_sample:start_sample + n], **kwargs)
+        plot(self._plot_slice(n, start_sample), **kwargs)
 
-    def amp_view(self, n: int = 4000000, start_sample: int = 0):
+    def amp_view(self, n: int = None, start_sample: int = 0, points: int = ENVELOPE_POINTS):
         """
-        Generates and displays a amplitude trace plot. This is the absolute value of the samples
+        Generates and displays a amplitude trace plot. This is the absolute value of the samples. Long stretches of
+        samples are drawn as a min/max envelope, so even a whole capture plots quickly.
 
-        :param n: How many samples to plot
+        :param n: How many samples to plot, defaults to the rest of the signal
         :param start_sample: The sample to start plotting from
+        :param points: The most points to draw, about one per pixel is plenty
         """
         kwargs = {
             "type": "view",
             "subtype": "amp",
-            "start": start_sample
+            "start": start_sample,
+            "points": points
             }
-        plot(self.samples[start_sample:start_sample + n], **kwargs)
+        plot(self._plot_slice(n, start_sample), **kwargs)
 
     def specgram(self, nfft: int = 1024):
         """
-        Creates a spectrogram plot
+        Creates a spectrogram plot. Long captures are averaged down to a couple of thousand frames, see
+        dsproc.sig.spectral.spectrogram
 
         :param nfft: The size of the fft filter. Make this larger for more detail in the plot
         """
@@ -512,12 +774,13 @@ class Signal:
         if nfft >= len(self.samples):
             nfft = int(len(self.samples)/4)
 
+        freqs, times, power = spectrogram(self.samples, self.fs, nfft=nfft)
         kwargs = {"type": "specgram",
-                "nfft": nfft,
-                "fs": self.fs,
-                "title": f"Specgram at Baseband (NFFT={nfft})"}
+                  "freqs": freqs,
+                  "times": times,
+                  "title": f"Specgram at Baseband (NFFT={nfft})"}
 
-        plot(self.samples, **kwargs)
+        plot(power, **kwargs)
 
     def psd(self, nfft: int = 1024):
         """
@@ -525,59 +788,65 @@ class Signal:
 
         :param nfft: How many bins the fft uses. A bigger nfft results in more detail
         """
+        psd = self.spectrum(nfft)
         kwargs = {"type": "psd",
-                  "nfft": nfft,
-                  "fs": self.fs,
+                  "freqs": psd.freqs,
                   "title": f"PSD at Baseband (NFFT={nfft})"}
-        plot(self.samples, **kwargs)
+        plot(psd.density, **kwargs)
 
-    def iq(self, n: int = 500000, start_sample: int = 0):
+    def iq(self, n: int = None, start_sample: int = 0):
         """
-        Generates and displays a IQ plot
+        Generates and displays a IQ plot. Large numbers of samples are drawn as a density image rather than a scatter
 
-        :param n: How many samples to plot
+        :param n: How many samples to plot, defaults to the rest of the signal
         :param start_sample: The sample to start plotting from
         """
         kwargs = {"type": "iq",
                   "title": "IQ Scatter"}
 
-        plot(self.samples[start_sample:start_sample+n], **kwargs)
+        plot(self._plot_slice(n, start_sample), **kwargs)
 
-    def fft(self, nfft: int = 1024) -> None:
+    def fft(self, nfft: int = 2**16) -> None:
         """
-        Generates and displays a frequency domain plot
+        Generates and displays a frequency domain plot. Captures longer than nfft are split into frames and their
+        spectra averaged
 
         :param nfft: How many bins the fft uses. A bigger nfft results in more detail
         """
+        psd = self.spectrum(nfft, window='boxcar')
         kwargs = {"type": "fft",
                   "title": "FFT of Signal",
-                  "fs": self.fs,
-                  "nfft": nfft}
-        plot(self.samples, **kwargs)
+                  "freqs": psd.freqs}
+        plot(psd.amplitude(), **kwargs)
 
-    def time(self, n: int = 400000, start_sample: int = 0) -> None:
+    def time(self, n: int = None, start_sample: int = 0, points: int = ENVELOPE_POINTS) -> None:
         """
-        Generates and displays a time series plot
+        Generates and displays a time series plot. Long stretches of samples are drawn as a min/max envelope, so even
+        a whole capture plots quickly.
 
-        :param n: How many samples to plot
+        :param n: How many samples to plot, defaults to the rest of the signal
         :param start_sample: The sample to start plotting from
+        :param points: The most points to draw, about one per pixel is plenty
         """
-        t = self.t
-        t = t[start_sample:start_sample+n]
-
         kwargs = {"type": "time",
-                  "t": t,
+                  "fs": self.fs,
+                  "start": start_sample,
                   "title": "Time View",
-                  "n": n}
+                  "points": points}
 
-        plot(self.samples[start_sample:start_sample+n], **kwargs)
+        plot(self._plot_slice(n, start_sample), **kwargs)
 
-    def save_wave(self, fn: str = None, path: Path = None, wav: bool = False) -> None:
+    def save_wave(self, fn: str = None, path: Path = None, wav: bool = False, fmt: str = 'cf32',
+                  dither: bool = False) -> None:
         """
-        Saves the samples to a file. Either saves as complex64 or as a wav file if wav=True
+        Saves the samples to a file. Either saves as complex64, with fs, f and sps in a JSON sidecar (the file name
+        with .json on the end) that Demod.from_capture reads them back from, or as a wav file if wav=True
         :param fn: str, filename
         :param path: path object of the directory to save to. defaults to the current working directory
-        :param wav: bool, if true outputs the samples as a .wav file which can be listened to.
+        :param wav: bool, if true outputs the samples as a .wav file which can be listened to, see dsproc.sig.audio
+        :param fmt: How to store the samples: 'cf32' (complex64), or quantised to 'cs16', 'cs8' or 'cu8' to save space.
+            Quantised samples are scaled so the largest one is full scale, and the scale is kept in the sidecar
+        :param dither: If True, dither quantised samples, which helps keep weak signals clean at 8 bits
         """
         # If there is no path provided then save it in the directory the function is called from
         path_object = None
@@ -598,22 +867,20 @@ class Signal:
 
         # If we're saving it as a wav
         if wav:
-            if self.f == 0:
-                self.freq_offset(800)
-
-            audio = self.samples.real
-            # Target sample rate
-            sample_rate = 44100
-            audio = signal.resample_poly(audio, up=sample_rate, down=self.fs)
-
-            write(fn+".wave", sample_rate, audio.astype(np.float32))
-
-            self.baseband()
+            # A signal at baseband is shifted up so it can be heard. The shift is done as the audio is written, a block
+            # at a time, so the samples are left as they are
+            write_wav(str(save_path) + ".wave", self.samples, self.fs, offset=800 if self.f == 0 else 0,
+                      start=self.sample_offset)
 
         else:
-            if self.samples.dtype != np.complex64:
-                raise Warning(f"Data type is {self.samples.dtype} instead of complex64")
-            self.samples.tofile(save_path)
+            # Raw complex64, with the parameters in a JSON sidecar next to it (see dsproc.sig.capture)
+            full_scale = 1.0
+            if fmt != 'cf32' and self.samples.size:
+                full_scale = float(max(np.max(np.abs(self.samples.real)), np.max(np.abs(self.samples.imag)))) or 1.0
+
+            with CaptureWriter(save_path, fs=self.fs, f=self.f, sps=self.sps, fmt=fmt, full_scale=full_scale,
+                               dither=dither) as writer:
+                writer.write(self.samples)
 
     def save_message(self, fn: str) -> None:
         """
@@ -0,0 +1,119 @@
+"""
+Streaming export of a signal as audio, so it can be listened to. The samples are mixed into the audible range,
+resampled to an audio sample rate and written to a 32 bit float WAV file a block at a time, so a long recording never
+has to be held in memory more than one block at once.
+"""
+import struct
+from fractions import Fraction
+import numpy as np
+from .nco import NCO
+from .resample import Resampler
+from .source import iter_chunks
+from ..util.precision import as_complex
+
+# Samples read at a time
+CHUNK_SIZE = 2**20
+
+# The format tag for IEEE float samples, WAVE_FORMAT_PCM is 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+
+# The largest file a 32 bit RIFF size can describe
+MAX_DATA_BYTES = 2**32 - 1 - 50
+
+
+class WavWriter:
+    """
+    Writes a signal to a mono 32 bit float WAV file a block at a time. Each block is shifted up by offset Hz, so that a
+    signal at baseband can be heard, and the real part is resampled from fs to rate. The oscillator and the resampler
+    carry on from block to block, so the file doesn't depend on how the signal was split up.
+
+    The header is written with zero sizes first and filled in when the writer is closed, so use it as a context
+    manager:
+
+    >>> import os, tempfile
+    >>> fn = os.path.join(tempfile.mkdtemp(), "tone.wav")
+    >>> with WavWriter(fn, fs=8000, offset=800) as w:
+    ...     for block in np.array_split(np.ones(8000, dtype=np.complex64), 3):
+    ...         w.write(block)
+    >>> w.frames
+    44100
+    """
+    def __init__(self, fn, fs: float, rate: int = 44100, offset: float = 0, start: int = 0):
+        """
+        :param fn: The name of the file to write
+        :param fs: The sample rate of the signal
+        :param rate: The sample rate of the audio
+        :param offset: The frequency to shift the signal by before taking the real part
+        :param start: The sample number of the first sample, so the oscillator lines up with the rest of a capture
+        """
+        self.fn = fn
+        self.fs = fs
+        self.rate = int(rate)
+        # fs can be a float, limit_denominator keeps the ratio from blowing up over rounding errors
+        ratio = Fraction(self.rate) / Fraction(fs).limit_denominator(1000)
+        self.resampler = Resampler(up=ratio.numerator, down=ratio.denominator)
+        self.nco = NCO(f=offset, fs=fs, start=start) if offset else None
+        self.frames = 0
+
+        self._file = open(fn, "wb")
+        self._write_header()
+
+    def _write_header(self) -> None:
+        data_bytes = self.frames * 4
+        # A fmt chunk with cbSize = 0, and a fact chunk, which the spec asks for when the samples aren't PCM
+        header = b"RIFF" + struct.pack("<I", 50 + data_bytes) + b"WAVE"
+        header += b"fmt " + struct.pack("<IHHIIHHH", 18, WAVE_FORMAT_IEEE_FLOAT, 1, self.rate, self.rate * 4, 4, 32, 0)
+        header += b"fact" + struct.pack("<II", 4, self.frames)
+        header += b"data" + struct.pack("<I", data_bytes)
+        self._file.seek(0)
+        self._file.write(header)
+
+    def _write_audio(self, audio: np.ndarray) -> None:
+        if (self.frames + len(audio)) * 4 > MAX_DATA_BYTES:
+            raise ValueError("The audio is too long for a WAV file, which is limited to 4 GiB")
+        np.real(audio).astype(np.float32).tofile(self._file)
+        self.frames += len(audio)
+
+    def write(self, block: np.ndarray) -> None:
+        """
+        Mixes, resamples and writes the next block of samples. The block isn't modified
+        """
+        if self.nco is not None:
+            block = self.nco.mix(as_complex(block), out=np.empty(len(block), dtype=self.nco.dtype))
+        self._write_audio(self.resampler.process(np.real(block)))
+
+    def close(self) -> None:
+        """
+        Writes the last of the resampled audio and fills in the header
+        """
+        if not self._file.closed:
+            self._write_audio(self.resampler.flush())
+            self._write_header()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_wav(fn, samples: np.ndarray, fs: float, rate: int = 44100, offset: float = 0, start: int = 0,
+              chunk_size: int = CHUNK_SIZE) -> int:
+    """
+    Writes samples (which can be a memmap) to a WAV file a chunk at a time, see WavWriter
+
+    :param fn: The name of the file to write
+    :param samples: The samples
+    :param fs: The sample rate of the samples
+    :param rate: The sample rate of the audio
+    :param offset: The frequency to shift the signal by before taking the real part
+    :param start: The sample number of the first sample
+    :param chunk_size: How many samples to work on at a time
+    :return: The number of audio samples written
+    """
+    with WavWriter(fn, fs, rate, offset, start) as writer:
+        for _, block in iter_chunks(samples, chunk_size=chunk_size):
+            writer.write(block)
+
+    return writer.frames
@@ -0,0 +1,240 @@
+"""
+Burst detection: finding the transmissions in a recording that is mostly idle spectrum.
+
+BurstDetector looks at the power of the samples, averaged over a few samples, against an estimate of the noise floor
+that it keeps up to date as it goes. A burst starts when the power rises above the 'on' threshold and carries on until
+it falls below the (lower) 'off' threshold, so a burst whose power wobbles around one threshold isn't chopped up into
+lots of little ones. Bursts shorter than a minimum duration are dropped.
+
+It works a chunk at a time and only keeps a block's worth of samples between chunks, so hours of a capture can be
+scanned in constant memory as fast as they can be read. Bursts that are still going at the end of a chunk carry on into
+the next one, and a capture that starts or ends in the middle of a burst is no problem.
+"""
+from collections import namedtuple
+import numpy as np
+from .source import iter_chunks
+from ..util.precision import as_complex, real_dtype
+
+# Samples read at a time
+CHUNK_SIZE = 2**20
+
+# Samples per update of the noise floor
+FLOOR_BLOCK = 2**14
+
+Burst = namedtuple("Burst", ["start", "stop", "peak_power"])
+Burst.__doc__ = """
+A burst: the sample it starts on, the sample after it ends (so stop - start is its length) and its highest (averaged)
+power
+"""
+
+
+class BurstDetector:
+    """
+    Finds bursts of power, see the module docstring. Feed it the samples a chunk at a time with update, which returns
+    the bursts that ended in that chunk, and call flush at the end of the samples for the last one.
+
+    The noise floor is estimated from each block of floor_block samples as a low percentile of their power, which a
+    burst only affects if it fills most of the block. It falls straight away when the noise drops but only rises a
+    little each block, so it follows the noise getting louder without a long burst dragging it up quickly. Thresholds
+    are relative to the floor, in dB, unless a fixed noise_floor is given.
+
+    >>> rng = np.random.default_rng(0)
+    >>> x = (rng.standard_normal(100000) + 1j * rng.standard_normal(100000)) * 0.01
+    >>> x[20000:25000] += 1
+    >>> detector = BurstDetector()
+    >>> [b[:2] for chunk in np.array_split(x, 7) for b in detector.update(chunk)] + [b[:2] for b in detector.flush()]
+    [(19985, 25000)]
+    """
+    def __init__(self, on: float = 10.0, off: float = None, min_duration: int = 1, n: int = 16,
+                 noise_floor: float = None, floor_block: int = FLOOR_BLOCK, percentile: float = 10.0,
+                 rise: float = 0.5):
+        """
+        :param on: How far above the noise floor, in dB, the power has to rise to start a burst
+        :param off: How far above the noise floor, in dB, the power has to stay for a burst to carry on. Defaults to
+            3 dB below on
+        :param min_duration: The fewest samples a burst can last, shorter ones are dropped
+        :param n: The length of the moving average over the power. Each sample's power is averaged with the n - 1 after
+            it, so a burst is found up to n - 1 samples before the power rises
+        :param noise_floor: A fixed noise power to use rather than estimating it
+        :param floor_block: How many samples each update of the noise floor estimate uses
+        :param percentile: The percentile of the power of each block that's taken as the noise floor
+        :param rise: The most the noise floor can rise each block, in dB. A burst that lasts long enough for the floor
+            to rise to within off dB of it ends there
+        """
+        off = on - 3 if off is None else off
+        if off > on:
+            raise ValueError("The off threshold can't be above the on threshold")
+        if n < 1 or min_duration < 1 or floor_block < 1:
+            raise ValueError("n, min_duration and floor_block must be positive")
+
+        self.on = on
+        self.off = off
+        self.min_duration = min_duration
+        self.n = n
+        self.noise_floor = noise_floor
+        self.fixed_floor = noise_floor is not None
+        self.floor_block = floor_block
+        self.percentile = percentile
+        self.rise = rise
+        # Samples seen so far
+        self.position = 0
+
+        dtype = real_dtype()
+        # Powers still waiting for the rest of their moving average, and averaged powers waiting for their block to be
+        # complete so the noise floor can be updated
+        self._tail = np.zeros(0, dtype=dtype)
+        self._pending = np.zeros(0, dtype=dtype)
+        # Where the first pending power is
+        self._decided = 0
+        # The start and peak of the burst in progress, if there is one
+        self._start = None
+        self._peak = 0.0
+
+    @property
+    def in_burst(self) -> bool:
+        """
+        Whether the last sample decided on was part of a burst
+        """
+        return self._start is not None
+
+    def _levels(self) -> tuple:
+        floor = max(self.noise_floor, np.finfo(real_dtype()).tiny)
+        return floor * 10 ** (self.on / 10), floor * 10 ** (self.off / 10)
+
+    def _estimate(self, power: np.ndarray) -> float:
+        # The powers are averaged over n samples, so every n // 2th one is plenty for the estimate
+        return float(np.percentile(power[::max(self.n // 2, 1)], self.percentile))
+
+    def _decide(self, power: np.ndarray) -> list:
+        """
+        Works out which of the next averaged powers are in a burst, and returns the bursts that end among them
+        """
+        offset = self._decided
+        self._decided += len(power)
+        if not len(power):
+            return []
+
+        if self.noise_floor is None:
+            self.noise_floor = self._estimate(power)
+        on, off = self._levels()
+
+        # Above on starts (or continues) a burst and below off ends one, in between the state doesn't change. So each
+        # sample is in the state set by the last sample that was above on or below off
+        above_on = power >= on
+        below_off = power < off
+        if not (below_off if self.in_burst else above_on).any():
+            # Nothing changes, which is most blocks of an idle capture
+            state = np.full(len(power), self.in_burst)
+        else:
+            deciding = above_on | below_off
+            if deciding.all():
+                # Nothing is between the thresholds, e.g. when they're the same
+                state = above_on
+            else:
+                last = np.maximum.accumulate(np.where(deciding, np.arange(len(power)), -1))
+                state = np.where(last >= 0, above_on[np.maximum(last, 0)], self.in_burst)
+        changes = np.flatnonzero(state[1:] != state[:-1]) + 1
+        if len(state) and state[0] != self.in_burst:
+            changes = np.concatenate([[0], changes])
+
+        # Alternating starts and stops of the bursts in this block, starting with the burst carried on from the last
+        # block if there is one
+        bounds = np.concatenate([[0], changes]) if self.in_burst else changes
+        peaks = np.maximum.reduceat(power, bounds)[::2] if len(bounds) else []
+
+        bursts = []
+        carried = self.in_burst
+        for k, peak in enumerate(peaks):
+            if k or not carried:
+                self._start, self._peak = offset + int(bounds[2 * k]), 0.0
+            self._peak = max(self._peak, float(peak))
+            if 2 * k + 1 < len(bounds):
+                bursts += self._end(offset + int(bounds[2 * k + 1]))
+
+        if not self.fixed_floor:
+            # Straight down, but only up by rise dB at a time
+            self.noise_floor = min(self._estimate(power), self.noise_floor * 10 ** (self.rise / 10))
+
+        return bursts
+
+    def _end(self, stop: int) -> list:
+        start, self._start = self._start, None
+        if stop - start >= self.min_duration:
+            return [Burst(int(start), int(stop), self._peak)]
+        return []
+
+    def _decide_pending(self, final: bool = False) -> list:
+        bursts = []
+        block = len(self._pending) if self.fixed_floor or final else self.floor_block
+        done = 0
+        while len(self._pending) - done >= block and block:
+            bursts += self._decide(self._pending[done:done + block])
+            done += block
+        self._pending = self._pending[done:]
+
+        return bursts
+
+    def update(self, block: np.ndarray) -> list:
+        """
+        Looks at the next chunk of samples
+
+        :param block: The samples
+        :return: The bursts that ended in this chunk, or earlier but were waiting on the noise floor estimate. Bursts
+            are only returned once they've ended, and always in order
+        """
+        block = as_complex(block)
+        self.position += len(block)
+        # abs is faster than squaring the real and imaginary parts, numpy works it out with SIMD
+        power = np.abs(block).astype(real_dtype(), copy=False)
+        np.square(power, out=power)
+
+        if self.n == 1:
+            averaged = power
+        else:
+            # A running sum in double precision, so the averages are the same (to within rounding) however the samples
+            # are split into chunks
+            power = np.concatenate([self._tail, power])
+            sums = np.concatenate([[0], np.cumsum(power, dtype=np.float64)])
+            averaged = ((sums[self.n:] - sums[:-self.n]) / self.n).astype(power.dtype)
+            self._tail = power[len(averaged):]
+        self._pending = np.concatenate([self._pending, averaged]) if len(self._pending) else averaged
+
+        return self._decide_pending()
+
+    def flush(self) -> list:
+        """
+        Finishes off at the end of the samples: the last samples are averaged over what's left, and a burst still going
+        ends at the last sample. The detector can carry on afterwards, as if the samples had started again
+
+        :return: The bursts that hadn't been returned yet
+        """
+        tail = self._tail
+        averaged = (np.cumsum(tail[::-1])[::-1] / np.arange(len(tail), 0, -1)).astype(tail.dtype)
+        self._tail = tail[:0]
+        self._pending = np.concatenate([self._pending, averaged])
+
+        bursts = self._decide_pending(final=True)
+        if self.in_burst:
+            bursts += self._end(self.position)
+
+        return bursts
+
+
+def iter_bursts(x: np.ndarray, on: float = 10.0, off: float = None, min_duration: int = 1, n: int = 16,
+                noise_floor: float = None, chunk_size: int = CHUNK_SIZE, **kwargs):
+    """
+    Yields the bursts in x, see BurstDetector
+
+    :param x: The samples, can be a memmap
+    :param on: How far above the noise floor, in dB, the power has to rise to start a burst
+    :param off: How far above the noise floor, in dB, the power has to stay for a burst to carry on
+    :param min_duration: The fewest samples a burst can last
+    :param n: The length of the moving average over the power
+    :param noise_floor: A fixed noise power to use rather than estimating it
+    :param chunk_size: How many samples to work on at a time
+    :param kwargs: Passed on to BurstDetector
+    """
+    detector = BurstDetector(on, off, min_duration, n, noise_floor, **kwargs)
+    for _, block in iter_chunks(x, chunk_size=chunk_size):
+        yield from detector.update(block)
+    yield from detector.flush()
@@ -0,0 +1,228 @@
+"""
+A simple capture format: the samples as raw interleaved I/Q (complex64 by default, the same as save_wave has always
+written and what most SDR software reads) plus a small JSON sidecar next to them holding the parameters that used to be
+squeezed into the file name.
+
+    capture.cf32        raw interleaved float32 I/Q
+    capture.cf32.json   {"fs": ..., "f": ..., "sps": ..., "created": ..., "annotations": [...], ...}
+
+The samples can also be stored quantised as cs16, cs8 or cu8 (see dsproc.sig.source.FORMATS), which takes a half or a
+quarter of the space. The sidecar records the format and the amplitude of full scale, so they read back at the right
+level.
+
+Captures can be written a block at a time, and appended to later. Reading memory maps the data, so opening a capture
+and slicing any [start, stop) range out of it only reads the bytes in that range.
+"""
+import json
+import os
+from datetime import datetime, timezone
+import numpy as np
+from .source import SampleSource, FORMATS, bytes_per_sample, to_iq
+
+VERSION = 1
+
+
+def sidecar_path(fn) -> str:
+    """
+    The name of the JSON sidecar for a capture's data file
+    """
+    return f"{fn}.json"
+
+
+def has_sidecar(fn) -> bool:
+    return fn is not None and os.path.exists(sidecar_path(fn))
+
+
+def _plain(value):
+    """
+    Converts numpy scalars and arrays (e.g. the per channel fs of a batch) to types json can write
+    """
+    return value.tolist() if isinstance(value, (np.ndarray, np.generic)) else value
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _write_sidecar(fn, meta: dict) -> None:
+    # Write to a temporary file and swap it in, so a crash never leaves half a sidecar
+    tmp = sidecar_path(fn) + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp, sidecar_path(fn))
+
+
+def read_metadata(fn) -> dict:
+    """
+    Reads a capture's sidecar
+
+    :param fn: The name of the data file
+    """
+    with open(sidecar_path(fn)) as f:
+        meta = json.load(f)
+
+    # Sidecars from before quantised formats were supported are all complex64
+    meta.setdefault("format", "cf32")
+    if meta["format"] not in FORMATS:
+        raise ValueError(f"Unknown capture format '{meta['format']}', must be one of {list(FORMATS)}")
+
+    return meta
+
+
+class CaptureWriter:
+    """
+    Writes a capture a block at a time. The sidecar is written when the writer is closed (or flushed), so use it as a
+    context manager:
+
+    >>> import tempfile
+    >>> fn = os.path.join(tempfile.mkdtemp(), "burst.cf32")
+    >>> with CaptureWriter(fn, fs=10000, f=2000) as w:
+    ...     w.write(np.ones(100))
+    ...     w.annotate(20, 60, "burst")
+    ...     w.write(np.zeros(50))
+    >>> c = Capture(fn)
+    >>> len(c), c.fs, c.annotations[0]["label"]
+    (150, 10000, 'burst')
+    """
+    def __init__(self, fn, fs: float, f: float = None, sps: int = None, append: bool = False,
+                 start_time: str = None, fmt: str = 'cf32', full_scale: float = 1.0, dither: bool = False,
+                 **metadata):
+        """
+        :param fn: The name of the data file. The sidecar is written next to it, with .json on the end
+        :param fs: The sample rate
+        :param f: The centre frequency of the signal, 0 if not given. When appending, defaults to the capture's
+        :param sps: The samples per symbol, if known. When appending, defaults to the capture's
+        :param append: If True, add to the end of an existing capture instead of starting a new one. fs must match
+        :param start_time: When the first sample was captured, as an ISO 8601 string. Defaults to now
+        :param fmt: How to store the samples: 'cf32' (complex64), 'cs16', 'cs8' or 'cu8'. When appending, this and
+            full_scale are taken from the capture
+        :param full_scale: For the quantised formats, the amplitude that maps to the largest value. Larger samples are
+            clipped
+        :param dither: If True, dither the samples before quantising them, see dsproc.sig.source.to_iq
+        :param metadata: Anything else to keep in the sidecar, it must be JSON serialisable
+        """
+        self.fn = fn
+        fs, f, sps = _plain(fs), _plain(f), _plain(sps)
+        if append and os.path.exists(fn):
+            self.meta = read_metadata(fn) if has_sidecar(fn) else {}
+            if self.meta.get("fs", fs) != fs:
+                raise ValueError(f"Can't append at fs={fs} to a capture at fs={self.meta['fs']}")
+            self.meta.setdefault("format", "cf32")
+            self.count = os.path.getsize(fn) // bytes_per_sample(self.meta["format"])
+            self._file = open(fn, "ab")
+        else:
+            if fmt not in FORMATS:
+                raise ValueError(f"Unknown capture format '{fmt}', must be one of {list(FORMATS)}")
+            self.meta = {"created": _now(), "start_time": start_time or _now(), "f": 0, "sps": None,
+                         "format": fmt, "full_scale": 1.0 if fmt == 'cf32' else _plain(full_scale),
+                         "annotations": []}
+            self.count = 0
+            self._file = open(fn, "wb")
+
+        params = {"fs": fs, "f": f, "sps": sps}
+        self.dither = dither
+        self.meta.update({"version": VERSION, "dtype": FORMATS[self.meta["format"]][0].name, **metadata})
+        self.meta.update({k: v for k, v in params.items() if v is not None})
+        self.meta.setdefault("annotations", [])
+
+    def write(self, block: np.ndarray) -> None:
+        """
+        Appends a block of samples, converting them to the capture's format
+        """
+        to_iq(block, self.meta["format"], self.meta.get("full_scale", 1.0), self.dither).tofile(self._file)
+        self.count += len(block)
+
+    def annotate(self, start: int, stop: int, label: str, **fields) -> None:
+        """
+        Marks the samples in [start, stop) with a label, e.g. where a burst or a header is
+
+        :param start: The first sample, counted from the start of the capture
+        :param stop: The sample after the last one
+        :param label: What's there
+        :param fields: Anything else to keep with the annotation
+        """
+        self.meta["annotations"].append({"start": int(start), "stop": int(stop), "label": label, **fields})
+
+    def flush(self) -> None:
+        """
+        Flushes the samples to disk and brings the sidecar up to date
+        """
+        self._file.flush()
+        self.meta["samples"] = self.count
+        self.meta["modified"] = _now()
+        _write_sidecar(self.fn, self.meta)
+
+    def close(self) -> None:
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Capture:
+    """
+    A capture opened for reading. The data is memory mapped, so slicing it (c[start:stop]) only reads the samples in
+    the slice from disk. For complex64 captures the slice is a view of the file, quantised captures are converted to
+    complex as they're sliced.
+    """
+    def __init__(self, fn):
+        """
+        :param fn: The name of the data file
+        """
+        self.fn = fn
+        self.meta = read_metadata(fn) if has_sidecar(fn) else {"format": "cf32"}
+        self.source = SampleSource(fn, fmt=self.meta["format"], full_scale=self.meta.get("full_scale", 1.0))
+
+    @property
+    def samples(self) -> np.ndarray:
+        """
+        The whole capture, memory mapped. Quantised captures are an IQView, which converts samples as they're read
+        """
+        return self.source.samples
+
+    @property
+    def fs(self):
+        return self.meta.get("fs")
+
+    @property
+    def f(self):
+        return self.meta.get("f", 0)
+
+    @property
+    def sps(self):
+        return self.meta.get("sps")
+
+    @property
+    def start_time(self) -> datetime | None:
+        """
+        When the first sample was captured
+        """
+        start_time = self.meta.get("start_time")
+        return datetime.fromisoformat(start_time) if start_time else None
+
+    @property
+    def annotations(self) -> list:
+        return self.meta.get("annotations", [])
+
+    def __len__(self) -> int:
+        return len(self.source)
+
+    def __getitem__(self, item):
+        return self.source.samples[item]
+
+    def read(self, start: int = 0, stop: int = None) -> np.ndarray:
+        """
+        Reads the samples in [start, stop) into memory
+        """
+        return self.source.read(start, stop)
+
+    def annotated(self, label: str) -> list:
+        """
+        The samples of every annotation with the given label, as memory mapped views
+        """
+        return [self[a["start"]:a["stop"]] for a in self.annotations if a["label"] == label]
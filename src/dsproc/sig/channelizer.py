@@ -0,0 +1,121 @@
+"""
+Polyphase filter bank channelizer, for splitting a wideband capture into many narrowband channels in one pass
+"""
+from functools import lru_cache
+import numpy as np
+from ..util.precision import complex_dtype
+from ..util.lazy import lazy_import
+
+sp_fft = lazy_import("scipy.fft")
+signal = lazy_import("scipy.signal")
+
+
+@lru_cache(maxsize=16)
+def prototype_filter(K: int, taps_per_channel: int) -> np.ndarray:
+    """
+    Designs the lowpass filter shared by every channel. It passes half a channel spacing either side of the centre
+    frequency, so neighbouring channels meet at their -6dB points.
+
+    :param K: The number of channels
+    :param taps_per_channel: Taps in each polyphase branch. More taps gives sharper channel edges
+    :return: The K * taps_per_channel filter taps, as a read only array
+    """
+    h = signal.firwin(K * taps_per_channel, 1 / K, window=('kaiser', 8.0))
+    h.setflags(write=False)
+    return h
+
+
+class Channelizer:
+    """
+    Splits a signal into K equally spaced channels, each decimated by K. Channel k is centred on k * fs / K (channels
+    above fs / 2 wrap around to negative frequencies, as with an FFT) and comes out at a sample rate of fs / K.
+
+    The output is the same as mixing the signal down by each channel's centre frequency, lowpass filtering with the
+    prototype filter and keeping every Kth sample, but it costs one pass over the signal and one K point FFT per K
+    input samples, rather than K passes. The filter state is kept between calls to process, so a capture can be fed
+    through a block at a time.
+
+    >>> fs = 8000
+    >>> x = np.exp(2j * np.pi * 2000 * np.arange(8000) / fs).astype(np.complex64)   # A tone in the middle of channel 2
+    >>> chan = Channelizer(K=8, fs=fs)
+    >>> chan.centres
+    array([    0.,  1000.,  2000.,  3000., -4000., -3000., -2000., -1000.])
+    >>> out = chan.process(x)
+    >>> out.shape
+    (8, 1000)
+    >>> int(np.argmax(np.mean(np.abs(out[:, 100:]), axis=1)))
+    2
+    """
+    def __init__(self, K: int, fs: float, taps_per_channel: int = 16):
+        """
+        :param K: The number of channels, which is also the decimation factor
+        :param fs: The sampling frequency of the input
+        :param taps_per_channel: Taps in each polyphase branch of the prototype filter
+        """
+        if K < 2 or K != int(K):
+            raise ValueError("K must be an integer >= 2")
+
+        self.K = int(K)
+        self.fs = fs
+        self.taps = prototype_filter(self.K, taps_per_channel)
+        self.P = taps_per_channel
+
+        # Branch q of the filter is taps[q::K]. Row p holds tap p of every branch
+        self._branches = self.taps.reshape(self.P, self.K).astype(complex_dtype())
+
+        self.history = None
+        self.remainder = None
+        self.reset()
+
+    @property
+    def centres(self) -> np.ndarray:
+        """
+        The centre frequency of each channel
+        """
+        return sp_fft.fftfreq(self.K, 1 / self.fs)
+
+    @property
+    def fs_out(self) -> float:
+        """
+        The sample rate of the channels
+        """
+        return self.fs / self.K
+
+    def reset(self) -> None:
+        """
+        Clears the filter state, ready for a new signal
+        """
+        # Each input sample is filtered as though the K - 1 samples before the signal were zeros, which makes output
+        # m line up with input sample m * K
+        self.remainder = np.zeros(self.K - 1, dtype=complex_dtype())
+        # The previous P - 1 rows of samples, which the filter still needs
+        self.history = np.zeros((self.P - 1, self.K), dtype=complex_dtype())
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        """
+        Channelizes the next block of samples
+
+        :param block: 1d array of complex samples
+        :return: Array of shape (K, n), one row per channel. n is the number of whole groups of K samples received so
+            far, less the ones already returned
+        """
+        buffer = np.concatenate([self.remainder, np.asarray(block, dtype=complex_dtype())])
+        n_rows = len(buffer) // self.K
+        self.remainder = buffer[n_rows * self.K:]
+
+        # Row m holds the K samples going into output m, newest first, so column q is the input to branch q
+        rows = buffer[:n_rows * self.K].reshape(n_rows, self.K)[:, ::-1]
+        rows = np.concatenate([self.history, rows])
+        self.history = rows[len(rows) - (self.P - 1):]
+
+        # Filter every branch at once, one tap at a time
+        branches = np.zeros((n_rows, self.K), dtype=complex_dtype())
+        for p in range(self.P):
+            start = self.P - 1 - p
+            branches += rows[start:start + n_rows] * self._branches[p]
+
+        # The inverse FFT across the branches mixes each channel down to baseband
+        out = sp_fft.ifft(branches, axis=1, overwrite_x=True)
+        out *= self.K
+
+        return out.T
@@ -1,6 +1,8 @@
 import numpy as np
-from matplotlib import pyplot as plt
-from scipy.spatial.distance import pdist
+from ..util.lazy import lazy_import
+
+plt = lazy_import("matplotlib.pyplot")
+distance = lazy_import("scipy.spatial.distance")
 
 
 class Constellation:
@@ -177,7 +179,7 @@ class Constellation:
         # The pdist functions requires a two dimensional array
         two_dim = np.array([self.map.real, self.map.imag]).reshape((-1, 2))
 
-        return np.mean(pdist(two_dim, metric="euclidean"))
+        return np.mean(distance.pdist(two_dim, metric="euclidean"))
 
     def average_power(self):
         """
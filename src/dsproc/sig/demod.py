@@ -1,17 +1,49 @@
+import os
 import numpy as np
-from matplotlib import pyplot as plt
-from scipy.cluster.vq import kmeans
-from scipy.signal import correlate, savgol_filter
 from ._sig import Signal
 from .constellation import Constellation
-
-
+from .source import SampleSource, iter_chunks, guess_format, read_iq
+from .channelizer import Channelizer
+from .spectral import Welch, welch
+from .burst import iter_bursts
+from .capture import Capture, has_sidecar, read_metadata
+from ..util import kernels
+from ..util.precision import as_complex
+from ..util.profiling import instrument
+from ..util.lazy import lazy_import
+
+plt = lazy_import("matplotlib.pyplot")
+sp_signal = lazy_import("scipy.signal")
+vq = lazy_import("scipy.cluster.vq")
+
+
+@instrument("samples")
 class Demod(Signal):
     """
     Class containing functions for demodulating and analysing a stored wave
     """
-    def __init__(self, fs, fn=None, f=0):
+    def __init__(self, fs, fn=None, f=0, mmap=False, offset=0, count=-1, fmt=None, full_scale=1.0):
+        """
+        :param fs: The sampling frequency of the capture
+        :param fn: The file name of the capture, optional
+        :param f: The centre frequency of the signal
+        :param mmap: If True the file is memory mapped instead of being read into memory. Use this for captures that
+            are larger than ram, and process them with the chunks method
+        :param offset: The sample to start reading the file from
+        :param count: How many samples to read from the file. -1 reads to the end
+        :param fmt: The I/Q format of the file: 'cf32' (complex64), 'cs16', 'cs8' or 'cu8'. Guessed from the file
+            extension if not given, defaulting to cf32. A capture with a JSON sidecar uses the format in the sidecar
+        :param full_scale: The amplitude the largest value of a quantised format stands for, for a capture without a
+            sidecar
+        """
         self.fn = fn
+        self.mmap = mmap
+        self.offset = offset
+        self.count = count
+        self.fmt = fmt
+        self.full_scale = full_scale
+        # The lazy sample source when memory mapping
+        self.source = None
         super().__init__(f=f, fs=fs, message=[], amplitude=1)
 
         if fn:
@@ -21,20 +53,176 @@ class Demod(Signal):
 
     def read_file(self, folder: str = ""):
         """
-        Reads in complex 64 samples as might be captured by a software defined radio.
+        Reads in samples as might be captured by a software defined radio, converting quantised I/Q (cs16, cs8, cu8)
+        to complex. If the object was created with mmap=True then the samples are memory mapped and only read from
+        disk (and converted) as they are used.
         :param folder: Subfolder or abs path. Includes slashes /
         :return:
         """
         file = folder + self.fn
-        samples = np.fromfile(file, np.complex64)
-        return samples
+        fmt, full_scale = self.fmt or guess_format(file), self.full_scale
+        if has_sidecar(file):
+            # The sidecar says how the samples were stored, whatever the file is called
+            meta = read_metadata(file)
+            fmt, full_scale = meta["format"], meta.get("full_scale", 1.0)
+
+        if self.mmap:
+            self.source = SampleSource(file, offset=self.offset, count=self.count, fmt=fmt, full_scale=full_scale)
+            return self.source.samples
+
+        return read_iq(file, fmt, offset=self.offset, count=self.count, full_scale=full_scale)
+
+    def chunks(self, chunk_size: int = 2**20, overlap: int = 0):
+        """
+        Iterates over the capture in blocks of chunk_size samples. Each block is yielded as a Demod object with the
+        same parameters as this one, so the usual methods (baseband, rrc, quadrature_demod etc.) can be run over a
+        capture one block at a time and peak memory depends on the chunk size rather than the size of the capture.
+
+        The blocks know where they sit in the capture (sample_offset) so frequency shifts are continuous across block
+        boundaries. Operations that consume samples need an overlap to line up, e.g. quadrature_demod needs an overlap
+        of 1, and rrc(N=N, normalise=False) needs an overlap of N-1.
+
+        :param chunk_size: How many samples per block
+        :param overlap: How many samples of the next block to append to each block
+        """
+        for start, block in iter_chunks(self.samples, chunk_size=chunk_size, overlap=overlap):
+            # Blocks of samples in memory are views of them, so they get their own copy or methods that work in place
+            # (e.g. baseband) would change the capture, and the overlap twice. Memory mapped blocks are read only, so
+            # they're only copied if they're modified
+            if isinstance(self.samples, np.ndarray) and block.flags.writeable:
+                block = block.copy()
+            chunk = Demod(fs=self.fs, f=self.f, fmt=self.fmt, full_scale=self.full_scale)
+            chunk.samples = block
+            chunk.sample_offset = self.sample_offset + start
+            chunk.sps = self.sps
+            yield chunk
+
+    def channelize(self, K: int, channels: list = None, taps_per_channel: int = 16, chunk_size: int = 2**20):
+        """
+        Splits the capture into K equally spaced channels, each decimated by K, in a single pass over the capture (see
+        Channelizer). Much faster than basebanding, filtering and decimating the capture once per channel, and works
+        a chunk at a time so memory mapped captures can be channelized too.
+
+        Channel k is centred on k * fs / K, wrapping round to negative frequencies above fs / 2. Each channel is
+        returned as a Demod with fs set to the channel sample rate and f set to the capture's f relative to the
+        channel centre.
+
+        :param K: The number of channels
+        :param channels: The indexes of the channels to keep, defaults to all of them
+        :param taps_per_channel: Taps in each polyphase branch of the channel filter
+        :param chunk_size: How many samples of the capture to process at a time
+        :return: A list of Demod objects, one per channel
+
+        >>> d = Demod(fs=8000, f=2100)
+        >>> d.samples = np.exp(2j * np.pi * 2100 * np.arange(8000) / 8000).astype(np.complex64)
+        >>> chans = d.channelize(K=8, channels=[2])
+        >>> chans[0].fs, chans[0].f, len(chans[0].samples)
+        (1000, 100, 1000)
+        """
+        chan = Channelizer(K, self.fs, taps_per_channel=taps_per_channel)
+        if channels is None:
+            channels = range(K)
+        channels = list(channels)
+
+        out = [chan.process(block)[channels] for _, block in iter_chunks(self.samples, chunk_size=chunk_size)]
+        out = np.concatenate(out, axis=1) if out else np.zeros((len(channels), 0), dtype=chan.remainder.dtype)
+
+        fs = self.fs // K if self.fs % K == 0 else self.fs / K
+        demods = []
+        for samples, centre in zip(out, chan.centres[channels]):
+            f = self.f - centre
+            d = Demod(fs=fs, f=int(f) if float(f).is_integer() else f)
+            d.samples = samples
+            d.sample_offset = self.sample_offset // K
+            demods.append(d)
+
+        return demods
+
+    @classmethod
+    def from_capture(cls, fn: str, start: int = 0, stop: int = None):
+        """
+        Opens a capture saved with a JSON sidecar (see dsproc.sig.capture), taking fs, f and sps from the sidecar.
+        The samples are a memory mapped view of [start, stop), so only the samples that are used are read from disk
+
+        :param fn: The name of the data file
+        :param start: The first sample to use
+        :param stop: The sample after the last one to use, defaults to the end of the capture
+        """
+        capture = Capture(fn)
+        d = cls(fs=capture.fs, f=capture.f)
+        d.fn = fn
+        d.source = capture.source
+        d.samples = capture[start:stop]
+        d.sample_offset = start
+        if capture.sps:
+            d.sps = capture.sps
+
+        return d
+
+    @classmethod
+    async def from_stream(cls, source, f: float = 0, sps: int = None):
+        """
+        Turns the blocks of a live stream (see dsproc.sig.stream) into Demod objects, for processing a block at a time
+        as they arrive. Like the blocks from chunks, each one knows where it sits in the stream (sample_offset), so
+        frequency shifts stay continuous from block to block
+
+            async for block in Demod.from_stream(SocketSource(fs=2e6, port=5000), f=-250e3):
+                block.baseband()
+
+        :param source: The StreamSource
+        :param f: The frequency of the signal in the stream
+        :param sps: The samples per symbol, if known
+        """
+        async for block in source:
+            d = cls(fs=source.fs, f=f)
+            d.samples = block.samples
+            d.sample_offset = block.start
+            if sps:
+                d.sps = sps
+            yield d
+
+    @classmethod
+    def from_ring(cls, reader, fs: float, f: float = 0, sps: int = None, n: int = None):
+        """
+        Turns what a ring buffer reader reads (see dsproc.sig.ring) into Demod objects until the ring is closed, so
+        several demodulators can share one live stream, each in its own thread. The samples are read-only views of the
+        ring, methods that work in place copy them first. Blocks know where they sit in the stream (sample_offset), so
+        frequency shifts stay continuous across blocks, and after an overrun they carry on from the right place
+
+        :param reader: The ring buffer Reader
+        :param fs: The sample rate of the stream
+        :param f: The frequency of the signal in the stream
+        :param sps: The samples per symbol, if known
+        :param n: The most samples in a block, defaults to the ring's max_read
+        """
+        while True:
+            start, view = reader.read(n)
+            if not len(view):
+                return
+            d = cls(fs=fs, f=f)
+            d.samples = view
+            d.sample_offset = start
+            if sps:
+                d.sps = sps
+            yield d
 
     def detect_params(self):
         """
-        detects the parameters of the sample if it follows the GQRX naming convention
+        Detects the parameters of the capture. Uses its JSON sidecar if it has one (see dsproc.sig.capture), otherwise
+        the file name has to follow the GQRX naming convention
         """
-        if "_" in self.fn:
-            params = self.fn.split("_")
+        if has_sidecar(self.fn):
+            meta = read_metadata(self.fn)
+            self.fs = meta["fs"]
+            self.f = meta.get("f", 0)
+            if meta.get("sps"):
+                self.sps = meta["sps"]
+            return
+
+        # Only the name itself follows the convention, not the folders it's in
+        name = os.path.basename(self.fn)
+        if "_" in name:
+            params = name.split("_")
         else:
             raise ValueError("Capture does not appear to be in gqrx format")
 
@@ -64,7 +252,7 @@ class Demod(Signal):
         points = points.T
 
         # create the clusters
-        clusters = kmeans(points, M, iter=iters)
+        clusters = vq.kmeans(points, M, iter=iters)
         # Put the cluster points into the shape that constellation objects expect array([1+1j, ...]
         cluster_points = np.array(clusters[0])
         cluster_points = np.array([i[0]+1j*i[1] for i in cluster_points])
@@ -127,12 +315,12 @@ class Demod(Signal):
 
     def quadrature_demod(self):
         """
-        Quadrature demodulation of an analog FSK signal
+        Quadrature demodulation of an analog FSK signal. Works along the rows of a batch
         :return:
         """
 
-        delayed = np.conj(self.samples[1:])
-        self.samples = delayed * self.samples[:-1]  # Drops the last sample, this may be bad
+        delayed = np.conj(self.samples[..., 1:])
+        self.samples = delayed * self.samples[..., :-1]  # Drops the last sample, this may be bad
         self.samples = np.angle(self.samples)
 
     def message_to_ascii(self, n_bits: int = 400, all_cuts: bool = True):
@@ -157,44 +345,43 @@ class Demod(Signal):
 
         return text_output
 
-    def exponentiate(self, order: int = 4):
+    def exponentiate(self, order: int = 4, nfft: int = 2**16):
         """
-        Raises a sig to the nth power to find the frequency offset and the likely samples per symbol
-        """
-        # copy the samples and raise to the order
-        samps = self.samples.copy()
-        samps = samps**order
-
-        # Take the fft to find the freq and sps spikes
-        ffts = np.fft.fftshift(np.abs(np.fft.fft(samps)))
-        axis = np.arange(self.fs / -2, self.fs / 2, self.fs / len(ffts))
-
-        # Get indices of the 1 largest element, which will be the freq spike
-        largest_inds = np.argpartition(ffts, -1)[-1]
-        largest_val = axis[largest_inds]
+        Raises a sig to the nth power to find the frequency offset and the likely samples per symbol. Works a chunk at
+        a time, so the whole capture is never raised to the power at once
 
-        # The frequency offset
-        freq = int(round(largest_val, 0)) # Make an int
+        :param order: The power to raise the samples to
+        :param nfft: The FFT size, which sets the frequency resolution to fs / nfft. Captures shorter than this are
+            analysed in one go
+        """
+        # Average the spectrum of the samples raised to the order, to find the freq and sps spikes
+        estimator = Welch(self.fs, nfft=max(min(nfft, len(self.samples)), 1))
+        for _, block in iter_chunks(self.samples):
+            estimator.update(np.power(as_complex(block), order))
+        psd = estimator.result()
 
-        if len(axis) > len(ffts):
-            axis = axis[0:len(ffts)]
+        # The largest spike is the frequency offset
+        freq = int(round(psd.peak(), 0)) # Make an int
 
-        plt.plot(axis, ffts)
+        plt.plot(psd.freqs, psd.amplitude())
 
         return freq
 
     def QAM(self, c: Constellation):
         """
         Converts the samples in memory to the closest symbols found in a given constellation plot and returns the
-        output
+        output. A batch gives one row of symbols per channel
         """
-        symbols = np.arange(len(c.map))
-        out = []
-        for sample in self.samples:
-            index = (np.abs(c.map - sample)).argmin()
-            out.append(symbols[index])
+        samples = np.asarray(self.samples)
+        flat = samples.reshape(-1)
+        out = np.empty(len(flat), dtype=np.int64)
 
-        return np.array(out)
+        # Find the nearest point for a block of samples at a time, which bounds the size of the distance matrix
+        block = max(2**20 // max(len(c.map), 1), 1)
+        for i in range(0, len(flat), block):
+            out[i:i + block] = np.abs(flat[i:i + block, None] - c.map).argmin(axis=-1)
+
+        return out.reshape(samples.shape)
 
     def demod_ASK(self, m: int, iterations: int = 1000):
         """
@@ -205,7 +392,7 @@ class Demod(Signal):
         amps = np.abs(self.samples)
         # No need to whiten if we only have 1 feature
         # Perform kmeans clustering
-        clusters = kmeans(amps, m, iter=iterations, check_finite=False)
+        clusters = vq.kmeans(amps, m, iter=iterations, check_finite=False)
         # Get the actual levels
         levels = clusters[0]
 
@@ -237,13 +424,8 @@ class Demod(Signal):
 
         # Replace the first sample of each symbol with the second sample of each symbol, this will eliminate most
         # peaks caused by instant phase shifts
-        for i in range(len(freq)):
-            # if it's the first symbol of the sample
-            if (i + 1) % sps == 0:
-                # If it's the last sample
-                if i == len(freq)-1:
-                    continue
-                freq[i] = freq[i + 1]
+        first = np.arange(sps - 1, len(freq) - 1, sps)
+        freq[first] = freq[first + 1]
 
         # Changes peaks into the average
         sd = np.std(freq)
@@ -251,39 +433,26 @@ class Demod(Signal):
 
         peak_mask = abs(freq) > 2 * sd + abs(av)
 
-        for i in range(len(peak_mask)):
-            # If it is a peak, we want to look ahead to the next non-peak and use that value
-            # (because peaks will probably occur at symbol boundaries)
-            if peak_mask[i]:
-                non_peak_index = np.where(peak_mask[i:i + sps] is False)[0]
-                if non_peak_index.size > 0:
-                    # Get the next non-peak value and overwrite the current peak with it
-                    freq[i] = freq[i + non_peak_index[0]]
-                else:
-                    # If there isn't an appropriate non_peak to use, just overwrite with the average
-                    freq[i] = av
+        # If it is a peak, we want to look ahead to the next non-peak and use that value (because peaks will probably
+        # occur at symbol boundaries). If there isn't one within a symbol, just overwrite with the average. This is a
+        # loop, so it runs on the kernel backend, see dsproc.util.kernels
+        kernels.replace_peaks(freq, peak_mask, sps, av)
 
         # now we can average over the sample and be somewhat confident that the peaks aren't effecting our output value
-        averaged = [np.mean(freq[i:i + sps]) for i in range(0, len(freq), sps)]
-        averaged = np.array(averaged)
+        starts = np.arange(0, len(freq), sps)
+        averaged = np.add.reduceat(freq, starts) / np.diff(np.append(starts, len(freq)))
 
         # Now we just cluster and then categorize
 
-        clusters = kmeans(averaged, m, iter=iterations, check_finite=False)
+        clusters = vq.kmeans(averaged, m, iter=iterations, check_finite=False)
         levels = np.sort(clusters[0])
 
-        symbols = np.arange(len(levels))
-        out = []
-
-        for sample in averaged:
-            index = (np.abs(levels - sample)).argmin()
-            out.append(symbols[index])
-
-        return np.array(out)
+        return np.abs(levels[None, :] - averaged[:, None]).argmin(axis=1)
 
     def transmit_window(self, min_amp: float, min_dur: int):
         """
-        For use on recordings with signal pulses. Returns tuples which show the start and stop of each pulse.
+        For use on recordings with signal pulses. Returns tuples which show the start and stop of each pulse. Pulses
+        that are already on at the start of the recording, or still on at the end, run from or to the end.
 
         min_amp: The minimum amplitude that consitutes a pulse. Masks out parts of the signal that are less than this.
         min_dur: The minimum duration in samples for a pulse. Anything shorter than this will be dropped.
@@ -291,36 +460,11 @@ class Demod(Signal):
         return a two-dimensional array where the first index is the start of a pulse (in samples) and the second is
         the end (not-inclusive).
         """
-        # Create an amplitude mask
-        amp_mask = np.abs(self.samples)
-
-        # If it's below it's noise, if it's above it's signal
-        amp_mask[amp_mask < min_amp] *= 0
-        amp_mask[amp_mask >= min_amp] = 1
-
-        # Figure out xmit durations
-        # Now we need to figure out the transmit durations, this is how long (in samples) each xmit lasts for
-        change_indices = np.where(amp_mask[:-1] != amp_mask[1:])[0] + 1
-
-        # So if the final index is on we need to add an off, but if it is off we don't need to add anything
-        # TODO
-        #  I feel like there is a bug here. My spidey senses are a-tinglin'
-        if amp_mask[-1] == 1:
-            change_indices = np.concatenate([change_indices, np.array([len(self.samples)])])
-
-        # If the first index is on, we need to add in a change at zero
-        if amp_mask[0] == 1:
-            change_indices = np.concatenate([np.array([0]), change_indices])
-
-        change_indices = change_indices.reshape((-1, 2))
-        durations = change_indices[:, 1] - change_indices[:, 0]
-        starts = change_indices[:, 0]
-
-        # Find the valid xmits
-        valid_xmits = np.where(durations >= min_dur)
-        xmit_tups = np.vstack([starts[valid_xmits], starts[valid_xmits] + durations[valid_xmits]]).T
+        # A sample is part of a pulse if its power is at least min_amp ** 2, so a fixed floor of that with both
+        # thresholds on it and no averaging. See BurstDetector to find pulses against the noise floor instead
+        bursts = iter_bursts(self.samples, on=0, off=0, min_duration=min_dur, n=1, noise_floor=min_amp ** 2)
 
-        return xmit_tups
+        return np.array([(b.start, b.stop) for b in bursts], dtype=np.int64).reshape(-1, 2)
 
     def find_header(self, header: np.ndarray, signal: np.ndarray):
         """
@@ -337,12 +481,13 @@ class Demod(Signal):
         norm_header = (header - np.mean(header)) / (np.std(header) * len(header))
         norm_signal = (signal - np.mean(signal)) / (np.std(signal))
 
-        c = correlate(norm_signal, norm_header, mode='full')
+        c = sp_signal.correlate(norm_signal, norm_header, mode='full')
         xmit_start = np.argmax(c) - len(header) + 1
 
         return xmit_start
 
-    def freq_search(self, start: int, end: int, bandwidth: int, tuning_steps: int = 30, fft_smoothness: int = 3):
+    def freq_search(self, start: int, end: int, bandwidth: int, tuning_steps: int = 30, fft_smoothness: int = 3,
+                    nfft: int = 2**16):
         """
         Searches a sample range (start:end) for the dominant frequency that fits within the given bandwidth. First
         computes an fft, then smooths that fft, then slides a window of size bandwidth over the fft to identify the
@@ -358,12 +503,15 @@ class Demod(Signal):
         effect
         fft_smoothness: How much to smooth the fft by. 1 is max smoothness, and the length of the sample range is min
         smoothness.
+        nfft: The most bins the fft has. Sample ranges longer than this are split into frames and their spectra are
+        averaged
         """
-        # Create the fft
+        # Create the amplitude spectrum. Long ranges are split into frames of nfft samples and averaged
         cut = self.samples[start:end]
-        cut_fft = np.fft.fftshift(np.abs(np.fft.fft(cut)))
-        smooth_fft = savgol_filter(cut_fft, window_length=int(len(cut_fft) / fft_smoothness), polyorder=3)
-        cut_f_axis = np.arange(self.fs / -2, self.fs / 2, self.fs / len(cut))
+        psd = welch(cut, self.fs, nfft=nfft)
+        cut_fft = psd.amplitude()
+        smooth_fft = sp_signal.savgol_filter(cut_fft, window_length=int(len(cut_fft) / fft_smoothness), polyorder=3)
+        cut_f_axis = psd.freqs
 
         # Convert bandwidth to fft indices
         bw_per_bin = self.fs / len(smooth_fft)
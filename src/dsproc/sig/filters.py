@@ -0,0 +1,230 @@
+"""
+Filter objects that are designed once and keep their state between calls, so a signal can be filtered a block at a time
+with exactly the same output as filtering it all at once.
+"""
+from functools import lru_cache
+import numpy as np
+from ..util.convolve import convolve
+from ..util.precision import complex_dtype, as_complex
+from ..util.lazy import lazy_import
+
+signal = lazy_import("scipy.signal")
+
+# Samples SOSFilter filters at a time
+SOS_PIECE = 2**14
+
+
+@lru_cache(maxsize=64)
+def _butter_sos(order: int, frequencies: int | tuple, filter_type: str, fs: float) -> np.ndarray:
+    sos = signal.butter(N=order, Wn=frequencies, btype=filter_type, analog=False, output='sos', fs=fs)
+    # The cached array is shared, so make sure nobody can change it
+    sos.setflags(write=False)
+    return sos
+
+
+def butter_sos(order: int, frequencies: int | list | tuple, filter_type: str, fs: float) -> np.ndarray:
+    """
+    Designs (or fetches from the cache) a digital butterworth filter in second order sections
+
+    :param order: The order of the filter
+    :param frequencies: int, or tuple/list of length 2. The frequencies to apply the filter at
+    :param filter_type: One of ['lowpass', 'highpass', 'bandpass', 'bandstop']
+    :param fs: The sampling frequency
+    :return: The filter as an array of second order sections
+    """
+    if isinstance(frequencies, (list, tuple, np.ndarray)):
+        frequencies = tuple(float(i) for i in frequencies)
+
+    return _butter_sos(order, frequencies, filter_type, fs)
+
+
+@lru_cache(maxsize=64)
+def decimation_filter(q: int, order: int, ftype: str) -> np.ndarray:
+    """
+    Designs (or fetches from the cache) the anti-alias filter scipy.signal.decimate uses to decimate by q: a Chebyshev
+    type I filter in second order sections for 'iir', or a hamming windowed FIR filter's taps for 'fir'
+
+    :param q: The decimation factor
+    :param order: The order of the filter
+    :param ftype: 'iir' or 'fir'
+    :return: A read only array of second order sections ('iir') or taps ('fir')
+
+    >>> decimation_filter(4, 8, 'iir').shape
+    (4, 6)
+    >>> decimation_filter(4, 8, 'iir') is decimation_filter(4, 8, 'iir')
+    True
+    """
+    if ftype == 'iir':
+        filt = signal.cheby1(order, 0.05, 0.8 / q, output='sos')
+    elif ftype == 'fir':
+        filt = signal.firwin(order + 1, 1. / q, window='hamming')
+    else:
+        raise ValueError("ftype must be 'iir' or 'fir'")
+
+    filt.setflags(write=False)
+    return filt
+
+
+@lru_cache(maxsize=64)
+def rrc_taps(alpha: float, N: int, sps: int, fs: float) -> np.ndarray:
+    """
+    Generates a root raised cosine (RRC) filter (FIR) impulse response. The taps are cached, so every Signal (Mod or
+    Demod) asking for the same pulse shape shares one read only array instead of recomputing it.
+
+    Code adapted from: https://github.com/veeresht/CommPy/blob/master/commpy/filters.py
+
+    :param alpha: Roll off factor (Valid values are [0, 1])
+    :param N: Length of the filter in samples
+    :param sps: Samples per symbol
+    :param fs: Sampling frequency
+    :return: The impulse response as a 1d array of floats
+
+    >>> taps = rrc_taps(0.5, 16, 8, 1000)    # t = +-Ts/(4 * alpha) falls on samples 4 and 12 here
+    >>> np.round(taps[[0, 4, 8, 12]], 5)
+    array([-0.1061 ,  0.57863,  1.13662,  0.57863])
+    >>> rrc_taps(0.5, 16, 8, 1000) is taps  # Cached
+    True
+    """
+    Ts = sps / fs
+    T_delta = 1 / float(fs)
+    t = (np.arange(N) - N / 2) * T_delta
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rrc = (np.sin(np.pi * t * (1 - alpha) / Ts) + 4 * alpha * (t / Ts) * np.cos(np.pi * t * (1 + alpha) / Ts)) / \
+              (np.pi * t * (1 - (4 * alpha * t / Ts) * (4 * alpha * t / Ts)) / Ts)
+
+    # The formula is 0/0 at these points, so fill in the limits
+    if alpha != 0:
+        singular = np.isclose(np.abs(t), Ts / (4 * alpha), rtol=1e-9, atol=0)
+        rrc[singular] = (alpha / np.sqrt(2)) * (((1 + 2 / np.pi) * (np.sin(np.pi / (4 * alpha)))) +
+                                                ((1 - 2 / np.pi) * (np.cos(np.pi / (4 * alpha)))))
+    rrc[t == 0.0] = 1.0 - alpha + (4 * alpha / np.pi)
+
+    rrc.setflags(write=False)
+    return rrc
+
+
+class SOSFilter:
+    """
+    IIR filter in second order sections. The filter state is kept between calls to process, so feeding a signal
+    through in blocks gives the same output as filtering it in one go. The coefficients and state are always kept in
+    double precision, because narrow filters (cutoffs far below fs) aren't stable or accurate with 32 bit coefficients.
+    The output is in the complex dtype set by dsproc.set_precision.
+
+    >>> filt = SOSFilter.butterworth(1000, 'lowpass', fs=10000)
+    >>> x = np.exp(2j * np.pi * 3000 * np.arange(1000) / 10000).astype(np.complex64)
+    >>> blocks = np.concatenate([filt.process(x[0:300]), filt.process(x[300:])])
+    >>> np.all(blocks == SOSFilter.butterworth(1000, 'lowpass', fs=10000).process(x))
+    np.True_
+    """
+    def __init__(self, sos: np.ndarray):
+        """
+        :param sos: The filter as an array of second order sections, e.g. from scipy.signal.butter(..., output='sos')
+        """
+        self.sos = np.asarray(sos)
+        self.zi = None
+
+    @classmethod
+    def butterworth(cls, frequencies: int | list | tuple, filter_type: str, fs: float, order: int = 5):
+        """
+        Creates a butterworth filter, see Signal.butterworth_filter for the arguments
+        """
+        return cls(butter_sos(order, frequencies, filter_type, fs))
+
+    def reset(self) -> None:
+        """
+        Clears the filter state, ready for a new signal
+        """
+        # The state is made when the first block arrives, because its shape depends on how many channels there are
+        self.zi = None
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        """
+        Filters the next block of samples
+
+        :param block: np array of complex samples. A 2d array of shape (channels, n) filters each row
+        :return: The filtered samples, in the complex dtype
+        """
+        if self.zi is None:
+            self.zi = np.zeros((self.sos.shape[0],) + np.shape(block)[:-1] + (2,), dtype=np.complex128)
+
+        # sosfilt works in double precision here, so go through the block a piece at a time and only ever hold a
+        # piece of it in complex128
+        sos = self.sos.astype(np.float64, copy=False)
+        block = np.asarray(block)
+        out = np.empty(block.shape, dtype=complex_dtype())
+        for start in range(0, block.shape[-1], SOS_PIECE):
+            piece = np.s_[..., start:start + SOS_PIECE]
+            out[piece], self.zi = signal.sosfilt(sos, block[piece], zi=self.zi)
+
+        return out
+
+
+class FIRFilter:
+    """
+    FIR filter that keeps the end of each block so the next block lines up with it. In 'valid' mode the output matches
+    np.convolve(x, taps, mode='valid') and in 'full' mode it matches np.convolve(x, taps, mode='full'), once flush()
+    has been called to get the final len(taps) - 1 samples. The output is in the complex dtype set by
+    dsproc.set_precision.
+
+    By default each block is convolved directly, which makes the output bit-identical however the signal is split up.
+    For long filters method='auto' lets the convolution engine use FFTs instead, which is much faster but only matches
+    to within rounding error.
+
+    >>> filt = FIRFilter(np.ones(4) / 4)
+    >>> x = np.arange(10, dtype=np.complex64)
+    >>> np.concatenate([filt.process(x[0:3]), filt.process(x[3:])]).real
+    array([1.5, 2.5, 3.5, 4.5, 5.5, 6.5, 7.5], dtype=float32)
+    """
+    def __init__(self, taps: np.ndarray, mode: str = 'valid', method: str = 'direct'):
+        """
+        :param taps: The filter taps
+        :param mode: 'valid' or 'full', as in np.convolve
+        :param method: How to do the convolution, see dsproc.util.convolve.convolve
+        """
+        if mode not in ('valid', 'full'):
+            raise ValueError("mode must be 'valid' or 'full'")
+
+        self.taps = np.asarray(taps)
+        self.mode = mode
+        self.method = method
+        self.tail = None
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Clears the filter state, ready for a new signal
+        """
+        # In full mode the signal is treated as though it has len(taps) - 1 zeros in front of it
+        if self.mode == 'full':
+            self.tail = np.zeros(len(self.taps) - 1, dtype=complex_dtype())
+        else:
+            self.tail = np.array([], dtype=complex_dtype())
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        """
+        Filters the next block of samples
+
+        :param block: np array of complex samples
+        :return: The filtered samples, in the complex dtype
+        """
+        buffer = np.concatenate([self.tail, as_complex(block)])
+        keep = len(self.taps) - 1
+        self.tail = buffer[max(len(buffer) - keep, 0):] if keep else buffer[:0]
+
+        if len(buffer) < len(self.taps):
+            return np.array([], dtype=complex_dtype())
+
+        return as_complex(convolve(buffer, self.taps, mode='valid', method=self.method))
+
+    def flush(self) -> np.ndarray:
+        """
+        In full mode, returns the last len(taps) - 1 output samples, which need no more input. Returns nothing in valid
+        mode.
+        """
+        if self.mode == 'valid':
+            return np.array([], dtype=complex_dtype())
+
+        out = self.process(np.zeros(len(self.taps) - 1, dtype=complex_dtype()))
+        self.reset()
+        return out
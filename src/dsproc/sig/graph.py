@@ -0,0 +1,363 @@
+"""
+Deferred processing for Signal objects. Instead of every method making a new full length copy of the samples, the
+operations are recorded and then run together, one chunk at a time, when compute() is called.
+
+Stages that don't carry state from one chunk to the next (frequency shifts, gains, FIR filters and peak probes) are
+parallel: each chunk, extended by the filter lengths of the stages, can be worked out on its own, so runs of them are
+spread over a pool of threads (see dsproc.util.parallel). IIR filters need the state left by the chunk before, so they
+run in order on one thread.
+"""
+import threading
+from copy import copy
+from itertools import groupby
+import numpy as np
+from .nco import NCO
+from .source import iter_chunks
+from .filters import SOSFilter, FIRFilter, butter_sos, decimation_filter, rrc_taps
+from ..util.convolve import convolve
+from ..util.precision import complex_dtype, as_complex
+from ..util.parallel import parallel_map
+from ..util.lazy import lazy_import
+
+signal = lazy_import("scipy.signal")
+
+
+class _Elementwise:
+    """
+    Multiplies the samples by a tone and a complex gain. A run of frequency shifts, phase rotations and scalings is
+    fused into one of these, so it costs one pass over each chunk no matter how many operations it contains.
+    """
+    parallel = True
+    overlap = 0
+
+    def __init__(self, fs, start):
+        self.fs = fs
+        self.start = start
+        self.freq = 0
+        self.gain = 1 + 0j
+        self.names = []
+        self._nco = None
+
+    def add(self, name, freq=0, gain=1):
+        self.names.append(name)
+        self.freq += freq
+        self.gain *= gain
+
+    @property
+    def is_identity(self):
+        return self.freq == 0 and self.gain == 1
+
+    def process(self, block):
+        if self._nco is None:
+            self._nco = NCO(f=self.freq, fs=self.fs, start=self.start, gain=self.gain)
+        return self._nco.mix(block)
+
+    def process_chunk(self, block, start):
+        if self._nco is None:
+            self._nco = NCO(f=self.freq, fs=self.fs, start=self.start, gain=self.gain)
+        # A copy shares the precomputed block of the tone, so it only costs the phase at the start of the chunk
+        nco = copy(self._nco)
+        nco.reset(self.start + start)
+        return nco.mix(block)
+
+    def describe(self):
+        return f"fused elementwise [{', '.join(self.names)}]: mix {self.freq} Hz, gain {np.round(self.gain, 4)}"
+
+
+class _Peak:
+    """
+    Passes the samples straight through, keeping track of the largest real or imaginary value seen. Used for
+    normalise_amplitude, which needs the max of the whole signal before it can scale anything.
+    """
+    parallel = True
+    overlap = 0
+
+    def __init__(self):
+        self.peak = np.float32(0)
+        self._lock = threading.Lock()
+
+    def process(self, block):
+        if len(block):
+            self.peak = max(self.peak, np.max(np.abs(block.real)), np.max(np.abs(block.imag)))
+        return block
+
+    def process_chunk(self, block, start):
+        if len(block):
+            peak = max(np.max(np.abs(block.real)), np.max(np.abs(block.imag)))
+            with self._lock:
+                self.peak = max(self.peak, peak)
+        return block
+
+    @staticmethod
+    def describe():
+        return "peak probe (normalise_amplitude), scale applied to the output"
+
+
+class _Filter:
+    """
+    A stateful filter (SOSFilter or FIRFilter), which carries its state from chunk to chunk itself
+    """
+    def __init__(self, name, filt):
+        self.name = name
+        self.filt = filt
+        # An FIR filter only needs the len(taps) - 1 samples before each chunk, which the chunk can be extended by. An
+        # IIR filter's state depends on everything before it
+        self.parallel = isinstance(filt, FIRFilter)
+        self.overlap = len(filt.taps) - 1 if self.parallel else 0
+
+    def process(self, block):
+        return self.filt.process(block)
+
+    def process_chunk(self, block, start):
+        if len(block) < len(self.filt.taps):
+            return np.array([], dtype=complex_dtype())
+        return as_complex(convolve(block, self.filt.taps, mode='valid', method=self.filt.method))
+
+    def describe(self):
+        if isinstance(self.filt, SOSFilter):
+            return f"{self.name}: sosfilt, {self.filt.sos.shape[0]} sections, state carried between chunks"
+
+        n_taps = len(self.filt.taps)
+        return f"{self.name}: FIR, {n_taps} taps, valid mode with {n_taps - 1} samples of overlap"
+
+
+class _Decimate:
+    """
+    Causal anti-alias filter followed by keeping every nth sample. Which sample is kept is tracked across chunks.
+    """
+    parallel = False
+    overlap = 0
+
+    def __init__(self, n, filter_order, ftype):
+        self.n = n
+        self.ftype = ftype
+        filt = decimation_filter(n, filter_order, ftype)
+        self.filt = SOSFilter(filt if ftype == 'iir' else signal.tf2sos(filt, [1.]))
+
+        self.count = 0
+
+    def process(self, block):
+        out = self.filt.process(block)[(-self.count) % self.n::self.n]
+        self.count += len(block)
+        return out
+
+    def describe(self):
+        return f"decimate: causal {self.ftype} filter, keep every {self.n}th sample"
+
+
+class Graph:
+    """
+    A deferred chain of operations on a Signal, made by calling Signal.lazy(). The methods have the same names and
+    arguments as the Signal methods they stand in for, but they only record the operation and return the graph so calls
+    can be chained. Nothing is run until compute() is called.
+
+    When the graph is computed, neighbouring elementwise operations (baseband, freq_offset and phase_offset) are fused
+    into a single multiply, and only the last normalise_amplitude is kept because every operation is linear. The chain
+    is then run over the samples one chunk at a time, so each sample is read from memory once and every stage works on
+    a chunk that fits in cache. Runs of stages that don't need the chunk before them are computed on several threads
+    at once, see compute.
+
+    Note that decimate uses a causal filter here, where Signal.decimate uses a zero phase one, because a zero phase
+    filter needs the whole signal at once.
+
+    >>> from dsproc import Mod
+    >>> s = Mod(fs=10000, message=np.array([0, 1, 2, 3] * 10), sps=8, f=2000)
+    >>> s.QPSK()
+    >>> g = s.lazy().baseband().phase_offset(45).normalise_amplitude()
+    >>> print(g.explain())
+    1. fused elementwise [baseband, phase_offset]: mix -2000 Hz, gain (0.7071+0.7071j)
+    2. peak probe (normalise_amplitude), scale applied to the output
+    >>> _ = g.compute()
+    >>> s.f, len(s.samples)
+    (0, 320)
+    """
+    def __init__(self, sig):
+        self.sig = sig
+        self.ops = []
+
+        # Parameters of the signal as they will be after the recorded operations
+        self.f = sig.f
+        self.fs = sig.fs
+        self.sps = sig.sps
+
+    def baseband(self):
+        """
+        Records a Signal.baseband
+        """
+        if not self.f:
+            raise ValueError("Cannot baseband signal because the center frequency is unknown. Set the attribute 'f' to "
+                             "some integer value")
+        self.ops.append(("mix", "baseband", -1 * self.f))
+        self.f = 0
+        return self
+
+    def freq_offset(self, freq: int = 1000):
+        """
+        Records a Signal.freq_offset
+        """
+        self.ops.append(("mix", "freq_offset", freq))
+        self.f = self.f + freq if self.f else freq
+        return self
+
+    def phase_offset(self, angle: int = 40):
+        """
+        Records a Signal.phase_offset
+        """
+        phase_offset = angle * np.pi / 180
+        self.ops.append(("gain", "phase_offset", np.cos(phase_offset) + 1j * np.sin(phase_offset)))
+        return self
+
+    def normalise_amplitude(self):
+        """
+        Records a Signal.normalise_amplitude
+        """
+        self.ops.append(("normalise", "normalise_amplitude"))
+        return self
+
+    def butterworth_filter(self, frequencies: int | list | tuple, filter_type: str, order: int = 5):
+        """
+        Records a Signal.butterworth_filter. The filter is designed now, at the sample rate the signal will have when
+        the filter is reached.
+        """
+        self.ops.append(("sos", "butterworth_filter", butter_sos(order, frequencies, filter_type, self.fs)))
+        return self
+
+    def rrc(self, alpha: float = 0.4, N: int = 0, normalise: bool = True):
+        """
+        Records a Signal.rrc
+        """
+        if N == 0:
+            N = 10 * self.sps + 1
+
+        self.ops.append(("fir", "rrc", rrc_taps(alpha, N, self.sps, self.fs)))
+        if normalise:
+            self.normalise_amplitude()
+        return self
+
+    def decimate(self, n: int, filter_order: int = 8, ftype: str = 'iir'):
+        """
+        Records a Signal.decimate. See the class docstring for how this differs from Signal.decimate
+        """
+        self.ops.append(("decimate", "decimate", n, filter_order, ftype))
+        self.fs = int(self.fs / n)
+        self.sps = int(self.sps / n)
+        return self
+
+    def _build(self):
+        """
+        Turns the recorded operations into a list of stages, fusing what can be fused
+        """
+        stages = []
+        dropped = []
+        fs = self.sig.fs
+
+        normalise = [i for i, op in enumerate(self.ops) if op[0] == "normalise"]
+        last_normalise = normalise[-1] if normalise else None
+
+        for i, op in enumerate(self.ops):
+            kind = op[0]
+
+            if kind in ("mix", "gain"):
+                if not stages or not isinstance(stages[-1], _Elementwise):
+                    stages.append(_Elementwise(fs, self.sig.sample_offset))
+                if kind == "mix":
+                    stages[-1].add(op[1], freq=op[2])
+                else:
+                    stages[-1].add(op[1], gain=op[2])
+
+            elif kind == "normalise":
+                if i == last_normalise:
+                    stages.append(_Peak())
+                else:
+                    dropped.append(f"normalise_amplitude (op {i + 1}) is overridden by a later one")
+
+            elif kind == "sos":
+                stages.append(_Filter(op[1], SOSFilter(op[2])))
+
+            elif kind == "fir":
+                stages.append(_Filter(op[1], FIRFilter(op[2])))
+
+            elif kind == "decimate":
+                stages.append(_Decimate(*op[2:]))
+                fs = int(fs / op[2])
+
+        for stage in stages:
+            if isinstance(stage, _Elementwise) and stage.is_identity:
+                dropped.append(f"[{', '.join(stage.names)}] cancel out")
+
+        stages = [i for i in stages if not (isinstance(i, _Elementwise) and i.is_identity)]
+
+        return stages, dropped
+
+    def explain(self) -> str:
+        """
+        Returns a description of the plan that compute() will run
+        """
+        stages, dropped = self._build()
+        lines = [f"{i + 1}. {stage.describe()}" for i, stage in enumerate(stages)]
+        lines += [f"dropped: {i}" for i in dropped]
+
+        return "\n".join(lines)
+
+    @staticmethod
+    def _run_serial(stages, samples, chunk_size):
+        out = []
+        for _, chunk in iter_chunks(samples, chunk_size=chunk_size):
+            block = np.array(chunk, dtype=complex_dtype())
+            for stage in stages:
+                block = stage.process(block)
+            out.append(block)
+
+        return np.concatenate(out) if out else np.array([], dtype=complex_dtype())
+
+    @staticmethod
+    def _run_parallel(stages, samples, chunk_size, threads):
+        # Each chunk is extended by the samples the filters in it consume, so it comes out exactly chunk_size long
+        overlap = sum(stage.overlap for stage in stages)
+        out = np.empty(max(len(samples) - overlap, 0), dtype=complex_dtype())
+
+        def run(start):
+            # Always a copy, the mixing is done in place and the overlap is shared with the next chunk
+            block = np.array(samples[start:start + chunk_size + overlap], dtype=complex_dtype())
+            for stage in stages:
+                block = stage.process_chunk(block, start)
+            out[start:start + len(block)] = block
+
+        parallel_map(run, range(0, len(out), chunk_size), threads)
+        return out
+
+    def compute(self, chunk_size: int = 2**16, threads: int = None):
+        """
+        Runs the recorded operations and writes the result back into the signal. The original samples are never
+        modified, each chunk is copied into a working buffer first.
+
+        Runs of parallel stages are worked out a chunk at a time on a pool of threads, and stages that need the state
+        left by the previous chunk (the IIR filters and decimate) go through the chunks in order on one thread. The
+        chunks are the same whatever the number of threads, so the result is too.
+
+        :param chunk_size: How many samples to process at a time
+        :param threads: How many threads to use, defaults to dsproc.get_threads()
+        :return: The signal
+        """
+        stages, _ = self._build()
+
+        samples = self.sig.samples
+        if not stages:
+            samples = np.array(samples, dtype=complex_dtype())
+        for parallel, run in groupby(stages, key=lambda stage: stage.parallel):
+            if parallel:
+                samples = self._run_parallel(list(run), samples, chunk_size, threads)
+            else:
+                samples = self._run_serial(list(run), samples, chunk_size)
+
+        peaks = [i for i in stages if isinstance(i, _Peak)]
+        if peaks and peaks[0].peak:
+            np.divide(samples, peaks[0].peak, out=samples)
+
+        self.sig.samples = samples
+        self.sig.f = self.f
+        self.sig.fs = self.fs
+        self.sig.sps = self.sps
+        self.ops = []
+
+        return self.sig
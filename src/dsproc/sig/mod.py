@@ -2,8 +2,11 @@ import numpy as np
 from .constellation import Constellation
 from ._sig import Signal
 from ..util.utils import moving_average
+from ..util.precision import as_complex
+from ..util.profiling import instrument
 
 
+@instrument("samples")
 class Mod(Signal):
     """
     Class used for modulating data into a wave. Extends functionality from the Signal class by adding functions
@@ -28,6 +31,17 @@ class Mod(Signal):
         """
         super().__init__(fs=fs, message=message, sps=sps, amplitude=amplitude, f=f)
 
+    async def stream(self, sink, block_size: int = 2**14, speed: float = None) -> None:
+        """
+        Sends the samples to a stream sink a block at a time, like a transmitter would, see dsproc.sig.stream. The sink
+        is left open, so more signals can be sent after this one
+
+        :param sink: The sink, e.g. a SocketSink to send the samples to a SocketSource
+        :param block_size: How many samples to send at a time
+        :param speed: How fast to send them: 1.0 for real time at fs, None for as fast as the sink takes them
+        """
+        await sink.send(self.samples, self.fs, block_size=block_size, speed=speed)
+
     def ASK(self) -> None:
         """
         Amplitude shift keying. Writes the message symbols into the amplitude of the wave by changing the A value in
@@ -45,11 +59,12 @@ class Mod(Signal):
         >>> print(np.abs(s.samples))
         [1.  1.  0.5 0.5 1.  1.  0.5 0.5 1.  1.  1.  1.  1.  1.  0.5 0.5]
         """
-        amp_mod_z = np.repeat(self.message, self.sps)       # repeat each of the elements of the message, sps times
+        # repeat each of the elements of the message, sps times
+        amp_mod_z = np.repeat(self.message, self.sps, axis=-1)
         amp_mod_z += 1  # Add 1 so amplitude is never 0
-        amp_mod_z = amp_mod_z / max(amp_mod_z)      # Scale it so its <= 1
+        amp_mod_z = amp_mod_z / np.max(amp_mod_z, axis=-1, keepdims=True)      # Scale it so its <= 1
 
-        self.samples = self.create_samples(freq=self.f, amp=amp_mod_z)
+        self.samples = self.create_samples(freq=self.per_channel(self.f), amp=amp_mod_z)
 
     def create_FSK_vector(self, spacing: int) -> np.ndarray:
         """
@@ -68,20 +83,18 @@ class Mod(Signal):
         freqs = freqs.astype(np.int64)  # self.message is np.uint8 so we have to change here to 64bit
         freqs = freqs * spacing
 
-        # This centers it back on self.f, so that the centre frequency of the signal is maintained
-        max_diff = abs((self.M)*spacing - self.f)
-        min_diff = abs(spacing - self.f)
-        change = int(abs(max_diff - min_diff)/2)
+        # This centers it back on self.f, so that the centre frequency of the signal is maintained. f is a column for a
+        # batch with one f per channel
+        f = self.per_channel(self.f)
+        max_diff = np.abs((self.channel_M)*spacing - f)
+        min_diff = np.abs(spacing - f)
+        change = (np.abs(max_diff - min_diff)/2).astype(np.int64)
 
-        if max_diff > min_diff:
-            # We shift down
-            freqs -= change
-        elif min_diff > max_diff:
-            # we shift up
-            freqs += change
+        # We shift down if max_diff > min_diff and up if min_diff > max_diff
+        freqs = freqs + np.where(max_diff > min_diff, -change, change)
 
         # Stretch the vector so it lines up with the symbol transitions
-        f_mod_z = np.repeat(freqs, self.sps)
+        f_mod_z = np.repeat(freqs, self.sps, axis=-1)
 
         return f_mod_z
 
@@ -107,7 +120,7 @@ class Mod(Signal):
         f_mod_z = self.create_FSK_vector(spacing)
 
         z = self.create_samples(freq=f_mod_z, theta=0, amp=1)
-        self.samples = z.astype(np.complex64)
+        self.samples = as_complex(z)
 
     def QPSK(self) -> None:
         """
@@ -125,16 +138,16 @@ class Mod(Signal):
         np.complex64(0.20153952+1.9175801j)
 
         """
-        M = len(np.unique(self.message))    # The number of symbols
+        M = self.channel_M    # The number of symbols, in each channel for a batch
 
         # Convert the message symbols to M radian phase offsets with a pi/M bias from zero
         # i.e. if we had 4 symbols make them 45, 135, 225, 315 degree phase offsets (1/4pi, 3/4pi, 5/4pi, 7/4pi)
         symbols = self.message * 2 * np.pi / M + np.pi/ M
-        message = np.repeat(symbols, self.sps)
+        message = np.repeat(symbols, self.sps, axis=-1)
 
-        z = self.create_samples(freq=self.f, theta=message)
+        z = self.create_samples(freq=self.per_channel(self.f), theta=message)
 
-        self.samples = z.astype(np.complex64)
+        self.samples = as_complex(z)
 
     def QAM(self, constellation: str | np.ndarray = "square") -> None:
         """
@@ -206,12 +219,12 @@ class Mod(Signal):
         # Scale to between 1 and -1
         c.normalise()
 
-        message = np.repeat(self.message, self.sps)
+        message = np.repeat(self.message, self.sps, axis=-1)
 
         offsets = c.map[message]      # Index the map by the symbols
 
-        z = self.create_samples(freq=self.f, theta=np.angle(offsets), amp=np.abs(offsets))
-        z = z.astype(np.complex64)  # Ensure type
+        z = self.create_samples(freq=self.per_channel(self.f), theta=np.angle(offsets), amp=np.abs(offsets))
+        z = as_complex(z)  # Ensure type
 
         self.samples = z
 
@@ -234,12 +247,13 @@ class Mod(Signal):
         f_mod_z = self.create_FSK_vector(spacing)
 
         # Cumulative phase offset
-        delta_phi = 2.0 * f_mod_z * np.pi / self.fs    # Change in phase at every timestep (in radians per timestep)
-        phi = np.cumsum(delta_phi)              # Add up the changes in phase
+        # Change in phase at every timestep (in radians per timestep)
+        delta_phi = 2.0 * f_mod_z * np.pi / self.per_channel(self.fs)
+        phi = np.cumsum(delta_phi, axis=-1)              # Add up the changes in phase
 
         z = self.amp * np.exp(1j * phi)  # creates sinusoid theta phase shift
         z = np.array(z)
-        self.samples = z.astype(np.complex64)
+        self.samples = as_complex(z)
 
 
     def CPFSK_smoother(self, spacing: int, smooth_n: int = 10, weights: np.ndarray | list | tuple = None):
@@ -289,7 +303,7 @@ class Mod(Signal):
 
         z = self.amp * np.exp(1j * phi)  # creates sinusoid theta phase shift
         z = np.array(z)
-        self.samples = z.astype(np.complex64)
+        self.samples = as_complex(z)
 
     def FHSS(self, hop_f: int, freqs: np.ndarray, pattern=np.array([])):
         """
@@ -0,0 +1,116 @@
+"""
+Numerically controlled oscillator, used to make the mixing tones for frequency shifting a signal
+"""
+import numpy as np
+from ..util.precision import complex_dtype
+
+
+class NCO:
+    """
+    Numerically controlled oscillator. Generates a complex tone of frequency f a block at a time, keeping track of the
+    phase between blocks so the tone is continuous no matter how it is split up.
+
+    Rather than evaluating cos and sin for every sample, one block of the tone is computed when the oscillator is
+    created and every following block is that block rotated by the phase of its first sample. The phase of each block
+    is recomputed from the sample count (exactly, when f and fs are integers) so rounding errors can't build up and the
+    phase stays accurate at large sample numbers, where a float64 2*pi*f*t loses precision.
+
+    The tone is complex64 or complex128 depending on dsproc.set_precision.
+
+    f and fs can also be arrays with one value per channel, in which case the NCO makes one tone per channel and
+    generate returns an array of shape (channels, n). mix then expects samples of shape (channels, n).
+    """
+    def __init__(self, f: float, fs: float, phase: float = 0.0, start: int = 0, block_size: int = 8192,
+                 gain: complex = 1):
+        """
+        :param f: The frequency of the tone. Can be negative. Can be an array with one frequency per channel
+        :param fs: The sampling frequency. Can be an array with one sampling frequency per channel
+        :param phase: The starting phase in radians
+        :param start: The sample number to start the tone at. Use this to line the tone up with a block of a longer
+            capture
+        :param block_size: The number of samples in the pre-computed block
+        :param gain: A (complex) gain applied to the tone. Lets a scaling or phase rotation be done in the same pass
+            as the mixing
+
+        >>> nco = NCO(f=1000, fs=8000)
+        >>> np.round(nco.generate(4), 5)
+        array([ 1.     +0.j     ,  0.70711+0.70711j,  0.     +1.j     ,
+               -0.70711+0.70711j], dtype=complex64)
+        >>> np.round(nco.generate(2), 5)    # Carries on from where the last block finished
+        array([-1.     +0.j     , -0.70711-0.70711j], dtype=complex64)
+        """
+        if block_size <= 0:
+            raise ValueError("block_size must be a positive integer")
+
+        self.f = f
+        self.fs = fs
+        self.phase = phase
+        self.n = start
+        self.block_size = block_size
+        self.gain = gain
+        self.dtype = complex_dtype()
+
+        # One block of the tone starting at zero phase, with a row per channel if there are several
+        step = 2 * np.pi * np.asarray(f) / np.asarray(fs)
+        self._block = np.exp(1j * np.multiply.outer(step, np.arange(block_size))).astype(self.dtype)
+
+    def _phasor(self, n: int) -> np.complexfloating:
+        """
+        The phase of the tone at sample n, as a complex number with magnitude equal to the gain. A column of them
+        (channels, 1) when there are several channels
+        """
+        f = np.asarray(self.f)
+        fs = np.asarray(self.fs)
+        if np.issubdtype(f.dtype, np.integer) and np.issubdtype(fs.dtype, np.integer):
+            # Integer frequencies let us find the fraction of a cycle without any rounding. Taking n mod fs first
+            # keeps the product from overflowing
+            cycles = ((f * (int(n) % fs)) % fs) / fs
+        else:
+            cycles = (f * n / fs) % 1.0
+
+        phasor = np.asarray(self.gain * np.exp(1j * (2 * np.pi * cycles + self.phase)), dtype=self.dtype)
+        if phasor.ndim:
+            return phasor[:, None]
+
+        return phasor[()]
+
+    def reset(self, start: int = 0) -> None:
+        """
+        Moves the oscillator to the given sample number
+        """
+        self.n = start
+
+    def generate(self, n: int) -> np.ndarray:
+        """
+        Returns the next n samples of the tone
+        """
+        out = np.empty(self._block.shape[:-1] + (n,), dtype=self.dtype)
+        for i in range(0, n, self.block_size):
+            m = min(self.block_size, n - i)
+            np.multiply(self._block[..., :m], self._phasor(self.n), out=out[..., i:i + m])
+            self.n += m
+
+        return out
+
+    def mix(self, x: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+        """
+        Multiplies x by the next len(x) samples of the tone. Works in place unless out is given, so x should be a
+        writeable array of the complex dtype. A 2d x is mixed along its rows, so with one tone per channel each row
+        gets its own tone, and with a single tone every row gets the same one.
+
+        :param x: The samples to mix
+        :param out: Optional array to write the result to
+        :return: The mixed samples
+        """
+        if out is None:
+            out = x
+
+        n = x.shape[-1]
+        tone = np.empty(self._block.shape[:-1] + (min(self.block_size, n),), dtype=self.dtype)
+        for i in range(0, n, self.block_size):
+            m = min(self.block_size, n - i)
+            np.multiply(self._block[..., :m], self._phasor(self.n), out=tone[..., :m])
+            np.multiply(x[..., i:i + m], tone[..., :m], out=out[..., i:i + m])
+            self.n += m
+
+        return out
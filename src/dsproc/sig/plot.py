@@ -2,11 +2,121 @@
 Contains plotting function for analysing a signal
 """
 import numpy as np
-from matplotlib import pyplot as plt
-import matplotlib
-matplotlib.use('TkAgg')
+from .source import iter_chunks
+from ..util.lazy import lazy_import
 
+# Imported on the first plot, so scripts that never plot don't pay for importing matplotlib. The backend is left to
+# matplotlib and the user (MPLBACKEND, matplotlibrc or matplotlib.use)
+plt = lazy_import("matplotlib.pyplot")
 
+# Views of more samples than this are drawn as a min/max envelope with this many points, about one per pixel
+ENVELOPE_POINTS = 2000
+# IQ plots of more samples than this are drawn as a density image instead of a scatter
+SCATTER_POINTS = 20000
+# Samples worked on at a time, so memory mapped captures are never read into memory all at once
+CHUNK_SIZE = 2**20
+
+
+def view_values(data: np.ndarray, subtype: str, fs: float = None, chunk_size: int = CHUNK_SIZE):
+    """
+    Yields the values shown by a view, a chunk at a time
+
+    :param data: The complex samples
+    :param subtype: 'phase' (radians), 'amp', 'freq' (instantaneous frequency in Hz, one fewer than the samples),
+        'real' or 'imag'
+    :param fs: The sample rate, needed for 'freq'
+    :param chunk_size: How many samples to work on at a time
+    """
+    # The frequency needs the sample after each chunk too
+    overlap = 1 if subtype == 'freq' else 0
+    for _, block in iter_chunks(data, chunk_size=chunk_size, overlap=overlap):
+        block = np.asarray(block)
+        if subtype == 'phase':
+            yield np.angle(block)
+        elif subtype == 'amp':
+            yield np.abs(block)
+        elif subtype == 'freq':
+            # The same as the diff of the unwrapped phase, but each chunk can be worked out on its own
+            yield np.angle(block[1:] * np.conj(block[:-1])) * (fs / (2 * np.pi))
+        elif subtype == 'real':
+            yield block.real
+        elif subtype == 'imag':
+            yield block.imag
+        else:
+            raise ValueError(f"Unknown view '{subtype}'")
+
+
+def envelope(chunks, n: int, points: int = ENVELOPE_POINTS) -> tuple:
+    """
+    Splits n values into at most points bins of equal size and finds the min and max of each bin, so a view of
+    millions of samples can be drawn with a few thousand points without losing any peaks.
+
+    :param chunks: Iterable of arrays that make up the n values, e.g. from view_values
+    :param n: The total number of values
+    :param points: The most bins to return
+    :return: (bin_size, lo, hi). Bin i starts at value i * bin_size. The last bin may be smaller than the others
+
+    >>> bin_size, lo, hi = envelope([np.array([3, 1, 4, 1, 5]), np.array([9, 2, 6])], n=8, points=3)
+    >>> bin_size, lo.tolist(), hi.tolist()
+    (3, [1, 1, 2], [4, 9, 6])
+    """
+    bin_size = max(-(-n // points), 1)
+    lo, hi = [], []
+    leftover = np.zeros(0)
+    for values in chunks:
+        if len(leftover):
+            values = np.concatenate([leftover, values])
+
+        whole = len(values) // bin_size * bin_size
+        if whole:
+            bins = values[:whole].reshape(-1, bin_size)
+            lo.append(bins.min(axis=1))
+            hi.append(bins.max(axis=1))
+        leftover = values[whole:]
+
+    if len(leftover):
+        lo.append(leftover.min(keepdims=True))
+        hi.append(leftover.max(keepdims=True))
+
+    if not lo:
+        return bin_size, np.zeros(0), np.zeros(0)
+
+    return bin_size, np.concatenate(lo), np.concatenate(hi)
+
+
+def plot_envelope(x: np.ndarray, lo: np.ndarray, hi: np.ndarray, bin_size: int, **kwargs) -> None:
+    """
+    Draws an envelope from envelope(). When every bin is a single value it's drawn as an ordinary line
+    """
+    if bin_size == 1:
+        plt.plot(x, lo, **kwargs)
+    else:
+        plt.fill_between(x, lo, hi, step='post', linewidth=0.5, **kwargs)
+
+
+def iq_density(data: np.ndarray, bins: int = 512, chunk_size: int = CHUNK_SIZE) -> tuple:
+    """
+    Counts the samples that fall in each cell of a bins x bins grid over the IQ plane, a chunk at a time
+
+    :return: (counts, limit). counts[i, j] is the number of samples in real cell i and imaginary cell j, and the grid
+        spans -limit to limit on both axes
+    """
+    limit = 0
+    for _, block in iter_chunks(data, chunk_size=chunk_size):
+        if len(block):
+            limit = max(limit, float(np.max(np.abs(np.asarray(block)))))
+    limit = limit * 1.05 or 1
+
+    # Work out each sample's cell directly and count them with bincount, which is much quicker than histogram2d
+    counts = np.zeros(bins * bins, dtype=np.int64)
+    scale = bins / (2 * limit)
+    for _, block in iter_chunks(data, chunk_size=chunk_size):
+        block = np.asarray(block)
+        i = np.clip(((block.real + limit) * scale).astype(np.intp), 0, bins - 1)
+        j = np.clip(((block.imag + limit) * scale).astype(np.intp), 0, bins - 1)
+        counts += np.bincount(i * bins + j, minlength=bins * bins)
+
+    return counts.reshape(bins, bins), limit
 
 
 # TODO:
@@ -23,86 +133,80 @@ def plot(data, **kwargs):
     :param kwargs: plotting key word arguments
     """
     if kwargs['type'] == "specgram":
-        plt.specgram(data, NFFT=kwargs['nfft'], Fs=kwargs['fs'])
+        # data is the power of each frame, from spectral.spectrogram
+        times, freqs = kwargs['times'], kwargs['freqs']
+        plt.imshow(10 * np.log10(data.T + np.finfo(data.dtype).tiny), origin='lower', aspect='auto',
+                   extent=(times[0], times[-1], freqs[0], freqs[-1]))
         plt.title(kwargs['title'])
         plt.ylabel("Frequency (Hz)")
         plt.xlabel("Time (s)")
 
     elif kwargs['type'] == 'psd':
-        plt.psd(data, NFFT=kwargs['nfft'], Fs=kwargs['fs'])
+        # data is the power spectral density, from spectral.welch
+        plt.plot(kwargs['freqs'], 10 * np.log10(data + np.finfo(data.dtype).tiny))
         plt.title(kwargs['title'])
+        plt.ylabel("Power Spectral Density (dB/Hz)")
+        plt.xlabel("Frequency (Hz)")
         plt.axhline(0, color='lightgray')  # x = 0
         plt.axvline(0, color='lightgray')  # y = 0
         plt.grid(True)
 
     elif kwargs['type'] == 'iq':
-        plt.scatter(data.real, data.imag)
+        if len(data) > SCATTER_POINTS:
+            # Too many points to scatter, show how many samples land in each spot instead
+            counts, ax_max = iq_density(data)
+            plt.imshow(np.log1p(counts.T), origin='lower', extent=(-ax_max, ax_max, -ax_max, ax_max), cmap='viridis')
+        else:
+            plt.scatter(data.real, data.imag)
+            # Figure out the axis sizes
+            ax_max = round(np.max(np.abs(data))) + 0.2
+
         plt.ylabel("Imaginary")
         plt.xlabel("Real")
         plt.title(kwargs['title'])
         plt.axhline(0, color='lightgray')  # x = 0
         plt.axvline(0, color='lightgray')  # y = 0
 
-        # Figure out the axis sizes
-        ax_max = round(np.max(np.abs(data))) + 0.2
-
         plt.xlim(-1*ax_max, ax_max)
         plt.ylim(-1*ax_max, ax_max)
 
     elif kwargs['type'] == "fft":
-        if 'nfft' in kwargs.keys():
-            nfft = kwargs['nfft']
-        else:
-            nfft = 1024
-
-        S = np.fft.fftshift(np.abs(np.fft.fft(data)))
-        S_mag = np.abs(S)
-        f_axis = np.arange(kwargs['fs'] / -2, kwargs['fs'] / 2, kwargs['fs'] / len(data))
-        if len(f_axis) > len(S_mag):
-            f_axis = f_axis[0:len(S_mag)]
-
-        plt.plot(f_axis, S_mag)
+        # data is the amplitude spectrum
+        plt.plot(kwargs['freqs'], data)
         plt.title(kwargs['title'])
         plt.xlabel("Frequency (Hz)")
         plt.ylabel("Amplitude")
 
     elif kwargs['type'] == "time":
-        t = kwargs['t']
-        n = kwargs['n']
+        fs = kwargs['fs']
+        for part in ['real', 'imag']:
+            bin_size, lo, hi = envelope(view_values(data, part), len(data), kwargs['points'])
+            x = (kwargs['start'] + np.arange(len(lo)) * bin_size) / fs
+            plot_envelope(x, lo, hi, bin_size)
 
-        if n == 0:
-            n = len(data)
-        elif n > len(data):
-            n = len(data)
-
-        plt.plot(t[0:n], np.real(data[0:n]))
-        plt.plot(t[0:n], np.imag(data[0:n]))
         plt.title(kwargs['title'])
         plt.xlabel("Time (s)")
         plt.ylabel("Amplitude")
 
     elif kwargs['type'] == "view":
-        env = None
         if kwargs['subtype'] == "phase":
             plt.title("Phase View")
             plt.ylabel("Phase (Radians)")
-            env = np.angle(data)
 
         elif kwargs['subtype'] == 'amp':
             plt.title('Amplitude View')
             plt.ylabel("Amplitude")
-            env = np.abs(data)
 
         elif kwargs['subtype'] == 'freq':
             plt.title("Frequency View")
             plt.ylabel("Frequency (Hz)")
-            phase = np.unwrap(np.angle(data))
-            env = np.diff(phase) / (2*np.pi) * kwargs['fs']
+
+        n = len(data) - 1 if kwargs['subtype'] == 'freq' else len(data)
+        bin_size, lo, hi = envelope(view_values(data, kwargs['subtype'], kwargs.get('fs')), n, kwargs['points'])
 
         plt.xlabel("Samples (s)")
-        start_sample = kwargs['start']
-        x_ticks = np.arange(start=start_sample, stop=start_sample+len(env))
-        plt.plot(x_ticks, env)
+        x_ticks = kwargs['start'] + np.arange(len(lo)) * bin_size
+        plot_envelope(x_ticks, lo, hi, bin_size)
 
     plt.show()
 
@@ -0,0 +1,214 @@
+"""
+Polyphase resampling that can be run a block at a time. The anti-alias filter for each ratio is designed once and
+cached.
+"""
+from functools import lru_cache
+from math import gcd
+import numpy as np
+from ..util.precision import complex_dtype
+from ..util.lazy import lazy_import
+
+signal = lazy_import("scipy.signal")
+
+
+@lru_cache(maxsize=64)
+def polyphase_filter(up: int, down: int) -> tuple[np.ndarray, int]:
+    """
+    Designs the anti-alias filter for resampling by up/down, the same filter scipy's resample_poly uses. The filter is
+    zero padded at the front so that output samples line up with input samples. The taps still need multiplying by up,
+    which is left until the dtype of the data is known so the rounding matches resample_poly.
+
+    :param up: Upsampling factor
+    :param down: Downsampling factor
+    :return: A tuple of (taps, how many leading output samples to drop to remove the filter delay)
+    """
+    max_rate = max(up, down)
+    half_len = 10 * max_rate
+    h = signal.firwin(2 * half_len + 1, 1. / max_rate, window=('kaiser', 5.0))
+
+    n_pre_pad = down - half_len % down
+    n_pre_remove = (half_len + n_pre_pad) // down
+    h = np.concatenate([np.zeros(n_pre_pad), h])
+
+    h.setflags(write=False)
+    return h, n_pre_remove
+
+
+def factorise(n: int, max_factor: int) -> list[int]:
+    """
+    Splits n into factors that are each no bigger than max_factor (where possible), biggest first. Used to plan
+    multistage resampling.
+
+    >>> factorise(64, 10)
+    [8, 8]
+    >>> factorise(100, 13)
+    [10, 10]
+    >>> factorise(17, 13)   # Primes larger than max_factor can't be split
+    [17]
+    """
+    primes = []
+    p = 2
+    while n > 1 and p * p <= n:
+        while n % p == 0:
+            primes.append(p)
+            n //= p
+        p += 1
+    if n > 1:
+        primes.append(n)
+
+    # Greedily pack the largest primes together
+    factors = []
+    for prime in sorted(primes, reverse=True):
+        for i, factor in enumerate(factors):
+            if factor * prime <= max_factor:
+                factors[i] *= prime
+                break
+        else:
+            factors.append(prime)
+
+    return sorted(factors, reverse=True)
+
+
+class _Stage:
+    """
+    A single polyphase resampling stage that keeps enough of the input to carry on seamlessly with the next block
+    """
+    def __init__(self, up: int, down: int):
+        self.up = up
+        self.down = down
+        self.taps, self.n_pre_remove = polyphase_filter(up, down)
+        # The scaled taps for each dtype of data seen
+        self._scaled = {}
+        self.buffer = None
+        self.reset()
+
+    def reset(self):
+        # Absolute index of the first sample in the buffer. Always a multiple of down, so the outputs of upfirdn on the
+        # buffer line up with the outputs on the whole signal
+        self.start = 0
+        # Number of samples that have been input so far
+        self.n_in = 0
+        # The next output sample (of the un-trimmed filter output) to be emitted
+        self.next_out = 0
+        self.buffer = np.array([], dtype=complex_dtype())
+
+    def _run(self, buffer, last):
+        """
+        Filters the buffer and returns the outputs from next_out up to (not including) last
+        """
+        if last <= self.next_out:
+            return np.array([], dtype=np.result_type(buffer, np.float32))
+
+        # Match the filter dtype to the data, as resample_poly does, so single precision stays single precision
+        dtype = buffer.dtype if np.issubdtype(buffer.dtype, np.inexact) else np.float64
+        if dtype not in self._scaled:
+            taps = self.taps.astype(dtype)
+            taps *= self.up
+            self._scaled[dtype] = taps
+        taps = self._scaled[dtype]
+
+        y = signal.upfirdn(taps, buffer, self.up, self.down)
+        offset = self.start * self.up // self.down
+
+        first = max(self.next_out, self.n_pre_remove)
+        out = y[first - offset:last - offset]
+        self.next_out = last
+
+        return out
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        if len(self.buffer):
+            buffer = np.concatenate([self.buffer, block])
+        else:
+            buffer = np.asarray(block)
+        self.n_in += len(block)
+
+        # Outputs that only depend on samples we already have
+        last = (self.n_in * self.up - 1) // self.down + 1 if self.n_in else 0
+        out = self._run(buffer, last)
+
+        # Keep the samples the next output still needs
+        needed = max((self.next_out * self.down - len(self.taps) + 1) // self.up, 0)
+        needed = needed // self.down * self.down
+        self.buffer = buffer[needed - self.start:]
+        self.start = needed
+
+        return out
+
+    def flush(self) -> np.ndarray:
+        n_out = -(-self.n_in * self.up // self.down)
+        # Pad with enough zeros to push the rest of the outputs through the filter
+        pad = np.zeros(len(self.taps) // self.up + 2 * self.down + 1, dtype=self.buffer.dtype)
+        out = self._run(np.concatenate([self.buffer, pad]), self.n_pre_remove + n_out)
+        self.reset()
+
+        return out
+
+
+class Resampler:
+    """
+    Resamples a signal by a factor of up/down, one block at a time. The output of feeding a signal through in blocks and
+    then calling flush() is the same as resampling it all at once.
+
+    The anti-alias filters are cached by ratio, so creating lots of resamplers for the same ratio is cheap. Large
+    decimation (or interpolation) factors are split into a chain of smaller stages, see factorise, which keeps each
+    filter short. A single stage with the same filter as scipy's resample_poly is used when multistage is False or when
+    the ratio has both an up and a down factor.
+
+    >>> r = Resampler(up=1, down=64)
+    >>> r.plan
+    [(1, 8), (1, 8)]
+    >>> x = np.exp(2j * np.pi * 10 * np.arange(6400) / 64000).astype(np.complex64)
+    >>> y = np.concatenate([r.process(x[:1000]), r.process(x[1000:]), r.flush()])
+    >>> len(y)
+    100
+    """
+    def __init__(self, up: int = 1, down: int = 1, multistage: bool = True, max_factor: int = 10):
+        """
+        :param up: Factor to upsample by
+        :param down: Factor to downsample by
+        :param multistage: Whether large factors can be split into stages
+        :param max_factor: The largest factor a stage should have when splitting
+        """
+        if up < 1 or down < 1 or up != int(up) or down != int(down):
+            raise ValueError("up and down must be integers >= 1")
+
+        g = gcd(int(up), int(down))
+        self.up = int(up) // g
+        self.down = int(down) // g
+
+        if multistage and self.up == 1 and self.down > max_factor:
+            self.plan = [(1, i) for i in factorise(self.down, max_factor)]
+        elif multistage and self.down == 1 and self.up > max_factor:
+            # Interpolate by the small factors first so the later (more expensive) stages run at a higher rate less
+            self.plan = [(i, 1) for i in factorise(self.up, max_factor)[::-1]]
+        elif self.up == self.down == 1:
+            self.plan = []
+        else:
+            self.plan = [(self.up, self.down)]
+
+        self.stages = [_Stage(u, d) for u, d in self.plan]
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        """
+        Resamples the next block of samples. Returns as many output samples as can be worked out so far, the rest come
+        out with later blocks or flush()
+        """
+        for stage in self.stages:
+            block = stage.process(block)
+        return np.array(block, copy=not self.stages)
+
+    def flush(self) -> np.ndarray:
+        """
+        Returns the final output samples once the whole signal has been processed, and resets the resampler
+        """
+        out = np.array([], dtype=complex_dtype())
+        for stage in self.stages:
+            out = np.concatenate([stage.process(out), stage.flush()]) if len(out) else stage.flush()
+        return out
+
+    def resample(self, x: np.ndarray) -> np.ndarray:
+        """
+        Resamples a whole signal in one go
+        """
+        return np.concatenate([self.process(x), self.flush()])
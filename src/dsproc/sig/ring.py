@@ -0,0 +1,253 @@
+"""
+A single producer, multiple consumer ring buffer, for feeding one live stream to several analyses at once (e.g. an
+energy detector, an FSK demod and a QAM demod, each in its own thread) without each of them getting a copy of the
+samples.
+
+The producer copies each block in once. Every consumer has a Reader with its own cursor, and reading returns a
+read-only numpy view of the buffer, so the samples are never copied again however many consumers there are. Nothing
+the producer or the readers do on the data path takes a lock: the producer publishes how far it has written after the
+samples are in place, and each reader only looks at what has been published.
+
+The producer doesn't wait for slow readers unless asked to (write(wait=True)), so a reader that falls more than the
+capacity behind finds its samples have been overwritten. That's an overrun: the reader skips ahead to the oldest samples
+still in the buffer and counts how many it missed, or raises Overrun if it was created with on_overrun='raise'. A view
+can also be overwritten while it is still being used, which overwritten(start) checks for afterwards.
+
+To make every read a single contiguous view, the start of the buffer is mirrored after its end: the buffer holds
+capacity + max_read samples, and writes to the first max_read samples are also written to the mirror. A read that runs
+off the end of the ring carries on into the mirror instead of wrapping.
+"""
+import threading
+import weakref
+import numpy as np
+from ..util.precision import complex_dtype
+
+
+class Overrun(RuntimeError):
+    """
+    Raised when a reader has fallen so far behind that the producer has overwritten samples it hadn't read
+    """
+    def __init__(self, lost: int):
+        super().__init__(f"The ring buffer overran, {lost} samples were overwritten before they were read")
+        self.lost = lost
+
+
+class RingBuffer:
+    """
+    A single producer, multiple consumer ring buffer of complex samples, see the module docstring.
+
+    Sample positions count every sample ever written, so they keep going up as the buffer wraps and can be used as the
+    sample number of a stream.
+
+    >>> ring = RingBuffer(capacity=8, max_read=4)
+    >>> a, b = ring.reader(), ring.reader()
+    >>> ring.write(np.arange(6))
+    >>> a.read()
+    (0, array([0.+0.j, 1.+0.j, 2.+0.j, 3.+0.j], dtype=complex64))
+    >>> ring.write(np.arange(6, 12))      # Overwrites samples 0 to 3, which b hasn't read
+    >>> b.read()
+    (4, array([4.+0.j, 5.+0.j, 6.+0.j, 7.+0.j], dtype=complex64))
+    >>> b.lost, b.overruns
+    (4, 1)
+    """
+    def __init__(self, capacity: int = 2**22, max_read: int = 2**16, dtype=None):
+        """
+        :param capacity: How many samples the buffer holds
+        :param max_read: The most samples a single read can return
+        :param dtype: The type of the samples, defaults to the library's complex dtype (see dsproc.set_precision)
+        """
+        if capacity <= 0 or max_read <= 0:
+            raise ValueError("capacity and max_read must be positive")
+        if max_read > capacity:
+            raise ValueError("max_read can't be more than the capacity")
+
+        self.capacity = capacity
+        self.max_read = max_read
+        self._buffer = np.zeros(capacity + max_read, dtype=dtype or complex_dtype())
+        # What readers see. Views of it can't be written to, so one consumer can't spoil the samples for the others
+        self._view = self._buffer.view()
+        self._view.setflags(write=False)
+
+        # Samples published to readers, and samples the producer has started overwriting. They only differ during a
+        # write
+        self.written = 0
+        self._claimed = 0
+        self.closed = False
+
+        self._readers = weakref.WeakSet()
+        self._cond = threading.Condition()
+        self._producer_waiting = False
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self._buffer.dtype
+
+    @property
+    def oldest(self) -> int:
+        """
+        The position of the oldest sample still in the buffer
+        """
+        return max(self._claimed - self.capacity, 0)
+
+    def reader(self, start: str = 'latest', on_overrun: str = 'skip') -> 'Reader':
+        """
+        Makes a new consumer
+
+        :param start: 'latest' to start with the next sample written, 'oldest' to start with the oldest one still in
+            the buffer
+        :param on_overrun: What the reader does when it finds it has been overrun: 'skip' ahead and count the lost
+            samples, or 'raise' an Overrun
+        """
+        if start not in ('latest', 'oldest'):
+            raise ValueError("start must be 'latest' or 'oldest'")
+        reader = Reader(self, self.written if start == 'latest' else self.oldest, on_overrun)
+        self._readers.add(reader)
+        return reader
+
+    def overwritten(self, start: int) -> bool:
+        """
+        Whether the samples from position start on may have been overwritten. Check it after using a view to make sure
+        the producer didn't overwrite it in the meantime
+        """
+        return start < self.oldest
+
+    def _room(self, n: int) -> bool:
+        # Whether n more samples can be written without overwriting a view a reader might still be using
+        readers = list(self._readers)
+        return not readers or self.written + n - min(r.held for r in readers) <= self.capacity
+
+    def write(self, samples: np.ndarray, wait: bool = False, timeout: float = None) -> None:
+        """
+        Copies samples into the buffer and publishes them to the readers. Only one thread should write
+
+        :param samples: The samples, no more than the capacity
+        :param wait: If True, wait until every reader has finished with the samples that are about to be overwritten,
+            so nothing is lost. If False, slow readers are overrun
+        :param timeout: The most seconds to wait, raises TimeoutError if the readers haven't caught up by then
+        """
+        samples = np.asarray(samples)
+        n = len(samples)
+        if n > self.capacity:
+            raise ValueError(f"Can't write {n} samples to a ring buffer of {self.capacity}")
+        if self.closed:
+            raise ValueError("The ring buffer is closed")
+
+        if wait and not self._room(n):
+            with self._cond:
+                self._producer_waiting = True
+                try:
+                    if not self._cond.wait_for(lambda: self._room(n), timeout):
+                        raise TimeoutError("The readers didn't catch up in time")
+                finally:
+                    self._producer_waiting = False
+
+        # Readers check _claimed to see if their samples are being overwritten, so it has to move first
+        self._claimed = self.written + n
+        done = 0
+        while done < n:
+            index = (self.written + done) % self.capacity
+            m = min(n - done, self.capacity - index)
+            self._buffer[index:index + m] = samples[done:done + m]
+            if index < self.max_read:
+                mirrored = min(m, self.max_read - index)
+                self._buffer[self.capacity + index:self.capacity + index + mirrored] = samples[done:done + mirrored]
+            done += m
+        self.written += n
+
+        with self._cond:
+            self._cond.notify_all()
+
+    def close(self) -> None:
+        """
+        Marks the end of the stream. Readers get the rest of the samples and then stop
+        """
+        self.closed = True
+        with self._cond:
+            self._cond.notify_all()
+
+
+class Reader:
+    """
+    A consumer of a RingBuffer, with its own cursor. Make them with RingBuffer.reader
+    """
+    def __init__(self, ring: RingBuffer, position: int, on_overrun: str = 'skip'):
+        """
+        :param ring: The ring buffer to read
+        :param position: The position of the first sample to read
+        :param on_overrun: 'skip' or 'raise', see RingBuffer.reader
+        """
+        if on_overrun not in ('skip', 'raise'):
+            raise ValueError("on_overrun must be 'skip' or 'raise'")
+
+        self.ring = ring
+        self.position = position
+        self.on_overrun = on_overrun
+        # The start of the last view handed out, which may still be in use
+        self.held = position
+        self.overruns = 0
+        self.lost = 0
+
+    @property
+    def available(self) -> int:
+        """
+        How many samples are waiting to be read
+        """
+        return self.ring.written - self.position
+
+    def _release(self, position: int) -> None:
+        self.held = position
+        if self.ring._producer_waiting:
+            with self.ring._cond:
+                self.ring._cond.notify_all()
+
+    def read(self, n: int = None, timeout: float = None) -> tuple:
+        """
+        Returns the next samples as a read-only view of the buffer, waiting for at least one if there are none yet.
+        Reading releases the view returned last time, so the producer can overwrite it
+
+        :param n: The most samples to return, defaults to (and can't be more than) the ring's max_read
+        :param timeout: The most seconds to wait for samples, raises TimeoutError if none come
+        :return: (position of the first sample, view). The view is empty once the ring is closed and everything has
+            been read
+        """
+        ring = self.ring
+        n = min(n or ring.max_read, ring.max_read)
+        if self.position >= ring.written and not ring.closed:
+            with ring._cond:
+                if not ring._cond.wait_for(lambda: self.position < ring.written or ring.closed, timeout):
+                    raise TimeoutError("No samples were written in time")
+
+        oldest = ring.oldest
+        if self.position < oldest:
+            lost = oldest - self.position
+            self.overruns += 1
+            self.lost += lost
+            self.position = oldest
+            if self.on_overrun == 'raise':
+                self._release(self.position)
+                raise Overrun(lost)
+
+        start = self.position
+        m = min(n, ring.written - start)
+        index = start % ring.capacity
+        self.position += m
+        self._release(start)
+
+        return start, ring._view[index:index + m]
+
+    def close(self) -> None:
+        """
+        Stops the producer waiting for this reader
+        """
+        self.ring._readers.discard(self)
+        self._release(self.ring.written)
+
+    def __iter__(self):
+        """
+        Yields (position, view) until the ring is closed and everything has been read
+        """
+        while True:
+            start, view = self.read()
+            if not len(view):
+                return
+            yield start, view
@@ -0,0 +1,266 @@
+"""
+Lazy sample sources. Allows captures that are larger than memory to be opened without reading them in, and to be
+processed a block at a time.
+"""
+import os
+import numpy as np
+from ..util.precision import complex_dtype, real_dtype
+
+# Interleaved I/Q file formats, as (the type of each I and Q value, the value of full scale, the value of zero).
+# cf32 is what save_wave writes and the library's native format, cs16 and cs8 are what most SDRs produce, and cu8 is
+# the offset binary of the RTL-SDR
+FORMATS = {
+    'cf32': (np.dtype(np.float32), 1.0, 0.0),
+    'cs16': (np.dtype(np.int16), 32768.0, 0.0),
+    'cs8': (np.dtype(np.int8), 128.0, 0.0),
+    'cu8': (np.dtype(np.uint8), 127.5, 127.5),
+}
+
+
+def _format(fmt: str) -> tuple:
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown IQ format '{fmt}', must be one of {list(FORMATS)}")
+    return FORMATS[fmt]
+
+
+def guess_format(fn) -> str:
+    """
+    Guesses a capture's format from its extension (.cs8, .cs16, .cu8), defaulting to cf32 (complex64)
+    """
+    ext = os.path.splitext(str(fn))[1].lstrip('.').lower()
+    return ext if ext in FORMATS else 'cf32'
+
+
+def bytes_per_sample(fmt: str) -> int:
+    """
+    The size of one I/Q pair in a format
+    """
+    return 2 * _format(fmt)[0].itemsize
+
+
+def from_iq(raw: np.ndarray, fmt: str, full_scale: float = 1.0) -> np.ndarray:
+    """
+    Converts interleaved I/Q values to complex samples, in one vectorised pass
+
+    :param raw: The interleaved values, I then Q. Either flat or with shape (n, 2)
+    :param fmt: The format of the values, see FORMATS
+    :param full_scale: The amplitude the largest value of the format stands for
+    :return: A new complex array
+
+    >>> from_iq(np.array([127, -128, 0, 64], dtype=np.int8), 'cs8')
+    array([0.9921875-1.j , 0.       +0.5j], dtype=complex64)
+    """
+    _, scale, zero = _format(fmt)
+    values = np.asarray(raw).reshape(-1).astype(real_dtype())
+    if zero:
+        values -= real_dtype().type(zero)
+    values *= real_dtype().type(full_scale / scale)
+
+    return values.view(complex_dtype())
+
+
+def to_iq(samples: np.ndarray, fmt: str, full_scale: float = 1.0, dither: bool = False, rng=None) -> np.ndarray:
+    """
+    Converts complex samples to interleaved I/Q values. Values beyond full scale are clipped
+
+    :param samples: The complex samples
+    :param fmt: The format to convert to, see FORMATS
+    :param full_scale: The amplitude that maps to the largest value of the format
+    :param dither: If True, add triangular dither of +-1 step before rounding to an integer format. This turns the
+        rounding error into a little white noise instead of distortion that follows the signal, which matters for weak
+        signals at 8 bits
+    :param rng: A numpy Generator for the dither, for repeatable output
+    :return: A flat array of I then Q values
+
+    >>> to_iq(np.array([0.5 - 1j, 2 + 0.25j]), 'cs8')
+    array([  64, -128,  127,   32], dtype=int8)
+    """
+    dtype, scale, zero = _format(fmt)
+    values = np.asarray(samples).astype(complex_dtype()).view(real_dtype())
+    values = values * real_dtype().type(scale / full_scale)
+
+    if dtype.kind == 'f':
+        return values.astype(dtype)
+
+    if dither:
+        rng = rng or np.random.default_rng()
+        values += rng.random(len(values), dtype=values.dtype)
+        values -= rng.random(len(values), dtype=values.dtype)
+
+    values += real_dtype().type(zero)
+    info = np.iinfo(dtype)
+    np.rint(values, out=values)
+    np.clip(values, info.min, info.max, out=values)
+
+    return values.astype(dtype)
+
+
+class IQView:
+    """
+    Complex samples backed by quantised interleaved I/Q, e.g. a memory mapped cs8 file. Indexing converts just the
+    samples asked for, so slicing a block out of a huge capture only reads and converts that block. It can be used in
+    place of a sample array by anything that works a block at a time (Demod.chunks, channelize, the spectral
+    functions and the plots); np.asarray converts the whole thing.
+    """
+    def __init__(self, raw: np.ndarray, fmt: str, full_scale: float = 1.0):
+        """
+        :param raw: The I/Q values, with shape (n, 2)
+        :param fmt: Their format, see FORMATS
+        :param full_scale: The amplitude the largest value of the format stands for
+        """
+        self.raw = raw
+        self.fmt = fmt
+        self.full_scale = full_scale
+
+    @property
+    def dtype(self) -> np.dtype:
+        return complex_dtype()
+
+    @property
+    def shape(self) -> tuple:
+        return (len(self.raw),)
+
+    @property
+    def size(self) -> int:
+        return len(self.raw)
+
+    ndim = 1
+
+    def __len__(self) -> int:
+        return len(self.raw)
+
+    def __getitem__(self, item):
+        samples = from_iq(self.raw[item], self.fmt, self.full_scale)
+        return samples[0] if isinstance(item, (int, np.integer)) else samples
+
+    def __array__(self, dtype=None, copy=None):
+        samples = from_iq(self.raw, self.fmt, self.full_scale)
+        return samples if dtype is None else samples.astype(dtype)
+
+
+def read_iq(fn, fmt: str = None, offset: int = 0, count: int = -1, full_scale: float = 1.0) -> np.ndarray:
+    """
+    Reads samples from a file into memory, converting them to complex
+
+    :param fn: The file name
+    :param fmt: The format of the file, see FORMATS. Guessed from the extension if not given
+    :param offset: The sample (not byte) to start reading from
+    :param count: How many samples to read. -1 reads to the end
+    :param full_scale: The amplitude the largest value of the format stands for
+    """
+    fmt = fmt or guess_format(fn)
+    dtype = _format(fmt)[0]
+    raw = np.fromfile(fn, dtype, count=2 * count if count >= 0 else -1, offset=offset * bytes_per_sample(fmt))
+    # A truncated final sample is dropped
+    raw = raw[:len(raw) // 2 * 2]
+    if fmt == 'cf32':
+        return raw.view(np.complex64).astype(complex_dtype(), copy=False)
+
+    return from_iq(raw, fmt, full_scale)
+
+
+def write_iq(fn, samples: np.ndarray, fmt: str = None, full_scale: float = 1.0, dither: bool = False,
+             chunk_size: int = 2**20, append: bool = False) -> None:
+    """
+    Writes samples to a file as interleaved I/Q, a chunk at a time so no full size temporaries are made
+
+    :param fn: The file name
+    :param samples: The complex samples, can be a memmap or IQView
+    :param fmt: The format to write, see FORMATS. Guessed from the extension if not given
+    :param full_scale: The amplitude that maps to the largest value of the format
+    :param dither: If True, dither before rounding, see to_iq
+    :param chunk_size: How many samples to convert at a time
+    :param append: If True, add to the end of the file rather than replacing it
+    """
+    fmt = fmt or guess_format(fn)
+    with open(fn, "ab" if append else "wb") as f:
+        for _, block in iter_chunks(samples, chunk_size=chunk_size):
+            to_iq(block, fmt, full_scale, dither).tofile(f)
+
+
+def iter_chunks(samples: np.ndarray, chunk_size: int = 2**20, overlap: int = 0):
+    """
+    Iterates over an array (or memmap) in blocks. Yields tuples of (start, block) where start is the index of the first
+    sample of the block. Blocks are views, so no data is copied or read from disk until the block is used.
+
+    Each block is extended by overlap samples taken from the start of the next block. This is useful for operations that
+    consume samples, e.g. a 'valid' mode convolution with a filter of length L drops L-1 samples, so an overlap of L-1
+    makes the outputs of consecutive blocks line up exactly.
+
+    :param samples: The array to iterate over
+    :param chunk_size: How many new samples each block contains
+    :param overlap: How many samples of the following block are appended to each block
+
+    >>> [(start, block.tolist()) for start, block in iter_chunks(np.arange(7), chunk_size=3, overlap=1)]
+    [(0, [0, 1, 2, 3]), (3, [3, 4, 5, 6]), (6, [6])]
+    """
+    if chunk_size <= 0:
+        raise ValueError("chunk_size must be a positive integer")
+    if overlap < 0:
+        raise ValueError("overlap cannot be negative")
+
+    for start in range(0, len(samples), chunk_size):
+        yield start, samples[start:start + chunk_size + overlap]
+
+
+class SampleSource:
+    """
+    A memory mapped window onto a file of samples. The samples are only read from disk when they are accessed, so the
+    memory used depends on how much of the file is looked at rather than the size of the file. Files of quantised
+    I/Q (cs16, cs8, cu8) are mapped as they are and converted to complex a block at a time as they're read, see IQView.
+    """
+    def __init__(self, fn: str, offset: int = 0, count: int = -1, dtype=np.complex64, fmt: str = None,
+                 full_scale: float = 1.0):
+        """
+        :param fn: The file name of the capture
+        :param offset: The sample (not byte) to start the window at
+        :param count: How many samples the window contains. -1 uses everything after the offset
+        :param dtype: The data type of the samples in the file, for files of complex samples
+        :param fmt: The I/Q format of the file (see FORMATS). Overrides dtype if given
+        :param full_scale: The amplitude the largest value of a quantised format stands for
+        """
+        self.fn = fn
+        self.fmt = fmt
+        if fmt is not None and fmt != 'cf32':
+            self.dtype = _format(fmt)[0]
+            itemsize = bytes_per_sample(fmt)
+        else:
+            self.dtype = np.dtype(dtype)
+            itemsize = self.dtype.itemsize
+
+        total = os.path.getsize(fn) // itemsize
+        if offset < 0 or offset > total:
+            raise ValueError(f"offset must be between 0 and the number of samples in the file ({total})")
+
+        if count < 0 or offset + count > total:
+            count = total - offset
+
+        self.offset = offset
+        self.count = count
+
+        shape = (count,) if self.dtype.kind == 'c' else (count, 2)
+        # np.memmap can't map a zero length region
+        if count:
+            samples = np.memmap(fn, dtype=self.dtype, mode='r', offset=offset * itemsize, shape=shape)
+        else:
+            samples = np.zeros(shape, dtype=self.dtype)
+
+        self.samples = samples if self.dtype.kind == 'c' else IQView(samples, fmt, full_scale)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, item):
+        return self.samples[item]
+
+    def read(self, start: int = 0, stop: int = None) -> np.ndarray:
+        """
+        Reads the samples between start and stop into memory and returns them as a normal (non-mapped) array
+        """
+        return np.array(self.samples[start:stop])
+
+    def chunks(self, chunk_size: int = 2**20, overlap: int = 0):
+        """
+        Iterates over the window in blocks, see iter_chunks
+        """
+        return iter_chunks(self.samples, chunk_size=chunk_size, overlap=overlap)
@@ -0,0 +1,268 @@
+"""
+Spectral estimates that return arrays: short time FFTs, Welch power spectral densities and spectrograms.
+
+Everything works a chunk at a time, so a memory mapped capture of any length can be analysed in bounded memory, and
+stays in the library precision (complex64 by default). Windows are designed once per size and cached, and scipy's FFT
+caches its plans, so analysing many blocks of the same size only pays for the FFTs themselves.
+"""
+from functools import lru_cache
+import numpy as np
+from .source import iter_chunks
+from ..util.lazy import lazy_import
+from ..util.precision import as_complex, real_dtype
+
+signal = lazy_import("scipy.signal")
+sp_fft = lazy_import("scipy.fft")
+
+# Samples read at a time
+CHUNK_SIZE = 2**20
+
+
+@lru_cache(maxsize=32)
+def _window(name: str, nfft: int, dtype: np.dtype) -> np.ndarray:
+    w = signal.get_window(name, nfft, fftbins=True).astype(dtype)
+    w.setflags(write=False)
+    return w
+
+
+def get_window(name: str, nfft: int) -> np.ndarray:
+    """
+    Returns the named window (any name scipy.signal.get_window accepts) in the real dtype. Windows are cached, so
+    don't write to the returned array
+
+    :param name: The window, e.g. 'hann', 'boxcar' or ('kaiser', 8)
+    :param nfft: The length of the window
+    """
+    return _window(name, nfft, real_dtype())
+
+
+def frequencies(nfft: int, fs: float) -> np.ndarray:
+    """
+    The frequency of each bin of a spectrum from this module, from -fs/2 up to fs/2
+    """
+    return sp_fft.fftshift(sp_fft.fftfreq(nfft, 1 / fs))
+
+
+def iter_stft(x: np.ndarray, nfft: int = 1024, hop: int = None, window: str = 'hann', chunk_size: int = CHUNK_SIZE):
+    """
+    Short time FFTs of x, a chunk at a time. Frame m covers samples m * hop to m * hop + nfft, and only whole frames
+    are returned.
+
+    :param x: The samples, can be a memmap
+    :param nfft: The length of each frame and FFT
+    :param hop: How far apart the frames start, defaults to nfft // 2
+    :param window: The window applied to each frame
+    :param chunk_size: Roughly how many samples to work on at a time
+    :return: Yields (first frame number, spectra) where spectra has one frame per row, with the zero frequency bin in
+        the middle as for frequencies()
+    """
+    hop = hop or nfft // 2
+    w = get_window(window, nfft)
+    # Each chunk starts on a frame boundary and carries on far enough to finish its last frame
+    frames_per_chunk = max(chunk_size // hop, 1)
+    step = frames_per_chunk * hop
+    for start, block in iter_chunks(x, chunk_size=step, overlap=nfft - hop):
+        if len(block) < nfft:
+            break
+
+        frames = np.lib.stride_tricks.sliding_window_view(as_complex(block), nfft)[::hop][:frames_per_chunk]
+        spectra = sp_fft.fft(frames * w, axis=-1, overwrite_x=True)
+        yield start // hop, sp_fft.fftshift(spectra, axes=-1)
+
+
+def stft(x: np.ndarray, fs: float, nfft: int = 1024, hop: int = None, window: str = 'hann',
+         chunk_size: int = CHUNK_SIZE) -> tuple:
+    """
+    The short time FFT of x
+
+    :param x: The samples
+    :param fs: The sample rate
+    :param nfft: The length of each frame and FFT
+    :param hop: How far apart the frames start, defaults to nfft // 2
+    :param window: The window applied to each frame
+    :param chunk_size: Roughly how many samples to work on at a time
+    :return: (frequencies, times, spectra). spectra has one row per frame and one column per frequency, and times is
+        the time of the centre of each frame
+
+    >>> x = np.exp(2j * np.pi * 250 * np.arange(4096) / 1000)
+    >>> freqs, times, S = stft(x, fs=1000, nfft=256)
+    >>> S.shape, S.dtype
+    ((31, 256), dtype('complex64'))
+    >>> float(freqs[np.argmax(np.abs(S[0]))])
+    250.0
+    """
+    hop = hop or nfft // 2
+    blocks = [spectra for _, spectra in iter_stft(x, nfft, hop, window, chunk_size)]
+    spectra = np.concatenate(blocks) if blocks else np.zeros((0, nfft), dtype=as_complex(0).dtype)
+    times = (np.arange(len(spectra)) * hop + nfft / 2) / fs
+
+    return frequencies(nfft, fs), times, spectra
+
+
+class PSD:
+    """
+    A power spectral density, in power per Hz. One PSD can answer several questions about a signal (total power, the
+    power in or outside a band, the strongest frequency) without another pass over the samples.
+    """
+    def __init__(self, freqs: np.ndarray, density: np.ndarray):
+        """
+        :param freqs: The frequency of each bin, ascending
+        :param density: The power per Hz in each bin
+        """
+        self.freqs = freqs
+        self.density = density
+
+    @property
+    def df(self) -> float:
+        """
+        The width of each bin in Hz
+        """
+        return float(self.freqs[1] - self.freqs[0]) if len(self.freqs) > 1 else 0.0
+
+    def band_power(self, low: float = -np.inf, high: float = np.inf) -> np.floating:
+        """
+        The power between two frequencies
+        """
+        mask = (self.freqs >= low) & (self.freqs <= high)
+        return self.density[mask].sum(dtype=self.density.dtype) * self.density.dtype.type(self.df)
+
+    def total_power(self) -> np.floating:
+        """
+        The power of the whole signal
+        """
+        return self.band_power()
+
+    def peak(self) -> float:
+        """
+        The frequency of the strongest bin
+        """
+        return float(self.freqs[np.argmax(self.density)])
+
+    def amplitude(self) -> np.ndarray:
+        """
+        The amplitude spectral density, the square root of the PSD
+        """
+        return np.sqrt(self.density)
+
+
+class Welch:
+    """
+    Welch's method: the PSD is the average of the power spectra of overlapping, windowed frames. Feed the samples in
+    with update, a block at a time if need be, and call result for the PSD. Frames run across block boundaries, so
+    the result doesn't depend on how the samples were split up.
+
+    The scaling matches scipy.signal.welch with return_onesided=False and detrend=False, but the bins are ordered from
+    -fs/2 to fs/2.
+
+    >>> x = np.exp(2j * np.pi * 100 * np.arange(10000) / 1000)
+    >>> w = Welch(fs=1000, nfft=200)
+    >>> for block in np.array_split(x, 7):
+    ...     w.update(block)
+    >>> psd = w.result()
+    >>> psd.peak(), round(float(psd.total_power()), 3)
+    (100.0, 1.0)
+    """
+    def __init__(self, fs: float, nfft: int = 1024, hop: int = None, window: str = 'hann'):
+        """
+        :param fs: The sample rate
+        :param nfft: The length of each frame and FFT, which sets the frequency resolution to fs / nfft
+        :param hop: How far apart the frames start, defaults to nfft // 2
+        :param window: The window applied to each frame
+        """
+        self.fs = fs
+        self.nfft = nfft
+        self.hop = hop or nfft // 2
+        self.window = window
+        self.frames = 0
+        self._power = np.zeros(nfft)
+        self._buffer = np.zeros(0, dtype=as_complex(0).dtype)
+
+    def update(self, block: np.ndarray) -> None:
+        """
+        Adds the frames that the next block of samples completes
+        """
+        buffer = np.concatenate([self._buffer, as_complex(block)])
+        for _, spectra in iter_stft(buffer, self.nfft, self.hop, self.window):
+            self._power += np.sum(np.abs(spectra) ** 2, axis=0)
+            self.frames += len(spectra)
+
+        # Keep the samples that the next frame still needs
+        if len(buffer) >= self.nfft:
+            used = (len(buffer) - self.nfft) // self.hop * self.hop + self.hop
+            buffer = buffer[used:]
+        self._buffer = buffer
+
+    def result(self) -> PSD:
+        """
+        The PSD of the samples so far. If there weren't enough samples for a whole frame, what there is is zero padded
+        into one
+        """
+        power, frames = self._power, self.frames
+        if not frames:
+            padded = np.zeros(self.nfft, dtype=self._buffer.dtype)
+            padded[:len(self._buffer)] = self._buffer
+            _, spectra = next(iter_stft(padded, self.nfft, self.hop, self.window))
+            power, frames = np.abs(spectra[0]) ** 2, 1
+
+        w = get_window(self.window, self.nfft).astype(np.float64)
+        density = power / (frames * self.fs * np.sum(w ** 2))
+
+        return PSD(frequencies(self.nfft, self.fs), density.astype(real_dtype()))
+
+
+def welch(x: np.ndarray, fs: float, nfft: int = 1024, hop: int = None, window: str = 'hann',
+          chunk_size: int = CHUNK_SIZE) -> PSD:
+    """
+    The PSD of x by Welch's method, see Welch. If x is shorter than nfft, the whole of x is used as a single frame
+
+    :param x: The samples, can be a memmap
+    :param fs: The sample rate
+    :param nfft: The length of each frame and FFT
+    :param hop: How far apart the frames start, defaults to nfft // 2
+    :param window: The window applied to each frame
+    :param chunk_size: How many samples to work on at a time
+    """
+    nfft = max(min(nfft, len(x)), 1)
+    w = Welch(fs, nfft, hop, window)
+    for _, block in iter_chunks(x, chunk_size=chunk_size):
+        w.update(block)
+
+    return w.result()
+
+
+def spectrogram(x: np.ndarray, fs: float, nfft: int = 1024, hop: int = None, window: str = 'hann',
+                max_frames: int = 2000, chunk_size: int = CHUNK_SIZE) -> tuple:
+    """
+    The power in each frame of a short time FFT, in power per Hz. When there would be more than max_frames frames,
+    neighbouring frames are averaged together so a spectrogram of a long capture stays a sensible size.
+
+    :param x: The samples, can be a memmap
+    :param fs: The sample rate
+    :param nfft: The length of each frame and FFT
+    :param hop: How far apart the frames start, defaults to nfft // 2
+    :param window: The window applied to each frame
+    :param max_frames: The most frames to return
+    :param chunk_size: Roughly how many samples to work on at a time
+    :return: (frequencies, times, power) where power has one row per (averaged) frame
+    """
+    hop = hop or nfft // 2
+    n_frames = max((len(x) - nfft) // hop + 1, 0)
+    group = max(-(-n_frames // max_frames), 1)
+    scale = 1 / (fs * np.sum(get_window(window, nfft).astype(np.float64) ** 2))
+
+    rows = []
+    leftover = np.zeros((0, nfft), dtype=real_dtype())
+    # Chunks that hold a whole number of groups, so groups don't need stitching together
+    chunk_size = max(chunk_size // (group * hop), 1) * group * hop
+    for _, spectra in iter_stft(x, nfft, hop, window, chunk_size):
+        power = np.concatenate([leftover, np.abs(spectra) ** 2])
+        whole = len(power) // group * group
+        rows.append(power[:whole].reshape(-1, group, nfft).mean(axis=1))
+        leftover = power[whole:]
+    if len(leftover):
+        rows.append(leftover.mean(axis=0, keepdims=True))
+
+    power = np.concatenate(rows) * real_dtype().type(scale) if rows else np.zeros((0, nfft), dtype=real_dtype())
+    times = (np.arange(len(power)) * group * hop + (group - 1) * hop / 2 + nfft / 2) / fs
+
+    return frequencies(nfft, fs), times, power
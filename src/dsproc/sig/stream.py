@@ -0,0 +1,625 @@
+"""
+Live sample streams, with asyncio. A stream source produces blocks of complex samples stamped with their sample number
+and capture time, and a stream sink consumes them. Without an SDR attached, a source can replay an array or a capture
+file at real time (or any other) speed, or receive samples from a local TCP or UDP socket that a SocketSink (e.g. fed
+by Mod.stream) is sending to, so receive chains can be exercised and benchmarked at real SDR rates without hardware.
+
+    async with FileSource("capture.cs16", speed=1.0, overflow='drop') as source:
+        async for block in source:
+            ...
+        print(source.stats.dropped)
+
+Sources put blocks on a bounded queue for the consumer. When the consumer falls behind and the queue fills up, the
+source either waits for room (overflow='block', backpressure, which is what a file or a TCP connection can do) or drops
+the block and counts it (overflow='drop', which is what a real receiver does when its buffers overrun). Blocks after a
+drop start later than the previous block finished, so the consumer can see the gap. Both are counted in the source's
+StreamStats, along with how long the source spent waiting and the deepest the queue got.
+
+asyncio is imported the first time a stream is started, so importing dsproc doesn't pay for it.
+"""
+import struct
+import time
+import numpy as np
+from .source import SampleSource, FORMATS, bytes_per_sample, from_iq, to_iq, guess_format, iter_chunks
+from .capture import Capture, CaptureWriter, has_sidecar
+from ..util.lazy import lazy_import
+from ..util.precision import complex_dtype
+
+asyncio = lazy_import("asyncio")
+
+# UDP datagrams start with the sample number of their first sample, so a receiver can tell when some went missing
+UDP_HEADER = struct.Struct("<Q")
+
+# The largest payload of a UDP datagram
+MAX_DATAGRAM = 65507
+
+
+class Block:
+    """
+    A block of samples from a stream
+    """
+    __slots__ = ("samples", "start", "time", "received")
+
+    def __init__(self, samples: np.ndarray, start: int, time: float, received: float):
+        """
+        :param samples: The complex samples
+        :param start: The sample number of the first sample, counted from the start of the stream
+        :param time: When the first sample was captured, in seconds since the epoch
+        :param received: When the block was queued, by the event loop's clock, for measuring latency
+        """
+        self.samples = samples
+        self.start = start
+        self.time = time
+        self.received = received
+
+    @property
+    def stop(self) -> int:
+        """
+        The sample number after the last sample
+        """
+        return self.start + len(self.samples)
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+
+class StreamStats:
+    """
+    Counters for a stream. For a source, blocks and samples count what was handed to the consumer
+    """
+    def __init__(self):
+        self.blocks = 0
+        self.samples = 0
+        # Blocks (and their samples) lost because the queue was full, or that never arrived
+        self.dropped = 0
+        self.dropped_samples = 0
+        # The most blocks waiting in the queue at once
+        self.max_backlog = 0
+        # Seconds spent waiting because the other end couldn't keep up
+        self.waited = 0.0
+        self.started = None
+        self.finished = None
+
+    @property
+    def elapsed(self) -> float:
+        """
+        Seconds from the start of the stream until it finished (or until now, if it hasn't)
+        """
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.perf_counter()) - self.started
+
+    @property
+    def rate(self) -> float:
+        """
+        The throughput in samples per second
+        """
+        return self.samples / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self) -> dict:
+        return {"blocks": self.blocks, "samples": self.samples, "dropped": self.dropped,
+                "dropped_samples": self.dropped_samples, "max_backlog": self.max_backlog, "waited": self.waited,
+                "elapsed": self.elapsed, "rate": self.rate}
+
+
+async def pace(started: float, samples: int, fs: float, speed: float = None) -> None:
+    """
+    Sleeps until a stream running at speed times real time would have got through the given number of samples. With
+    no speed, just gives the event loop a chance to run other tasks
+
+    :param started: When the stream started, by the event loop's clock
+    :param samples: Samples sent or received so far
+    :param fs: The sample rate
+    :param speed: 1.0 for real time, 2.0 for twice as fast, None for as fast as possible
+    """
+    delay = started + samples / (fs * speed) - asyncio.get_running_loop().time() if speed else 0
+    await asyncio.sleep(max(delay, 0))
+
+
+class StreamSource:
+    """
+    The base of the stream sources. Subclasses implement _produce, which hands blocks over with _put (or _put_nowait
+    from a callback that can't wait), and can open and close their resources in _open and _close. Iterate over a
+    source with async for, which starts it if it hasn't been already
+    """
+    def __init__(self, fs: float, block_size: int = 2**14, queue_size: int = 16, overflow: str = 'block',
+                 start_time: float = None):
+        """
+        :param fs: The sample rate
+        :param block_size: How many samples in each block
+        :param queue_size: How many blocks can wait for the consumer
+        :param overflow: What to do when the queue is full: 'block' waits for room, 'drop' drops the block
+        :param start_time: When the first sample was captured, in seconds since the epoch. Defaults to when the stream
+            starts
+        """
+        if overflow not in ('block', 'drop'):
+            raise ValueError("overflow must be 'block' or 'drop'")
+        if block_size <= 0 or queue_size <= 0:
+            raise ValueError("block_size and queue_size must be positive")
+
+        self.fs = fs
+        self.block_size = block_size
+        self.queue_size = queue_size
+        self.overflow = overflow
+        self.start_time = start_time
+        self.stats = StreamStats()
+        self._next = 0
+        self._queue = None
+        self._task = None
+        self._error = None
+
+    @property
+    def backlog(self) -> int:
+        """
+        How many blocks are waiting for the consumer
+        """
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def _open(self) -> None:
+        pass
+
+    async def _produce(self) -> None:
+        raise NotImplementedError
+
+    async def _close(self) -> None:
+        pass
+
+    def _block(self, samples: np.ndarray, start: int = None) -> Block:
+        start = self._next if start is None else start
+        if start > self._next:
+            # Samples that never arrived
+            self.stats.dropped += 1
+            self.stats.dropped_samples += start - self._next
+        self._next = max(self._next, start + len(samples))
+        if self.start_time is None:
+            self.start_time = time.time() - start / self.fs
+
+        return Block(samples, start, self.start_time + start / self.fs, asyncio.get_running_loop().time())
+
+    def _drop(self, block: Block) -> None:
+        self.stats.dropped += 1
+        self.stats.dropped_samples += len(block)
+
+    async def _put(self, samples: np.ndarray, start: int = None) -> None:
+        """
+        Queues a block for the consumer, waiting for room or dropping it if the queue is full
+
+        :param samples: The samples
+        :param start: The sample number of the first sample, defaults to following on from the last block
+        """
+        block = self._block(samples, start)
+        if not self._queue.full():
+            self._queue.put_nowait(block)
+        elif self.overflow == 'drop':
+            self._drop(block)
+        else:
+            waiting = time.perf_counter()
+            await self._queue.put(block)
+            self.stats.waited += time.perf_counter() - waiting
+        self.stats.max_backlog = max(self.stats.max_backlog, self._queue.qsize())
+
+    def _put_nowait(self, samples: np.ndarray, start: int = None) -> None:
+        """
+        Queues a block for the consumer, dropping it if the queue is full whatever overflow is
+        """
+        block = self._block(samples, start)
+        if self._queue.full():
+            self._drop(block)
+        else:
+            self._queue.put_nowait(block)
+        self.stats.max_backlog = max(self.stats.max_backlog, self._queue.qsize())
+
+    async def _run(self) -> None:
+        try:
+            await self._produce()
+        except Exception as e:
+            # Handed to the consumer when it gets to the end of the queue
+            self._error = e
+        finally:
+            await self._close()
+        await self._queue.put(None)
+
+    async def start(self) -> None:
+        """
+        Opens the source and starts producing blocks
+        """
+        if self._task is not None:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self.stats.started = time.perf_counter()
+        await self._open()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        Stops producing blocks and closes the source. Blocks still in the queue are thrown away
+        """
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self.stats.finished is None:
+            self.stats.finished = time.perf_counter()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> Block:
+        if self._task is None:
+            await self.start()
+        if self._task.done() and self._queue.empty():
+            raise StopAsyncIteration
+
+        block = await self._queue.get()
+        if block is None:
+            self.stats.finished = time.perf_counter()
+            if self._error is not None:
+                raise self._error
+            raise StopAsyncIteration
+
+        self.stats.blocks += 1
+        self.stats.samples += len(block)
+        return block
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+
+class ReplaySource(StreamSource):
+    """
+    Replays samples (an array, memmap or IQView) as a stream
+
+    >>> async def total(source):
+    ...     return sum([len(block) async for block in source])
+    >>> asyncio.run(total(ReplaySource(np.ones(10000), fs=1e6, block_size=4096)))
+    10000
+    """
+    def __init__(self, samples: np.ndarray, fs: float, block_size: int = 2**14, speed: float = None,
+                 repeat: int = 1, **kwargs):
+        """
+        :param samples: The samples to replay
+        :param fs: The sample rate
+        :param block_size: How many samples in each block
+        :param speed: How fast to replay them: 1.0 for real time, None for as fast as the consumer takes them
+        :param repeat: How many times to play the samples through, None to loop until stopped
+        :param kwargs: queue_size, overflow and start_time, see StreamSource
+        """
+        super().__init__(fs, block_size, **kwargs)
+        self.samples = samples
+        self.speed = speed
+        self.repeat = repeat
+
+    async def _produce(self) -> None:
+        started = asyncio.get_running_loop().time()
+        played = 0
+        while self.repeat is None or played < self.repeat:
+            for _, block in iter_chunks(self.samples, chunk_size=self.block_size):
+                # A copy, so blocks don't hold on to the file of a memory mapped capture
+                block = np.array(block, dtype=complex_dtype())
+                await pace(started, self._next + len(block), self.fs, self.speed)
+                await self._put(block)
+            played += 1
+
+
+class FileSource(ReplaySource):
+    """
+    Replays a capture file as a stream. fs, the format and the start time are taken from the capture's sidecar if it
+    has one (see dsproc.sig.capture). The file is memory mapped, so only the block being sent is read
+    """
+    def __init__(self, fn, fs: float = None, fmt: str = None, full_scale: float = 1.0, **kwargs):
+        """
+        :param fn: The file name
+        :param fs: The sample rate, only needed without a sidecar
+        :param fmt: The format of the file without a sidecar, guessed from the extension if not given
+        :param full_scale: The amplitude full scale stands for in a quantised file without a sidecar
+        :param kwargs: block_size, speed, repeat, queue_size and overflow, see ReplaySource and StreamSource
+        """
+        if has_sidecar(fn):
+            capture = Capture(fn)
+            start_time = capture.start_time.timestamp() if capture.start_time else None
+            fs = fs or capture.fs
+            samples = capture.samples
+            kwargs.setdefault("start_time", start_time)
+        else:
+            samples = SampleSource(fn, fmt=fmt or guess_format(fn), full_scale=full_scale).samples
+        if not fs:
+            raise ValueError("fs is needed for a file without a sidecar")
+
+        super().__init__(samples, fs, **kwargs)
+        self.fn = fn
+
+
+class _DatagramReceiver:
+    """
+    Hands the datagrams of a UDP socket to a SocketSource
+    """
+    def __init__(self, source):
+        self.source = source
+        self.finished = asyncio.get_running_loop().create_future()
+
+    def connection_made(self, transport):
+        pass
+
+    def datagram_received(self, data, addr):
+        if self.finished.done():
+            return
+        start, = UDP_HEADER.unpack_from(data)
+        if len(data) == UDP_HEADER.size:
+            # An empty datagram marks the end of the stream
+            self.finished.set_result(None)
+            return
+        self.source._put_nowait(self.source._decode(data[UDP_HEADER.size:]), start)
+
+    def error_received(self, exc):
+        pass
+
+    def connection_lost(self, exc):
+        if not self.finished.done():
+            self.finished.set_result(None)
+
+
+class SocketSource(StreamSource):
+    """
+    Receives interleaved I/Q samples from a local TCP or UDP socket, e.g. from a SocketSink. The source listens on the
+    port and a sender connects (TCP) or sends datagrams (UDP) to it. Use port 0 to pick a free port, which is in port
+    once the source has started.
+
+    Over TCP the stream ends when the sender closes the connection, and a full queue makes the sender wait (with
+    overflow='block'). Each UDP datagram is one block, starting with its sample number (see UDP_HEADER) so datagrams
+    the network lost are counted as dropped. UDP can't make the sender wait, so blocks are dropped when the queue is
+    full, and the stream ends with a datagram that has no samples.
+    """
+    def __init__(self, fs: float, host: str = "127.0.0.1", port: int = 0, protocol: str = 'tcp', fmt: str = 'cf32',
+                 full_scale: float = 1.0, block_size: int = 2**14, **kwargs):
+        """
+        :param fs: The sample rate
+        :param host: The address to listen on
+        :param port: The port to listen on, 0 for any free port
+        :param protocol: 'tcp' or 'udp'
+        :param fmt: The format of the samples, see dsproc.sig.source.FORMATS
+        :param full_scale: The amplitude full scale stands for, for the quantised formats
+        :param block_size: How many samples in each block, for TCP
+        :param kwargs: queue_size, overflow and start_time, see StreamSource
+        """
+        if protocol not in ('tcp', 'udp'):
+            raise ValueError("protocol must be 'tcp' or 'udp'")
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown IQ format '{fmt}', must be one of {list(FORMATS)}")
+
+        super().__init__(fs, block_size, **kwargs)
+        self.host = host
+        self.port = port
+        self.protocol = protocol
+        self.fmt = fmt
+        self.full_scale = full_scale
+        self._server = None
+        self._transport = None
+        self._receiver = None
+        self._connection = None
+
+    def _decode(self, data: bytes) -> np.ndarray:
+        raw = np.frombuffer(data, dtype=FORMATS[self.fmt][0])
+        return from_iq(raw[:len(raw) // 2 * 2], self.fmt, self.full_scale)
+
+    async def _open(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self.protocol == 'tcp':
+            self._connection = loop.create_future()
+
+            def connected(reader, writer):
+                if not self._connection.done():
+                    self._connection.set_result((reader, writer))
+                else:
+                    writer.close()
+
+            self._server = await asyncio.start_server(connected, self.host, self.port)
+            self.port = self._server.sockets[0].getsockname()[1]
+        else:
+            self._receiver = _DatagramReceiver(self)
+            self._transport, _ = await loop.create_datagram_endpoint(lambda: self._receiver,
+                                                                     local_addr=(self.host, self.port))
+            self.port = self._transport.get_extra_info("sockname")[1]
+
+    async def _produce(self) -> None:
+        if self.protocol == 'udp':
+            await self._receiver.finished
+            return
+
+        reader, writer = await self._connection
+        size = self.block_size * bytes_per_sample(self.fmt)
+        try:
+            while True:
+                try:
+                    data = await reader.readexactly(size)
+                except asyncio.IncompleteReadError as e:
+                    # The sender has finished, keep the whole samples of what's left
+                    partial = e.partial[:len(e.partial) // bytes_per_sample(self.fmt) * bytes_per_sample(self.fmt)]
+                    if partial:
+                        await self._put(self._decode(partial))
+                    break
+                await self._put(self._decode(data))
+        finally:
+            writer.close()
+
+    async def _close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+        if self._transport is not None:
+            self._transport.close()
+
+
+class StreamSink:
+    """
+    The base of the stream sinks. Subclasses implement _open, _write and _close. Sinks are opened by their first write,
+    or by using them as an async context manager
+    """
+    def __init__(self):
+        self.stats = StreamStats()
+        self._opened = False
+
+    async def _open(self) -> None:
+        pass
+
+    async def _write(self, samples: np.ndarray, start: int) -> None:
+        raise NotImplementedError
+
+    async def _close(self) -> None:
+        pass
+
+    async def open(self) -> None:
+        if not self._opened:
+            self._opened = True
+            self.stats.started = time.perf_counter()
+            await self._open()
+
+    async def write(self, block: np.ndarray | Block) -> None:
+        """
+        Consumes a block of samples, waiting if the other end can't keep up
+
+        :param block: A Block from a source, or an array of samples
+        """
+        await self.open()
+        samples, start = (block.samples, block.start) if isinstance(block, Block) else (block, self.stats.samples)
+        await self._write(samples, start)
+        self.stats.blocks += 1
+        self.stats.samples += len(samples)
+
+    async def send(self, samples: np.ndarray, fs: float, block_size: int = 2**14, speed: float = None) -> None:
+        """
+        Writes samples a block at a time, like a transmitter sending them
+
+        :param samples: The samples, can be a memmap
+        :param fs: The sample rate
+        :param block_size: How many samples to write at a time
+        :param speed: How fast to send them: 1.0 for real time, None for as fast as the sink takes them
+        """
+        await self.open()
+        started = asyncio.get_running_loop().time()
+        for start, block in iter_chunks(samples, chunk_size=block_size):
+            await pace(started, start, fs, speed)
+            await self.write(block)
+
+    async def close(self) -> None:
+        if self._opened:
+            self._opened = False
+            await self._close()
+            self.stats.finished = time.perf_counter()
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+class SocketSink(StreamSink):
+    """
+    Sends samples to a SocketSource as interleaved I/Q, over TCP or UDP. Over TCP, writes wait while the receiver is
+    behind. Over UDP each packet_size samples are sent as a datagram, and nothing waits
+    """
+    def __init__(self, port: int, host: str = "127.0.0.1", protocol: str = 'tcp', fmt: str = 'cf32',
+                 full_scale: float = 1.0, packet_size: int = 1024):
+        """
+        :param port: The port the receiver is listening on
+        :param host: The address of the receiver
+        :param protocol: 'tcp' or 'udp'
+        :param fmt: The format to send the samples in, see dsproc.sig.source.FORMATS
+        :param full_scale: The amplitude that maps to full scale, for the quantised formats
+        :param packet_size: The samples in each UDP datagram
+        """
+        if protocol not in ('tcp', 'udp'):
+            raise ValueError("protocol must be 'tcp' or 'udp'")
+        if protocol == 'udp' and UDP_HEADER.size + packet_size * bytes_per_sample(fmt) > MAX_DATAGRAM:
+            raise ValueError(f"packet_size is too big for a UDP datagram of {fmt} samples")
+
+        super().__init__()
+        self.host = host
+        self.port = port
+        self.protocol = protocol
+        self.fmt = fmt
+        self.full_scale = full_scale
+        self.packet_size = packet_size
+        self._writer = None
+        self._transport = None
+
+    async def _open(self) -> None:
+        if self.protocol == 'tcp':
+            _, self._writer = await asyncio.open_connection(self.host, self.port)
+        else:
+            self._transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+                asyncio.DatagramProtocol, remote_addr=(self.host, self.port))
+
+    async def _write(self, samples: np.ndarray, start: int) -> None:
+        if self.protocol == 'tcp':
+            self._writer.write(to_iq(samples, self.fmt, self.full_scale).tobytes())
+            waiting = time.perf_counter()
+            await self._writer.drain()
+            self.stats.waited += time.perf_counter() - waiting
+            return
+
+        for i in range(0, len(samples), self.packet_size):
+            payload = to_iq(samples[i:i + self.packet_size], self.fmt, self.full_scale).tobytes()
+            self._transport.sendto(UDP_HEADER.pack(start + i) + payload)
+            # Let the receiver have a go, so loopback replays don't overrun its socket buffer
+            await asyncio.sleep(0)
+
+    async def _close(self) -> None:
+        if self.protocol == 'tcp':
+            self._writer.close()
+            await self._writer.wait_closed()
+        else:
+            self._transport.sendto(UDP_HEADER.pack(self.stats.samples))
+            self._transport.close()
+
+
+class CaptureSink(StreamSink):
+    """
+    Writes a stream to a capture, see dsproc.sig.capture.CaptureWriter. Where blocks were dropped, the gap is
+    annotated as 'dropped' so the samples either side of it aren't mistaken for continuous
+    """
+    def __init__(self, fn, fs: float, **kwargs):
+        """
+        :param fn: The name of the data file
+        :param fs: The sample rate
+        :param kwargs: Passed on to CaptureWriter, e.g. f, fmt or append
+        """
+        super().__init__()
+        self.fn = fn
+        self.fs = fs
+        self.kwargs = kwargs
+        self.writer = None
+        self._next = None
+
+    async def _open(self) -> None:
+        self.writer = CaptureWriter(self.fn, fs=self.fs, **self.kwargs)
+
+    async def _write(self, samples: np.ndarray, start: int) -> None:
+        if self._next is not None and start > self._next:
+            self.writer.annotate(self.writer.count, self.writer.count, "dropped", samples=start - self._next)
+        self._next = start + len(samples)
+        self.writer.write(samples)
+
+    async def _close(self) -> None:
+        self.writer.close()
+
+
+async def replay(source: StreamSource, sink: StreamSink) -> StreamStats:
+    """
+    Passes every block from a source to a sink, e.g. a FileSource to a SocketSink to feed a capture to a receive chain
+    over a socket. The sink is closed at the end
+
+    :return: The source's stats
+    """
+    async with sink:
+        async for block in source:
+            await sink.write(block)
+    await source.stop()
+
+    return source.stats
@@ -0,0 +1,199 @@
+"""
+Convolution engine shared by the filtering and averaging functions. Picks between a direct convolution, a single FFT
+and overlap-save FFT convolution depending on the lengths of the inputs.
+"""
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from .lazy import lazy_import
+
+sp_fft = lazy_import("scipy.fft")
+signal = lazy_import("scipy.signal")
+
+# Below this many filter taps a direct convolution is always used
+DIRECT_MAX_TAPS = 16
+# Relative cost of one FFT butterfly compared to one multiply-add of a direct convolution. Measured with
+# benchmarks/bench_convolve.py (complex64 signals of 1e4 to 1e6 samples, 8 to 4096 taps, one core): every value from
+# 0.25 to 1.0 picks the same methods, which take on average 1.09 times as long as the fastest method. 1.5 and above
+# pick a single FFT too often (1.2 times, rising with the cost)
+FFT_COST = 1.0
+# How many overlap-save blocks are transformed at once. Bounds the memory used to about this many FFT lengths
+OLS_BATCH = 32
+
+
+def _work_dtype(x: np.ndarray, h: np.ndarray) -> np.dtype:
+    """
+    The dtype to do the convolution in. Single precision inputs stay single precision, rather than being promoted by
+    the (usually float64) filter taps.
+    """
+    dtype = np.result_type(x.dtype, h.dtype, np.float32)
+    if x.dtype in (np.float32, np.complex64):
+        dtype = np.complex64 if np.iscomplexobj(x) or np.iscomplexobj(h) else np.float32
+
+    return np.dtype(dtype)
+
+
+def ols_fft_len(m: int) -> int:
+    """
+    The FFT length used by overlap-save for a filter with m taps
+    """
+    return sp_fft.next_fast_len(max(8 * m, 1024))
+
+
+def choose_method(n: int, m: int) -> str:
+    """
+    Picks the cheapest way to convolve an array of length n with one of length m, using a rough count of the operations
+    each method needs.
+
+    :return: 'direct', 'fft' or 'overlap-save'
+
+    >>> choose_method(1000, 11)
+    'direct'
+    >>> choose_method(10000, 5000)
+    'fft'
+    >>> choose_method(10**7, 1001)
+    'overlap-save'
+    """
+    n, m = max(n, m), min(n, m)
+    if m <= DIRECT_MAX_TAPS:
+        return 'direct'
+
+    full_len = n + m - 1
+    costs = {'direct': n * m}
+
+    fft_len = sp_fft.next_fast_len(full_len)
+    costs['fft'] = FFT_COST * 3 * fft_len * np.log2(fft_len)
+
+    block = ols_fft_len(m)
+    if block < full_len:
+        n_blocks = int(np.ceil(full_len / (block - m + 1)))
+        costs['overlap-save'] = FFT_COST * 2 * n_blocks * block * np.log2(block)
+
+    return min(costs, key=costs.get)
+
+
+def _fft_convolve(x, h, dtype):
+    full_len = len(x) + len(h) - 1
+    fft_len = sp_fft.next_fast_len(full_len)
+
+    if np.issubdtype(dtype, np.complexfloating):
+        y = sp_fft.ifft(sp_fft.fft(x, fft_len) * sp_fft.fft(h, fft_len))
+    else:
+        y = sp_fft.irfft(sp_fft.rfft(x, fft_len) * sp_fft.rfft(h, fft_len), fft_len)
+
+    return y[:full_len]
+
+
+def _overlap_save(x, h, dtype):
+    m = len(h)
+    full_len = len(x) + m - 1
+    block = ols_fft_len(m)
+    step = block - m + 1
+    complex_data = np.issubdtype(dtype, np.complexfloating)
+
+    # Pad so that every output sample of the full convolution falls in some block
+    n_blocks = int(np.ceil(full_len / step))
+    padded = np.zeros(n_blocks * step + m - 1, dtype=dtype)
+    padded[m - 1:m - 1 + len(x)] = x
+    segments = sliding_window_view(padded, block)[::step]
+
+    if complex_data:
+        H = sp_fft.fft(h, block)
+    else:
+        H = sp_fft.rfft(h, block)
+
+    out = np.empty(n_blocks * step, dtype=dtype)
+    for i in range(0, n_blocks, OLS_BATCH):
+        batch = segments[i:i + OLS_BATCH]
+        if complex_data:
+            y = sp_fft.ifft(sp_fft.fft(batch, axis=-1) * H, axis=-1)
+        else:
+            y = sp_fft.irfft(sp_fft.rfft(batch, axis=-1) * H, block, axis=-1)
+        # The first m - 1 samples of each block are wrapped around, the rest are good
+        out[i * step:(i + len(batch)) * step] = y[:, m - 1:].ravel()
+
+    return out[:full_len]
+
+
+def convolve(x: np.ndarray, h: np.ndarray, mode: str = 'full', method: str = 'auto') -> np.ndarray:
+    """
+    Convolves x with h. A drop in replacement for np.convolve that uses FFTs when they are faster, and keeps single
+    precision (float32/complex64) inputs in single precision.
+
+    :param x: 1d array, or a 2d array of shape (channels, n) to convolve every row with h
+    :param h: 1d array, typically the filter taps
+    :param mode: 'full', 'same' or 'valid', as in np.convolve
+    :param method: 'auto', 'direct', 'fft' or 'overlap-save'. 'auto' picks with choose_method
+    :return: The convolution
+
+    >>> x = np.arange(5, dtype=np.float32)
+    >>> convolve(x, np.ones(3), mode='valid')
+    array([3., 6., 9.], dtype=float32)
+    >>> np.allclose(convolve(x, np.ones(3), method='fft'), np.convolve(x, np.ones(3)), atol=1e-5)
+    True
+    """
+    x = np.asarray(x)
+    h = np.asarray(h)
+    if x.ndim == 2 and h.ndim == 1:
+        return _convolve_rows(x, h, mode, method)
+    if x.ndim != 1 or h.ndim != 1:
+        raise ValueError("x and h must be one dimensional")
+    if len(x) == 0 or len(h) == 0:
+        raise ValueError("x and h cannot be empty")
+    if mode not in ('full', 'same', 'valid'):
+        raise ValueError("mode must be 'full', 'same' or 'valid'")
+
+    dtype = _work_dtype(x, h)
+    # Convolution is commutative, so put the longer array first
+    if len(h) > len(x):
+        x, h = h, x
+    x = x.astype(dtype, copy=False)
+    h = h.astype(dtype, copy=False)
+
+    if method == 'auto':
+        method = choose_method(len(x), len(h))
+
+    if method == 'direct':
+        return np.convolve(x, h, mode=mode)
+    if method == 'fft':
+        y = _fft_convolve(x, h, dtype)
+    elif method == 'overlap-save':
+        y = _overlap_save(x, h, dtype)
+    else:
+        raise ValueError("method must be 'auto', 'direct', 'fft' or 'overlap-save'")
+
+    y = y.astype(dtype, copy=False)
+    n, m = len(x), len(h)
+    if mode == 'same':
+        start = (m - 1) // 2
+        return y[start:start + n]
+    if mode == 'valid':
+        return y[m - 1:n]
+
+    return y
+
+
+def _convolve_rows(x, h, mode, method):
+    """
+    Convolves every row of x with h, in one call rather than a python loop over the rows. The method is picked the same
+    way as for a single row.
+    """
+    if x.shape[-1] == 0 or len(h) == 0:
+        raise ValueError("x and h cannot be empty")
+    if mode not in ('full', 'same', 'valid'):
+        raise ValueError("mode must be 'full', 'same' or 'valid'")
+
+    dtype = _work_dtype(x, h)
+    x = x.astype(dtype, copy=False)
+    h = h.astype(dtype, copy=False)[None, :]
+
+    if method == 'auto':
+        method = choose_method(x.shape[-1], h.shape[-1])
+
+    if method == 'direct':
+        y = signal.convolve(x, h, mode=mode, method='direct')
+    elif method in ('fft', 'overlap-save'):
+        y = signal.oaconvolve(x, h, mode=mode, axes=-1)
+    else:
+        raise ValueError("method must be 'auto', 'direct', 'fft' or 'overlap-save'")
+
+    return y.astype(dtype, copy=False)
@@ -0,0 +1,443 @@
+"""
+Kernels for the routines that are loops at heart: linear feedback shift registers, CRCs, prefix code decoding, the
+peak replacement in FSK demodulation and markify. Each kernel comes in two versions, which give the same results down
+to the last bit:
+
+    - A plain loop, written so that numba can compile it. With the 'numba' backend it's compiled (and cached on disk)
+      the first time it's used, with the 'python' backend it runs as it is, which is slow but handy for checking.
+    - A vectorised numpy version, the 'numpy' backend, for when numba isn't installed.
+
+numba is optional and is only imported when a kernel is first compiled, so importing dsproc doesn't pay for it. The
+backend defaults to numba if it's installed and numpy otherwise, and can be changed at any time with set_backend.
+"""
+from importlib.util import find_spec
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+_BACKENDS = ("numba", "numpy", "python")
+
+# Picked on first use, so that looking for numba doesn't slow down importing dsproc
+_backend = None
+
+# The loop version of each kernel, and their compiled versions
+_loops = {}
+_compiled = {}
+
+
+def available_backends() -> list:
+    """
+    Returns the backends that can be used here, the numba one only if numba is installed
+
+    >>> 'numpy' in available_backends()
+    True
+    """
+    return [b for b in _BACKENDS if b != "numba" or find_spec("numba") is not None]
+
+
+def set_backend(name: str = None) -> None:
+    """
+    Sets which versions of the kernels are used
+
+    :param name: 'numba' (compiled loops), 'numpy' (vectorised numpy) or 'python' (uncompiled loops). None picks numba
+        if it's installed and numpy if it isn't
+
+    >>> set_backend('numpy')
+    >>> get_backend()
+    'numpy'
+    >>> set_backend()
+    """
+    global _backend
+    if name is None:
+        name = "numba" if find_spec("numba") is not None else "numpy"
+    if name not in _BACKENDS:
+        raise ValueError(f"backend must be one of {list(_BACKENDS)}")
+    if name not in available_backends():
+        raise ImportError("The numba backend needs numba to be installed")
+
+    _backend = name
+
+
+def get_backend() -> str:
+    """
+    Returns the backend the kernels currently run on
+    """
+    if _backend is None:
+        set_backend()
+    return _backend
+
+
+def _loop(func):
+    """
+    Registers func as the loop version of a kernel
+    """
+    _loops[func.__name__] = func
+    return func
+
+
+def _kernel(name: str):
+    """
+    The loop version of a kernel for the current backend, compiling it if needs be
+    """
+    if get_backend() == "python":
+        return _loops[name]
+
+    if name not in _compiled:
+        import numba
+        _compiled[name] = numba.njit(cache=True)(_loops[name])
+    return _compiled[name]
+
+
+# ------------------------------------------------------------------------------------------------------------------- #
+# Linear feedback shift registers
+
+def _feedback(n: int, taps) -> np.ndarray:
+    """
+    The bits of the register that are xor'd together to make the next bit, for the taps of Message.LFSR. That works
+    out the feedback by shifting the register by n - tap for each tap and xor'ing the results, so the positions are
+    worked out the same way, with positions that appear twice cancelling out
+    """
+    if any(t < 1 or t > n for t in taps):
+        raise ValueError(f"Tap positions must be between 1 and the length of the register ({n})")
+
+    start = n - taps[0]
+    positions = {0}
+    for tap in taps[1:]:
+        positions = {p + n - tap for p in positions} ^ {start}
+
+    return np.array(sorted(p for p in positions if p < n), dtype=np.int64)
+
+
+@_loop
+def _lfsr_loop(n, mask, max_states):
+    start = (1 << n) - 1
+    bits = np.empty(max_states * n, dtype=np.uint8)
+    bits[:n] = 1
+    state = start
+    count = 1
+    for _ in range(max_states - 1):
+        feedback = state & mask
+        bit = 0
+        while feedback:
+            bit ^= feedback & 1
+            feedback >>= 1
+        state = (state >> 1) | (bit << (n - 1))
+        if state == start:
+            break
+        for i in range(n):
+            bits[count * n + i] = (state >> (n - 1 - i)) & 1
+        count += 1
+
+    return bits[:count * n]
+
+
+def _lfsr_numpy(n: int, positions: np.ndarray, max_states: int) -> np.ndarray:
+    # Bit i of the register after m steps is bit m + i of a sequence x, where x[m + n] is the xor of x[m + p] for the
+    # feedback positions p. Squaring the feedback polynomial k times gives x[i] = xor of x[i - 2**k * lag], which holds
+    # once i >= n + (2**k - 1) * the longest lag, so blocks of 2**k * the shortest lag can be done at once. The blocks
+    # grow with i, so the whole sequence takes a few hundred numpy calls at most
+    length = max_states + n - 1
+    x = np.zeros(length, dtype=np.uint8)
+    x[:n] = 1
+    lags = n - positions
+    if len(lags):
+        short, long = int(lags.min()), int(lags.max())
+        i = n
+        while i < length:
+            step = 1 << (((i - n) // long + 1).bit_length() - 1)
+            end = min(i + step * short, length)
+            block = x[i - step * lags[0]:end - step * lags[0]].copy()
+            for lag in lags[1:]:
+                block ^= x[i - step * lag:end - step * lag]
+            x[i:end] = block
+            i = end
+
+    # The register is back to all ones when n ones in a row start at k
+    ones = np.concatenate([[0], np.cumsum(x, dtype=np.int64)])
+    back = np.flatnonzero(ones[n + 1:max_states + n] - ones[1:max_states] == n)
+    count = back[0] + 1 if len(back) else max_states
+
+    # Each state, most significant bit first, is a window of x backwards
+    return sliding_window_view(x[:count + n - 1][::-1], n)[::-1].reshape(-1)
+
+
+def lfsr(n: int, taps) -> np.ndarray:
+    """
+    The states of a linear feedback shift register, starting from all ones and stopping before it gets back to all
+    ones (or after 2**n states if it never does), as bits with the most significant bit of each state first. See
+    Message.LFSR
+
+    :param n: The length of the register
+    :param taps: The tap positions, between 1 and n
+
+    >>> lfsr(3, (3, 2)).reshape(-1, 3)
+    array([[1, 1, 1],
+           [0, 1, 1],
+           [0, 0, 1],
+           [1, 0, 0],
+           [0, 1, 0],
+           [1, 0, 1],
+           [1, 1, 0]], dtype=uint8)
+    """
+    positions = _feedback(n, taps)
+    if get_backend() == "numpy":
+        return _lfsr_numpy(n, positions, 2**n)
+
+    return _kernel("_lfsr_loop")(n, int(np.bitwise_or.reduce(1 << positions, initial=0)), 2**n)
+
+
+# ------------------------------------------------------------------------------------------------------------------- #
+# Cyclic redundancy checks
+
+@_loop
+def _crc_rows(bits, poly):
+    rows, length = bits.shape
+    r = len(poly) - 1
+    out = np.zeros((rows, r), dtype=np.uint8)
+    work = np.zeros(length + r, dtype=np.uint8)
+    for row in range(rows):
+        work[:length] = bits[row]
+        work[length:] = 0
+        for i in range(length):
+            if work[i]:
+                for j in range(r + 1):
+                    work[i + j] ^= poly[j]
+        out[row] = work[length:]
+
+    return out
+
+
+def _crc_numpy(bits: np.ndarray, poly: np.ndarray) -> np.ndarray:
+    # A byte at a time for all the rows at once. For a register R of the last r bits of the remainder, shifting a byte
+    # b in gives (R << 8 | b) mod poly, which is the bottom r bits xor'd with table[the top 8 bits]
+    r = len(poly) - 1
+    poly_int = int("".join(str(int(b)) for b in poly), 2)
+
+    table = np.arange(256, dtype=np.uint64) << np.uint64(r)
+    for bit in range(r + 7, r - 1, -1):
+        hit = (table >> np.uint64(bit)) & np.uint64(1) == 1
+        table[hit] ^= np.uint64(poly_int << (bit - r))
+
+    # Multiply by x**r by appending r zeros, and pad the front to a whole number of bytes, which doesn't change anything
+    rows, length = bits.shape
+    pad = -(length + r) % 8
+    padded = np.zeros((rows, pad + length + r), dtype=np.uint8)
+    padded[:, pad:pad + length] = bits
+    data = np.packbits(padded, axis=1).astype(np.uint64)
+
+    mask = np.uint64((1 << r) - 1)
+    register = np.zeros(rows, dtype=np.uint64)
+    for byte in data.T:
+        value = (register << np.uint64(8)) | byte
+        register = (value & mask) ^ table[value >> np.uint64(r)]
+
+    return ((register[:, None] >> np.arange(r - 1, -1, -1, dtype=np.uint64)) & np.uint64(1)).astype(np.uint8)
+
+
+def crc_remainder(bits: np.ndarray, poly: np.ndarray) -> np.ndarray:
+    """
+    The remainder of each row of bits, with len(poly) - 1 zeros appended, divided by the polynomial poly (over GF(2))
+
+    :param bits: A 2d array of bits, one message per row
+    :param poly: The bits of the polynomial, highest power first. The first bit must be 1
+    :return: A 2d array of the len(poly) - 1 remainder bits of each row
+
+    >>> crc_remainder(np.array([[1, 1, 0, 1, 0, 0, 1, 1, 1, 0, 1, 1, 0, 0]]), np.array([1, 0, 1, 1]))
+    array([[1, 0, 0]], dtype=uint8)
+    """
+    poly = np.asarray(poly, dtype=np.uint8)
+    if len(poly) < 2 or poly[0] != 1:
+        raise ValueError("The polynomial must have at least two bits, the first of which is 1")
+    bits = np.asarray(bits).astype(np.uint8)
+
+    if get_backend() == "numpy":
+        return _crc_numpy(bits, poly)
+    return _kernel("_crc_rows")(bits, poly)
+
+
+# ------------------------------------------------------------------------------------------------------------------- #
+# FSK peak replacement
+
+@_loop
+def _replace_peaks_loop(freq, mask, sps, fill):
+    n = len(freq)
+    for i in range(n):
+        if mask[i]:
+            freq[i] = fill
+            for j in range(i, min(i + sps, n)):
+                if not mask[j]:
+                    freq[i] = freq[j]
+                    break
+
+    return freq
+
+
+def _replace_peaks_numpy(freq: np.ndarray, mask: np.ndarray, sps: int, fill) -> np.ndarray:
+    n = len(freq)
+    index = np.arange(n)
+    # The next non-peak at or after each sample, n if there isn't one
+    following = np.minimum.accumulate(np.where(mask, n, index)[::-1])[::-1]
+    peaks = index[mask]
+    nearby = following[peaks] < np.minimum(peaks + sps, n)
+    # Non-peaks never change, so all of the peaks can be replaced at once
+    freq[peaks] = np.where(nearby, freq[np.minimum(following[peaks], n - 1)], fill)
+
+    return freq
+
+
+def replace_peaks(freq: np.ndarray, mask: np.ndarray, sps: int, fill) -> np.ndarray:
+    """
+    Replaces each peak in freq, in place, with the next sample that isn't a peak, as long as it's less than sps samples
+    away, and with fill if there isn't one
+
+    :param freq: The samples
+    :param mask: True where a sample is a peak
+    :param sps: How far ahead to look for a sample that isn't a peak
+    :param fill: The value to use when there isn't one
+    :return: freq
+
+    >>> replace_peaks(np.array([1., 9, 2, 9, 9, 9, 3]), np.array([0, 1, 0, 1, 1, 1, 0], dtype=bool), 2, 0.)
+    array([1., 2., 2., 0., 0., 3., 3.])
+    """
+    mask = np.asarray(mask, dtype=np.bool_)
+    if get_backend() == "numpy":
+        return _replace_peaks_numpy(freq, mask, sps, fill)
+    return _kernel("_replace_peaks_loop")(freq, mask, sps, freq.dtype.type(fill))
+
+
+# ------------------------------------------------------------------------------------------------------------------- #
+# Prefix code decoding
+
+@_loop
+def _prefix_decode_loop(bits, symbols, lengths, max_len):
+    n = len(bits)
+    out = np.empty(n, dtype=np.int64)
+    count = 0
+    i = 0
+    while i < n:
+        value = 0
+        for j in range(max_len):
+            value <<= 1
+            if i + j < n:
+                value |= bits[i + j]
+        length = lengths[value]
+        if length == 0 or length > n - i:
+            return out[:count], i
+        out[count] = symbols[value]
+        count += 1
+        i += length
+
+    return out[:count], -1
+
+
+def _prefix_decode_numpy(bits: np.ndarray, symbols: np.ndarray, lengths: np.ndarray, max_len: int) -> tuple:
+    n = len(bits)
+    # The next max_len bits from every position, as an index into the table
+    padded = np.concatenate([bits, np.zeros(max_len - 1, dtype=np.uint8)]).astype(np.int64)
+    values = sliding_window_view(padded, max_len) @ (1 << np.arange(max_len - 1, -1, -1))
+    length = lengths[values]
+
+    # Where each codeword would end, with n for the end of the data and n + 1 for no codeword
+    after = np.where((length > 0) & (length <= n - np.arange(n)), np.arange(n) + length, n + 1)
+    jump = np.concatenate([after, [n, n + 1]])
+
+    # The codewords start at 0, jump[0], jump[jump[0]]... Doubling the jumps finds them in log(codewords) steps
+    starts = np.array([0])
+    while starts[-1] < n:
+        starts = np.concatenate([starts, jump[starts]])
+        jump = jump[jump]
+    starts = starts[starts < n]
+
+    # The last codeword runs off the end of the data or isn't a codeword at all
+    if after[starts[-1]] == n + 1:
+        return symbols[values[starts[:-1]]], starts[-1]
+    return symbols[values[starts]], -1
+
+
+def prefix_decode(bits: np.ndarray, codes: dict) -> list:
+    """
+    Decodes bits encoded with a prefix code, such as a Huffman code
+
+    :param bits: An array of bits
+    :param codes: The codewords, strings of '0' and '1', and what each decodes to
+    :return: What each codeword in bits decodes to, in order
+
+    >>> prefix_decode(np.array([0, 1, 0, 1, 1, 0]), {'0': 'a', '10': 'b', '11': 'c'})
+    ['a', 'b', 'c', 'a']
+    """
+    bits = np.asarray(bits).astype(np.uint8)
+    keys = [key for key in codes if key]
+    if not len(bits):
+        return []
+    if not keys:
+        raise RuntimeError("Failed to find decompression codeword in data i is 0 code is ")
+
+    max_len = max(map(len, keys))
+    # For every max_len bits, the codeword they start with and its length. The shortest codes are filled in last, so
+    # they win if one code is a prefix of another
+    symbols = np.zeros(2**max_len, dtype=np.int64)
+    lengths = np.zeros(2**max_len, dtype=np.int64)
+    for index in sorted(range(len(keys)), key=lambda k: -len(keys[k])):
+        shift = max_len - len(keys[index])
+        first = int(keys[index], 2) << shift
+        symbols[first:first + (1 << shift)] = index
+        lengths[first:first + (1 << shift)] = len(keys[index])
+
+    if get_backend() == "numpy":
+        found, error = _prefix_decode_numpy(bits, symbols, lengths, max_len)
+    else:
+        found, error = _kernel("_prefix_decode_loop")(bits, symbols, lengths, max_len)
+
+    if error >= 0:
+        code = "".join(str(b) for b in bits[error:error + max_len])
+        raise RuntimeError(f"Failed to find decompression codeword in data i is {error} code is {code}")
+
+    return [codes[keys[k]] for k in found]
+
+
+# ------------------------------------------------------------------------------------------------------------------- #
+# Markify
+
+@_loop
+def _markify_loop(inverse, order, starts, counts):
+    total = 0
+    for i in range(len(inverse)):
+        total += counts[inverse[i]]
+    out = np.empty(total, dtype=np.int64)
+    position = 0
+    for i in range(len(inverse)):
+        group = inverse[i]
+        out[position:position + counts[group]] = order[starts[group]:starts[group] + counts[group]]
+        position += counts[group]
+
+    return out
+
+
+def _markify_numpy(inverse: np.ndarray, order: np.ndarray, starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    sizes = counts[inverse]
+    ends = np.cumsum(sizes)
+    # For every output the index into order: the start of its symbol's group plus how far into the group it is
+    offsets = np.arange(ends[-1]) - np.repeat(ends - sizes, sizes)
+    return order[np.repeat(starts[inverse], sizes) + offsets]
+
+
+def markify(symbols: np.ndarray) -> np.ndarray:
+    """
+    For each symbol in turn, the indices of every occurrence of that symbol. See dsproc.markify
+
+    >>> markify(np.array([3, 1, 3]))
+    array([0, 2, 1, 0, 2])
+    """
+    symbols = np.asarray(symbols)
+    if not len(symbols):
+        return None
+
+    _, inverse, counts = np.unique(symbols, return_inverse=True, return_counts=True)
+    inverse = inverse.reshape(-1).astype(np.int64)
+    counts = counts.astype(np.int64)
+    # The indices of each symbol's occurrences, one symbol after another
+    order = np.argsort(inverse, kind="stable").astype(np.int64)
+    starts = np.cumsum(counts) - counts
+
+    if get_backend() == "numpy":
+        return _markify_numpy(inverse, order, starts, counts)
+    return _kernel("_markify_loop")(inverse, order, starts, counts)
@@ -0,0 +1,30 @@
+"""
+Lazy imports, so that importing dsproc doesn't import scipy's submodules or matplotlib until they're first used. Between
+them those take most of a second to import, which headless scripts that never plot shouldn't have to pay for.
+"""
+from importlib import import_module
+from types import ModuleType
+
+
+class LazyModule(ModuleType):
+    """
+    Stands in for a module until one of its attributes is used, then imports it. The module's attributes are copied
+    over at that point, so after the first use looking one up costs the same as on the module itself.
+    """
+    def __getattr__(self, attr):
+        module = import_module(self.__name__)
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+
+def lazy_import(name: str) -> ModuleType:
+    """
+    Returns a module that's imported the first time one of its attributes is used
+
+    :param name: The full name of the module, e.g. "scipy.signal"
+
+    >>> wavfile = lazy_import("scipy.io.wavfile")
+    >>> callable(wavfile.write)
+    True
+    """
+    return LazyModule(name)
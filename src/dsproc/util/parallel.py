@@ -0,0 +1,69 @@
+"""
+A shared thread pool for running the chunks of a signal in parallel. The heavy numpy and scipy kernels (FFTs,
+convolutions, elementwise complex maths) release the GIL while they run, so threads give a real speed up on several
+cores without copying the samples to other processes.
+
+How a signal is split into chunks never depends on the number of threads, so the results are the same whatever it is
+set to, down to the last bit.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+_threads = os.cpu_count() or 1
+# Thread pools by size, kept so threads aren't started for every call
+_pools = {}
+
+
+def set_threads(n: int = None) -> None:
+    """
+    Sets how many threads chunked processing (e.g. Graph.compute) runs on
+
+    :param n: The number of threads, 1 to run everything on the calling thread. None uses one per CPU
+
+    >>> set_threads(2)
+    >>> get_threads()
+    2
+    >>> set_threads()
+    """
+    global _threads
+    n = n or os.cpu_count() or 1
+    if n < 1 or n != int(n):
+        raise ValueError("The number of threads must be a positive integer")
+
+    _threads = int(n)
+
+
+def get_threads() -> int:
+    """
+    Returns how many threads chunked processing runs on
+    """
+    return _threads
+
+
+def _executor(threads: int) -> ThreadPoolExecutor:
+    if threads not in _pools:
+        _pools[threads] = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="dsproc")
+    return _pools[threads]
+
+
+def parallel_map(func, items, threads: int = None) -> list:
+    """
+    Calls func on each item on a pool of threads and returns the results in the order of the items. With one thread,
+    or only one item, everything runs on the calling thread. An exception in any call is raised here. func shouldn't
+    call parallel_map itself, as it could end up waiting on its own pool
+
+    :param func: The function to call
+    :param items: What to call it on
+    :param threads: How many threads to use, defaults to get_threads()
+
+    >>> parallel_map(lambda x: x * x, range(5), threads=3)
+    [0, 1, 4, 9, 16]
+    """
+    items = list(items)
+    threads = min(threads or _threads, len(items))
+    if threads <= 1:
+        return [func(item) for item in items]
+
+    pool = _executor(threads)
+    futures = [pool.submit(func, item) for item in items]
+    return [future.result() for future in futures]
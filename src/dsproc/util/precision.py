@@ -0,0 +1,213 @@
+"""
+Library wide floating point precision, and a debug counter for the memory each Signal method allocates.
+
+By default dsproc works in single precision: samples are complex64 and real valued arrays are float32, from reading a
+capture through filtering to writing it back out. Single precision halves the memory (and memory bandwidth) of double
+precision and is plenty for 8 to 16 bit radio captures. Call set_precision('double') to work in complex128/float64
+instead. IIR filters are the exception: their coefficients and state are always double precision, because a narrow
+filter is badly wrong with 32 bit coefficients.
+"""
+from contextlib import contextmanager
+from functools import wraps
+import threading
+import tracemalloc
+import numpy as np
+
+_DTYPES = {
+    'single': (np.dtype(np.complex64), np.dtype(np.float32)),
+    'double': (np.dtype(np.complex128), np.dtype(np.float64)),
+}
+
+_precision = 'single'
+
+# Set while count_allocations is running
+_counter = None
+# How many tracked methods are running in each thread. Only the outermost call is measured
+_local = threading.local()
+
+# [memory in use at the start, highest peak seen] of every peak measurement still running, in any thread. Starting a
+# measurement resets the tracemalloc peak, so the peak so far is folded into the others first. This is what lets the
+# allocation counter and the profiler (and threads) measure at the same time without spoiling each other's peaks
+_measuring = []
+_measuring_lock = threading.Lock()
+
+
+def set_precision(precision: str) -> None:
+    """
+    Sets the precision that samples are stored and processed in
+
+    :param precision: 'single' (complex64/float32) or 'double' (complex128/float64)
+
+    >>> set_precision('double')
+    >>> complex_dtype()
+    dtype('complex128')
+    >>> set_precision('single')
+    >>> complex_dtype()
+    dtype('complex64')
+    """
+    global _precision
+    if precision not in _DTYPES:
+        raise ValueError(f"precision must be one of {list(_DTYPES)}")
+
+    _precision = precision
+
+
+def get_precision() -> str:
+    """
+    Returns the current precision, 'single' or 'double'
+    """
+    return _precision
+
+
+def complex_dtype() -> np.dtype:
+    """
+    The dtype complex samples are kept in
+    """
+    return _DTYPES[_precision][0]
+
+
+def real_dtype() -> np.dtype:
+    """
+    The dtype real valued arrays (amplitudes, filter coefficients, spectra) are kept in
+    """
+    return _DTYPES[_precision][1]
+
+
+def as_complex(x: np.ndarray) -> np.ndarray:
+    """
+    Returns x as the complex dtype, without copying it if it already is
+    """
+    return np.asarray(x).astype(complex_dtype(), copy=False)
+
+
+def as_real(x: np.ndarray) -> np.ndarray:
+    """
+    Returns x as the real dtype, without copying it if it already is
+    """
+    return np.asarray(x).astype(real_dtype(), copy=False)
+
+
+class AllocationCounter:
+    """
+    Records how much memory Signal methods allocate, measured in full size temporaries: the peak memory a call
+    allocated divided by the size of the samples it was called on. A method that works in place scores about 0, one that
+    returns a new array scores about 1, and one that makes a complex128 copy of complex64 samples scores 2 or more.
+    """
+    def __init__(self):
+        self.calls = {}
+
+    def record(self, name: str, temporaries: float) -> None:
+        with _measuring_lock:
+            self.calls.setdefault(name, []).append(temporaries)
+
+    def report(self) -> str:
+        """
+        A table of the calls recorded, with the largest number of temporaries seen for each method
+        """
+        lines = [f"{'method':<24}{'calls':>8}{'max temporaries':>18}"]
+        for name, counts in sorted(self.calls.items()):
+            lines.append(f"{name:<24}{len(counts):>8}{max(counts):>18.2f}")
+
+        return "\n".join(lines)
+
+
+@contextmanager
+def count_allocations():
+    """
+    Counts the full size temporaries allocated by every Signal method called inside the with block. This uses
+    tracemalloc, which slows everything down a lot, so it's only for debugging.
+
+    >>> from dsproc import Signal
+    >>> s = Signal(10000, message=np.array([1, 0, 1, 1]), sps=100000, f=3000)
+    >>> s.samples = s.create_samples(s.f)
+    >>> with count_allocations() as counter:
+    ...     s.baseband()
+    ...     s.resample(up=1, down=2)
+    >>> counter.calls['baseband'][0] < 0.5  # Done in place
+    True
+    >>> counter.calls['resample'][0] > 0.5  # Makes a new array
+    True
+    """
+    global _counter
+    previous = _counter
+    _counter = AllocationCounter()
+    started = start_tracing()
+
+    try:
+        yield _counter
+    finally:
+        if started:
+            tracemalloc.stop()
+        _counter = previous
+
+
+def _fold_peak() -> None:
+    _, peak = tracemalloc.get_traced_memory()
+    for frame in _measuring:
+        frame[1] = max(frame[1], peak)
+
+
+def start_peak() -> list:
+    """
+    Starts measuring the peak memory allocated from now on, see stop_peak. Measurements can be nested, and run in
+    several threads at once (though then each includes what the other threads allocated). tracemalloc must be tracing
+
+    :return: The measurement, to hand to stop_peak
+    """
+    with _measuring_lock:
+        _fold_peak()
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        frame = [current, current]
+        _measuring.append(frame)
+
+    return frame
+
+
+def stop_peak(frame: list) -> int:
+    """
+    Stops a measurement made by start_peak
+
+    :return: The most memory in use at any time since start_peak, above what was in use then, in bytes
+    """
+    with _measuring_lock:
+        _fold_peak()
+        _measuring[:] = [i for i in _measuring if i is not frame]
+
+    return frame[1] - frame[0]
+
+
+def start_tracing() -> bool:
+    """
+    Starts tracemalloc if it isn't already running
+
+    :return: Whether it was started, and so should be stopped again by whoever started it
+    """
+    if tracemalloc.is_tracing():
+        return False
+
+    tracemalloc.start()
+    return True
+
+
+def track_allocations(method):
+    """
+    Decorator for Signal methods, so their allocations are counted inside count_allocations. Costs one check of a
+    global when not counting. When a tracked method calls another, the allocations are counted against the outer one.
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        counter = _counter
+        if counter is None or getattr(_local, "depth", 0) or not tracemalloc.is_tracing():
+            return method(self, *args, **kwargs)
+
+        nbytes = max(getattr(self.samples, "nbytes", 0), 1)
+        frame = start_peak()
+        _local.depth = 1
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            _local.depth = 0
+            counter.record(method.__name__, stop_peak(frame) / nbytes)
+
+    return wrapper
@@ -0,0 +1,329 @@
+"""
+Opt in profiling of the public methods of Signal, Mod, Demod, Message and Symbol2bit.
+
+Every public method of those classes is wrapped by instrument. Normally the wrapper only checks one global and calls the
+method, so it costs next to nothing. Inside a profiling() block, or between enable_profiling() and disable_profiling(),
+each call's wall time, the number of samples (or bits) going in and coming out and the peak memory it allocated are
+recorded, and can be printed as a table or dumped to JSON or CSV.
+
+Peak memory is measured with the same tracemalloc measurements as count_allocations (see dsproc.util.precision), so the
+two can be used together. Methods can be profiled from several threads at once, e.g. the stages of a parallel Graph.
+"""
+from contextlib import contextmanager
+from functools import wraps
+from time import perf_counter
+import csv
+import inspect
+import json
+import threading
+import tracemalloc
+import numpy as np
+from .precision import start_peak, stop_peak, start_tracing
+
+# The running Profiler, None when profiling is off
+_profiler = None
+
+COLUMNS = ["method", "calls", "total_s", "mean_s", "max_s", "samples_in", "samples_out", "peak_bytes"]
+
+
+def _get(obj, path: str):
+    """
+    Gets the attribute at a dotted path, e.g. "message.data". None if it isn't there yet
+    """
+    for name in path.split("."):
+        obj = getattr(obj, name, None)
+        if obj is None:
+            return None
+
+    return obj
+
+
+def _size(x) -> int:
+    return 0 if x is None else int(np.size(x))
+
+
+class MethodStats:
+    """
+    The totals for one method
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples_in = 0
+        self.samples_out = 0
+        self.peak = 0
+
+    def add(self, seconds: float, samples_in: int, samples_out: int, peak: int) -> None:
+        self.calls += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.samples_in += samples_in
+        self.samples_out += samples_out
+        self.peak = max(self.peak, peak)
+
+    def row(self) -> dict:
+        return {
+            "method": self.name,
+            "calls": self.calls,
+            "total_s": self.total,
+            "mean_s": self.total / self.calls,
+            "max_s": self.max,
+            "samples_in": self.samples_in,
+            "samples_out": self.samples_out,
+            "peak_bytes": self.peak,
+        }
+
+
+class Profiler:
+    """
+    Collects the stats of the instrumented methods called while it's running.
+
+    Times include any instrumented methods called from inside a method, so Mod.QPSK includes the time spent in
+    Signal.create_samples. Peak memory is the most the call allocated above what was in use when it started, and is
+    only measured when memory=True, because tracemalloc slows everything down a lot. Calls running in other threads at
+    the same time add to each other's peaks.
+    """
+    def __init__(self, memory: bool = True):
+        """
+        :param memory: If True, measure the peak memory of each call with tracemalloc
+        """
+        self.memory = memory
+        self.stats = {}
+        # Whether enable_profiling started tracemalloc, so it should stop it again
+        self._started_tracing = False
+        # Guards stats, which methods running in different threads add to
+        self._lock = threading.Lock()
+        # The names of the methods being profiled right now, in each thread
+        self._local = threading.local()
+
+    def _running(self) -> set:
+        """
+        The names of the methods being profiled right now in this thread
+        """
+        if not hasattr(self._local, "running"):
+            self._local.running = set()
+        return self._local.running
+
+    def _record(self, name: str, data: str, obj, before, result, seconds: float, peak: int) -> None:
+        # A method that leaves the samples alone and returns an array (the demodulators) outputs that array, the rest
+        # output whatever they leave in the samples
+        after = _get(obj, data)
+        if after is before and isinstance(result, np.ndarray):
+            after = result
+
+        with self._lock:
+            if name not in self.stats:
+                self.stats[name] = MethodStats(name)
+            self.stats[name].add(seconds, _size(before), _size(after), peak)
+
+    def call(self, method, data: str, obj, args: tuple, kwargs: dict):
+        """
+        Calls method(obj, *args, **kwargs) and records its stats
+
+        :param data: The attribute of obj holding its samples, see instrument
+        """
+        name = method.__qualname__
+        running = self._running()
+        # Only the outermost call of a recursive method is recorded, or its time would be counted many times over
+        if name in running:
+            return method(obj, *args, **kwargs)
+
+        before = _get(obj, data)
+        frame = start_peak() if self.memory and tracemalloc.is_tracing() else None
+
+        running.add(name)
+        result = None
+        start = perf_counter()
+        try:
+            result = method(obj, *args, **kwargs)
+            return result
+        finally:
+            seconds = perf_counter() - start
+            running.discard(name)
+            peak = stop_peak(frame) if frame is not None else 0
+            self._record(name, data, obj, before, result, seconds, peak)
+
+    async def call_async(self, method, data: str, obj, args: tuple, kwargs: dict):
+        """
+        Awaits method(obj, *args, **kwargs) and records its stats. The time is from the call until it returns,
+        including the time spent waiting. Other tasks run while it waits, so the peak memory isn't measured
+        """
+        before = _get(obj, data)
+        result = None
+        start = perf_counter()
+        try:
+            result = await method(obj, *args, **kwargs)
+            return result
+        finally:
+            self._record(method.__qualname__, data, obj, before, result, perf_counter() - start, 0)
+
+    def call_generator(self, method, data: str, obj, args: tuple, kwargs: dict):
+        """
+        Yields from method(obj, *args, **kwargs) and records its stats. The time is only the time spent inside the
+        generator, not what the caller does with each item in between. That runs between the items too, so the peak
+        memory isn't measured
+        """
+        name = method.__qualname__
+        running = self._running()
+        before = _get(obj, data)
+        generator = method(obj, *args, **kwargs)
+        seconds = 0.0
+        try:
+            while True:
+                recorded = name not in running
+                running.add(name)
+                start = perf_counter()
+                try:
+                    item = next(generator)
+                except StopIteration as e:
+                    return e.value
+                finally:
+                    seconds += perf_counter() - start
+                    if recorded:
+                        running.discard(name)
+                yield item
+        finally:
+            generator.close()
+            self._record(name, data, obj, before, None, seconds, 0)
+
+    def rows(self, sort: str = "total_s") -> list:
+        """
+        The stats as a list of dicts, one per method, with the keys in COLUMNS
+
+        :param sort: The column to sort by, largest first
+        """
+        with self._lock:
+            rows = [s.row() for s in self.stats.values()]
+
+        return sorted(rows, key=lambda r: r[sort], reverse=True)
+
+    def report(self, sort: str = "total_s") -> str:
+        """
+        The stats as a table, for printing
+
+        :param sort: The column to sort by, largest first
+        """
+        lines = [f"{'method':<32}{'calls':>7}{'total ms':>11}{'mean ms':>10}{'samples in':>13}{'samples out':>13}"
+                 f"{'Msamples/s':>12}{'peak MiB':>10}"]
+        for r in self.rows(sort):
+            # Modulators start with no samples, so go by whichever side is bigger
+            rate = max(r["samples_in"], r["samples_out"]) / r["total_s"] / 1e6 if r["total_s"] else 0
+            lines.append(f"{r['method']:<32}{r['calls']:>7}{r['total_s'] * 1e3:>11.2f}{r['mean_s'] * 1e3:>10.3f}"
+                         f"{r['samples_in']:>13}{r['samples_out']:>13}{rate:>12.2f}{r['peak_bytes'] / 2**20:>10.2f}")
+
+        return "\n".join(lines)
+
+    def dump(self, fn: str) -> None:
+        """
+        Writes the stats to a file, as CSV if the name ends in .csv and JSON otherwise
+
+        :param fn: The file name
+        """
+        rows = self.rows()
+        with open(fn, "w", newline="") as f:
+            if str(fn).endswith(".csv"):
+                writer = csv.DictWriter(f, fieldnames=COLUMNS)
+                writer.writeheader()
+                writer.writerows(rows)
+            else:
+                json.dump(rows, f, indent=2)
+
+
+def enable_profiling(memory: bool = True) -> Profiler:
+    """
+    Starts profiling every instrumented method call, until disable_profiling is called
+
+    :param memory: If True, also measure the peak memory of each call with tracemalloc
+    :return: The Profiler the stats are collected in
+    """
+    global _profiler
+    if _profiler is not None:
+        raise RuntimeError("Profiling is already enabled")
+
+    _profiler = Profiler(memory)
+    _profiler._started_tracing = memory and start_tracing()
+
+    return _profiler
+
+
+def disable_profiling() -> Profiler | None:
+    """
+    Stops profiling
+
+    :return: The Profiler that was running, or None if profiling wasn't enabled
+    """
+    global _profiler
+    profiler, _profiler = _profiler, None
+    if profiler is not None and profiler._started_tracing:
+        tracemalloc.stop()
+
+    return profiler
+
+
+@contextmanager
+def profiling(memory: bool = True):
+    """
+    Profiles every instrumented method called inside the with block
+
+    :param memory: If True, also measure the peak memory of each call with tracemalloc
+
+    >>> from dsproc import Mod
+    >>> with profiling() as prof:
+    ...     s = Mod(fs=10000, message=np.array([0, 1, 2, 3] * 25), sps=10, f=1000)
+    ...     s.QPSK()
+    ...     s.baseband()
+    >>> prof.stats['Mod.QPSK'].calls, prof.stats['Mod.QPSK'].samples_out
+    (1, 1000)
+    >>> prof.stats['Signal.baseband'].samples_in
+    1000
+    """
+    profiler = enable_profiling(memory)
+    try:
+        yield profiler
+    finally:
+        disable_profiling()
+
+
+def instrument(data: str):
+    """
+    Class decorator that wraps each public method defined on the class, so it's profiled while profiling is enabled.
+    Methods inherited from a parent class are left to the parent's decorator, so they're only wrapped once.
+
+    :param data: The attribute holding the samples or bits the methods work on, e.g. "samples". Can be a dotted path
+    """
+    def wrap(method):
+        # Coroutines and generators get wrappers of their own kind, so they're timed while they run rather than while
+        # they're created, and still look like coroutines and generators to their callers
+        if inspect.iscoroutinefunction(method):
+            @wraps(method)
+            async def wrapper(self, *args, **kwargs):
+                if _profiler is None:
+                    return await method(self, *args, **kwargs)
+                return await _profiler.call_async(method, data, self, args, kwargs)
+
+        elif inspect.isgeneratorfunction(method):
+            @wraps(method)
+            def wrapper(self, *args, **kwargs):
+                if _profiler is None:
+                    return (yield from method(self, *args, **kwargs))
+                return (yield from _profiler.call_generator(method, data, self, args, kwargs))
+
+        else:
+            @wraps(method)
+            def wrapper(self, *args, **kwargs):
+                if _profiler is None:
+                    return method(self, *args, **kwargs)
+                return _profiler.call(method, data, self, args, kwargs)
+
+        return wrapper
+
+    def decorator(cls):
+        for name, attr in list(vars(cls).items()):
+            # Async generators are left unwrapped
+            if not name.startswith("_") and inspect.isfunction(attr) and not inspect.isasyncgenfunction(attr):
+                setattr(cls, name, wrap(attr))
+        return cls
+
+    return decorator
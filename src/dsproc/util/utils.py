@@ -2,6 +2,8 @@
 Utility functions for other dsproc classes
 """
 import numpy as np
+from .convolve import convolve
+from . import kernels
 
 
 def create_message(n: int = 1000, m: int = 50) -> np.ndarray:
@@ -54,7 +56,7 @@ def moving_average(x: np.ndarray, n: int, weights: np.ndarray = None) -> np.ndar
     else:
         window = np.array(weights)
 
-    return np.convolve(x, window, 'valid') / n
+    return convolve(x, window, 'valid') / n
 
 
 def markify(symbols):
@@ -62,19 +64,12 @@ def markify(symbols):
     Given some symbols returns an array of the pattern of the symbol occurrences
 
     :param symbols: An array of ints
-    :return: Array of occurrences of those symbols
-    """
-    index = np.arange(len(symbols))
-    output = None
-
-    for i in range(len(symbols)):
-        marker = index[symbols == symbols[i]]
-        if output is None:
-            output = marker
-        else:
-            output = np.concatenate([output, marker])
+    :return: Array of occurrences of those symbols, see dsproc.util.kernels for the backends it can run on
 
-    return output
+    >>> markify(np.array([3, 1, 3]))
+    array([0, 2, 1, 0, 2])
+    """
+    return kernels.markify(symbols)
 
 
 def create_wave(t, f, amp, phase) -> np.ndarray:
@@ -0,0 +1,63 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from scipy import signal
+from scipy.io import wavfile
+import dsproc
+from dsproc.sig.audio import WavWriter, write_wav
+
+
+def random_samples(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return (rng.standard_normal(n) + 1j * rng.standard_normal(n)).astype(np.complex64)
+
+
+class TestAudio(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.fn = os.path.join(self.tmp.name, "audio.wav")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_matches_whole_signal(self):
+        x = random_samples(30000)
+        frames = write_wav(self.fn, x, fs=8000, offset=800, chunk_size=7001)
+
+        rate, audio = wavfile.read(self.fn)
+        self.assertEqual((rate, audio.dtype, len(audio)), (44100, np.float32, frames))
+
+        # The same as shifting and resampling the whole signal at once
+        shifted = x * np.exp(2j * np.pi * 800 * np.arange(len(x)) / 8000)
+        expected = signal.resample_poly(shifted.real.astype(np.float32), up=44100, down=8000)
+        self.assertEqual(len(audio), len(expected))
+        self.assertTrue(np.allclose(audio, expected, atol=1e-4))
+
+    def test_block_sizes(self):
+        x = random_samples(20000, seed=1)
+        write_wav(self.fn, x, fs=2e4, rate=48000)
+        _, whole = wavfile.read(self.fn)
+
+        with WavWriter(self.fn, fs=2e4, rate=48000) as w:
+            for block in np.array_split(x, 13):
+                w.write(block)
+        _, blocks = wavfile.read(self.fn)
+        self.assertTrue(np.allclose(whole, blocks, atol=1e-6))
+
+    def test_save_wave(self):
+        s = dsproc.Mod(fs=8000, message=np.array([0, 1, 2, 3] * 10), sps=8, f=1000)
+        s.QPSK()
+        s.baseband()
+        before = s.samples.copy()
+        s.save_wave("sig", path=self.tmp.name, wav=True)
+
+        # The signal isn't touched
+        self.assertTrue(np.array_equal(s.samples, before))
+        self.assertEqual(s.f, 0)
+        rate, audio = wavfile.read(os.path.join(self.tmp.name, "sig.wave"))
+        self.assertEqual((rate, len(audio)), (44100, int(np.ceil(len(before) * 44100 / 8000))))
+
+
+if __name__ == "__main__":
+    unittest.main()
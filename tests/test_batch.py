@@ -0,0 +1,111 @@
+import unittest
+import numpy as np
+import dsproc
+
+
+FS = np.array([10000, 10000, 20000])
+F = np.array([1000, 2500, 3000])
+
+
+def make_batch(method, *args, **kwargs):
+    """
+    Modulates a batch of random messages, and the same messages one at a time
+    """
+    # Each row has its own set of symbols, as they might in a real batch
+    messages = np.random.default_rng(0).integers(0, 4, size=(3, 50))
+    messages[0, 0:4] = np.arange(4)
+    messages[1] %= 2
+    messages[2] = np.where(messages[2] == 3, 2, messages[2])
+
+    batch = dsproc.Mod(fs=FS, message=messages, sps=8, f=F)
+    getattr(batch, method)(*args, **kwargs)
+
+    singles = []
+    for message, fs, f in zip(messages, FS, F):
+        s = dsproc.Mod(fs=int(fs), message=message, sps=8, f=int(f))
+        getattr(s, method)(*args, **kwargs)
+        singles.append(s)
+
+    return batch, singles
+
+
+def demod_batch(batch):
+    d = dsproc.Demod(fs=batch.fs, f=batch.f)
+    d.samples = batch.samples.copy()
+    return d
+
+
+def demod_single(s):
+    d = dsproc.Demod(fs=s.fs, f=s.f)
+    d.samples = s.samples.copy()
+    return d
+
+
+class TestBatch(unittest.TestCase):
+    def assertRowsClose(self, batch, singles, atol=1e-5):
+        self.assertEqual(batch.shape[0], len(singles))
+        for row, single in zip(batch, singles):
+            self.assertTrue(np.allclose(row, single, atol=atol))
+
+    def test_mod_methods(self):
+        for method, args in [("ASK", ()), ("FSK", (200,)), ("QPSK", ()), ("QAM", ("square",)), ("CPFSK", (200,))]:
+            batch, singles = make_batch(method, *args)
+            self.assertEqual(batch.samples.shape, (3, 400), method)
+            self.assertEqual(batch.channels, 3)
+            self.assertRowsClose(batch.samples, [s.samples for s in singles])
+
+    def test_elementwise(self):
+        batch, singles = make_batch("QPSK")
+        batch.baseband()
+        batch.phase_offset(np.array([10, 20, 30]))
+        batch.freq_offset(100)
+        batch.normalise_amplitude()
+
+        for s, angle in zip(singles, [10, 20, 30]):
+            s.baseband()
+            s.phase_offset(angle)
+            s.freq_offset(100)
+            s.normalise_amplitude()
+
+        self.assertEqual(batch.samples.dtype, np.complex64)
+        self.assertRowsClose(batch.samples, [s.samples for s in singles])
+
+    def test_filters(self):
+        batch, singles = make_batch("QAM", "square")
+        sos = batch.butterworth_filter(1500, "lowpass")
+        batch.rrc()
+        self.assertEqual(sos.shape[0], 3)
+
+        for s in singles:
+            s.butterworth_filter(1500, "lowpass")
+            s.rrc()
+
+        self.assertRowsClose(batch.samples, [s.samples for s in singles], atol=1e-4)
+
+    def test_demod(self):
+        batch, singles = make_batch("FSK", 200)
+        d = demod_batch(batch)
+        d.quadrature_demod()
+        self.assertEqual(d.samples.shape, (3, 399))
+        expected = []
+        for s in singles:
+            single = demod_single(s)
+            single.quadrature_demod()
+            expected.append(single.samples)
+        self.assertRowsClose(d.samples, expected, atol=1e-4)
+
+        batch, singles = make_batch("QAM", "square")
+        batch.baseband()
+        c = dsproc.Constellation(M=4)
+        c.square()
+        c.normalise()
+
+        symbols = demod_batch(batch).QAM(c)
+        self.assertEqual(symbols.shape, (3, 400))
+        for row, s in zip(symbols, singles):
+            s.baseband()
+            self.assertTrue(np.array_equal(row, demod_single(s).QAM(c)))
+
+
+if __name__ == "__main__":
+    unittest.main()
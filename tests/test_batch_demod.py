@@ -0,0 +1,76 @@
+import json
+import os
+import tempfile
+import unittest
+import numpy as np
+import dsproc
+from dsproc.batch import demod_files, read_journal, main
+
+
+def power(d):
+    return np.abs(d.samples) ** 2
+
+
+def fail_on_second(d):
+    if "second" in d.fn:
+        raise RuntimeError("bad capture")
+    return None
+
+
+class TestBatchDemod(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.files = []
+        rng = np.random.default_rng(0)
+        for i, name in enumerate(["first", "second", "third"]):
+            s = dsproc.Mod(fs=8000, message=rng.integers(0, 2, 100), sps=8, f=1000 + 500 * i)
+            s.FSK(200)
+            s.save_wave(name, path=self.tmp.name)
+            self.files.append(os.path.join(self.tmp.name, name))
+        # A capture named the gqrx way, without a sidecar
+        self.gqrx = os.path.join(self.tmp.name, "gqrx_20240101_120000_8000_1500_fc.raw")
+        s.samples.tofile(self.gqrx)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_matches_serial(self):
+        results = demod_files(self.files + [self.gqrx], processes=2)
+        self.assertEqual(len(results), 4)
+
+        for r in results:
+            d = dsproc.Demod(fs=0, fn=r.fn)
+            d.detect_params()
+            d.baseband()
+            d.quadrature_demod()
+            self.assertIsNone(r.error)
+            self.assertTrue(np.array_equal(r.output, d.samples))
+            self.assertEqual(r.samples, 800)
+            self.assertGreater(r.rate, 0)
+
+    def test_resume(self):
+        journal = os.path.join(self.tmp.name, "journal.jsonl")
+        results = demod_files(self.files, job=f"{__name__}:fail_on_second", processes=2, journal=journal)
+        self.assertEqual(sorted(r.error is None for r in results), [False, True, True])
+        self.assertEqual(set(read_journal(journal)), {self.files[0], self.files[2]})
+
+        # A half written line from a crash is ignored, and only the failed capture is done again
+        with open(journal, "a") as f:
+            f.write('{"fn": "')
+        results = demod_files(self.files, job=power, processes=2, journal=journal)
+        self.assertEqual([r.fn for r in results], [self.files[1]])
+        self.assertTrue(np.allclose(results[0].output, 1, atol=1e-5))
+
+        self.assertEqual(demod_files(self.files, journal=journal), [])
+
+    def test_cli(self):
+        out = os.path.join(self.tmp.name, "out")
+        self.assertEqual(main([os.path.join(self.tmp.name, "[ft]*"), "--out", out, "--processes", "2"]), 0)
+        self.assertEqual(sorted(os.listdir(out)), ["first.npy", "journal.jsonl", "third.npy"])
+        self.assertEqual(np.load(os.path.join(out, "first.npy")).shape, (799,))
+        with open(os.path.join(out, "journal.jsonl")) as f:
+            self.assertEqual(len([json.loads(line) for line in f]), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
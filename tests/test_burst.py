@@ -0,0 +1,139 @@
+import os
+import tempfile
+import tracemalloc
+import unittest
+import numpy as np
+import dsproc
+from dsproc.sig.burst import BurstDetector, Burst, iter_bursts
+
+
+def noise(n, power=1e-4, seed=0):
+    rng = np.random.default_rng(seed)
+    return ((rng.standard_normal(n) + 1j * rng.standard_normal(n)) * np.sqrt(power / 2)).astype(np.complex64)
+
+
+def with_bursts(n, bursts, amp=0.1, seed=0):
+    """
+    Noise with a burst of a random phase tone between each (start, stop)
+    """
+    x = noise(n, seed=seed)
+    rng = np.random.default_rng(seed + 1)
+    for start, stop in bursts:
+        x[start:stop] += amp * np.exp(2j * np.pi * rng.random()) * np.exp(2j * np.pi * 0.1 * np.arange(stop - start))
+    return x
+
+
+class TestBurst(unittest.TestCase):
+    def test_bursts(self):
+        # Including bursts already going at the start and still going at the end
+        truth = [(0, 3000), (20000, 20100), (50000, 90000), (123456, 124000), (199000, 200000)]
+        x = with_bursts(200000, truth)
+
+        results = [list(iter_bursts(x, n=8, chunk_size=chunk_size)) for chunk_size in (len(x), 2**16, 4097, 1000)]
+        for result in results[1:]:
+            self.assertEqual(result, results[0])
+
+        bursts = results[0]
+        self.assertEqual(len(bursts), len(truth))
+        for burst, (start, stop) in zip(bursts, truth):
+            self.assertIsInstance(burst, Burst)
+            # The moving average finds bursts up to n - 1 samples early
+            self.assertTrue(start - 7 <= burst.start <= start)
+            self.assertEqual(burst.stop, stop)
+            self.assertAlmostEqual(burst.peak_power, 0.01, delta=0.003)
+
+    def test_update_and_flush(self):
+        x = with_bursts(50000, [(10000, 12000), (40000, 50000)])
+        detector = BurstDetector(floor_block=4096)
+        per_chunk = [detector.update(chunk) for chunk in np.array_split(x, 5)]
+        # Each burst is returned from the chunk the noise floor for its end was worked out in, and the one going at the
+        # end from flush
+        self.assertEqual([[b.stop for b in bursts] for bursts in per_chunk], [[], [12000], [], [], []])
+        self.assertTrue(detector.in_burst)
+        self.assertEqual([b.stop for b in detector.flush()], [50000])
+        self.assertFalse(detector.in_burst)
+        self.assertEqual(detector.position, len(x))
+        self.assertAlmostEqual(detector.noise_floor, 1e-4, delta=1e-4)
+
+    def test_hysteresis_and_min_duration(self):
+        # A burst whose power dips just below the on threshold every so often
+        x = noise(30000, power=1e-6)
+        x[10000:20000] = np.where(np.arange(10000) % 50 >= 45, 0.08, 0.1)
+        levels = dict(on=20 * np.log10(0.09), n=1, noise_floor=1.0)
+
+        self.assertEqual([b[:2] for b in iter_bursts(x, **levels)], [(10000, 20000)])
+        self.assertEqual(len(list(iter_bursts(x, off=levels["on"], **levels))), 200)
+        self.assertEqual(list(iter_bursts(x, off=levels["on"], min_duration=46, **levels)), [])
+
+        with self.assertRaises(ValueError):
+            BurstDetector(on=3, off=6)
+
+    def test_noise_floor(self):
+        # The noise gets 10 dB louder for a while, then much quieter. There's a burst in each part
+        x = np.concatenate([with_bursts(200000, [(50000, 51000)], seed=0),
+                            with_bursts(1000000, [(800000, 801000)], amp=0.3, seed=1) * np.sqrt(10),
+                            with_bursts(200000, [(100000, 101000)], seed=2) / 10])
+        bursts = list(iter_bursts(x, min_duration=100))
+
+        # The louder noise looks like bursts until the noise floor has risen to it, which takes 10 dB / 0.5 dB a block
+        settled = 200000 + 20 * 2**14
+        self.assertEqual([b.stop for b in bursts if not 200000 - 16 < b.start < settled], [51000, 1001000, 1301000])
+        detector = BurstDetector()
+        detector.update(x[:1100000])
+        self.assertAlmostEqual(detector.noise_floor / 1e-3, 1, delta=0.5)
+        # and drops straight back down with the noise
+        detector.update(x[1100000:1250000])
+        self.assertLess(detector.noise_floor, 2e-6)
+
+    def test_memmap(self):
+        x = with_bursts(2**21, [(10000, 20000), (2**20 - 100, 2**20 + 100)])
+        with tempfile.TemporaryDirectory() as tmp:
+            fn = os.path.join(tmp, "capture.bin")
+            x.tofile(fn)
+            d = dsproc.Demod(fs=10000, fn=fn, mmap=True)
+
+            tracemalloc.start()
+            bursts = list(iter_bursts(d.samples, chunk_size=2**16))
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            del d
+
+        self.assertEqual([b.stop for b in bursts], [20000, 2**20 + 100])
+        # Only a few chunks of memory, not the whole capture
+        self.assertLess(peak, 2**16 * 40)
+
+    def test_transmit_window(self):
+        d = dsproc.Demod(fs=1000)
+        d.samples = with_bursts(10000, [(0, 500), (2000, 2003), (4000, 5000), (9000, 10000)])
+        self.assertTrue(np.array_equal(d.transmit_window(0.05, 10), [[0, 500], [4000, 5000], [9000, 10000]]))
+        self.assertEqual(d.transmit_window(0.05, 2).shape, (4, 2))
+        self.assertEqual(d.transmit_window(1, 1).shape, (0, 2))
+
+    def test_trim_by_power(self):
+        d = dsproc.Demod(fs=1000)
+        d.samples = with_bursts(30000, [(5000, 25000)])
+        d.trim_by_power(padding=100, n=10)
+        self.assertEqual(len(d.samples), 20000 + 200 + 9)
+        self.assertEqual(d.sample_offset, 5000 - 100 - 9)
+
+        d.samples = with_bursts(30000, [(5000, 25000)])
+        d.trim_by_power(drop=False)
+        self.assertTrue(np.all(d.samples[:4990] == 0))
+        self.assertTrue(np.all(d.samples[25000:] == 0))
+        self.assertTrue(np.all(d.samples[5000:25000] != 0))
+
+        d.samples = np.zeros(1000, dtype=np.complex64)
+        with self.assertRaises(ValueError):
+            d.trim_by_power()
+
+        # The old threshold still works, with a warning
+        d.samples = with_bursts(30000, [(5000, 25000)])
+        d.sample_offset = 0
+        with self.assertWarns(DeprecationWarning):
+            d.trim_by_power(std_cut=1.5)
+        self.assertAlmostEqual(d.sample_offset, 5000, delta=10)
+        self.assertAlmostEqual(len(d.samples), 20000, delta=20)
+
+
+if __name__ == "__main__":
+    unittest.main()
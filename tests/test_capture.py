@@ -0,0 +1,113 @@
+import json
+import os
+import tempfile
+import unittest
+import numpy as np
+import dsproc
+from dsproc.sig.capture import Capture, CaptureWriter, sidecar_path
+
+
+def random_samples(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return (rng.standard_normal(n) + 1j * rng.standard_normal(n)).astype(np.complex64)
+
+
+class TestCapture(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.fn = os.path.join(self.tmp.name, "capture.cf32")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_chunked_and_appended_writes(self):
+        x = random_samples(10000)
+        with CaptureWriter(self.fn, fs=2e6, f=-1000, sps=8, gain=30) as w:
+            for block in np.array_split(x[:6000], 4):
+                w.write(block)
+            w.annotate(100, 200, "header")
+
+        with CaptureWriter(self.fn, fs=2e6, append=True) as w:
+            w.write(x[6000:])
+            w.annotate(7000, 7100, "header", snr=12.5)
+
+        # The data file is plain complex64, readable without the sidecar
+        self.assertTrue(np.array_equal(np.fromfile(self.fn, np.complex64), x))
+
+        c = Capture(self.fn)
+        self.assertEqual((len(c), c.fs, c.f, c.sps, c.meta["gain"]), (10000, 2e6, -1000, 8, 30))
+        self.assertIsNotNone(c.start_time)
+        self.assertEqual(c.meta["samples"], 10000)
+        self.assertEqual([a["start"] for a in c.annotations], [100, 7000])
+        headers = c.annotated("header")
+        self.assertTrue(np.array_equal(headers[1], x[7000:7100]))
+
+        with self.assertRaises(ValueError):
+            CaptureWriter(self.fn, fs=1e6, append=True)
+
+    def test_slices_are_views(self):
+        x = random_samples(100000)
+        with CaptureWriter(self.fn, fs=1000) as w:
+            w.write(x)
+
+        c = Capture(self.fn)
+        part = c[50000:50010]
+        self.assertIsInstance(part, np.memmap)
+        self.assertTrue(np.array_equal(part, x[50000:50010]))
+        self.assertFalse(isinstance(c.read(5, 10), np.memmap))
+
+    def test_save_wave_and_demod(self):
+        s = dsproc.Mod(fs=8000, message=np.array([0, 1, 2, 3] * 10), sps=8, f=1000)
+        s.QPSK()
+        s.save_wave(fn="qpsk.cf32", path=self.tmp.name)
+
+        fn = os.path.join(self.tmp.name, "qpsk.cf32")
+        with open(sidecar_path(fn)) as f:
+            self.assertEqual(json.load(f)["fs"], 8000)
+
+        d = dsproc.Demod.from_capture(fn, start=100, stop=200)
+        self.assertEqual((d.fs, d.f, d.sps, d.sample_offset), (8000, 1000, 8, 100))
+        self.assertTrue(np.array_equal(d.samples, s.samples[100:200]))
+
+        # Basebanding part of the capture lines up with basebanding all of it
+        d.baseband()
+        s.baseband()
+        self.assertTrue(np.allclose(d.samples, s.samples[100:200], atol=1e-5))
+
+        d = dsproc.Demod(fs=1, fn=fn)
+        d.detect_params()
+        self.assertEqual((d.fs, d.f), (8000, 1000))
+
+    def test_quantised(self):
+        x = random_samples(20000) / 5
+        with CaptureWriter(self.fn, fs=1000, fmt='cs8', full_scale=1.0) as w:
+            w.write(x[:10000])
+        with CaptureWriter(self.fn, fs=1000, append=True) as w:
+            w.write(x[10000:])
+
+        self.assertEqual(os.path.getsize(self.fn), 2 * len(x))
+        c = Capture(self.fn)
+        self.assertEqual((c.meta["format"], c.meta["dtype"], len(c)), ("cs8", "int8", len(x)))
+        clipped = np.clip(x.real, -1, 127 / 128) + 1j * np.clip(x.imag, -1, 127 / 128)
+        self.assertLess(np.max(np.abs(c[5000:15000] - clipped[5000:15000])), 1 / 128)
+
+        s = dsproc.Mod(fs=8000, message=np.array([0, 1, 2, 3] * 10), sps=8, f=1000, amplitude=3)
+        s.QPSK()
+        s.save_wave(fn="qpsk.cs16", path=self.tmp.name, fmt="cs16")
+        d = dsproc.Demod.from_capture(os.path.join(self.tmp.name, "qpsk.cs16"))
+        self.assertTrue(np.allclose(d.samples, s.samples, atol=1e-4))
+
+    def test_demod_reads_sidecar_format(self):
+        s = dsproc.Mod(fs=8000, message=np.array([0, 1, 2, 3] * 10), sps=8, f=1000, amplitude=3)
+        s.QPSK()
+        # The format and scale are only in the sidecar, not the names
+        for fn in ("qpsk", "qpsk.cf32", "qpsk.cs8"):
+            with self.subTest(fn=fn):
+                s.save_wave(fn=fn, path=self.tmp.name, fmt="cs16")
+                for mmap in (False, True):
+                    d = dsproc.Demod(fs=8000, fn=os.path.join(self.tmp.name, fn), mmap=mmap)
+                    self.assertTrue(np.allclose(d.samples[:], s.samples, atol=1e-3))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+import numpy as np
+import dsproc
+from dsproc.sig.channelizer import Channelizer, prototype_filter
+
+
+def noise(n):
+    return (np.random.randn(n) + 1j * np.random.randn(n)).astype(np.complex64)
+
+
+class TestChannelizer(unittest.TestCase):
+    def test_matches_mix_filter_decimate(self):
+        # Each channel should be the signal mixed down by the channel centre, filtered and decimated
+        for K, P in [(8, 6), (5, 16), (16, 1)]:
+            x = noise(10001)
+            chan = Channelizer(K, fs=8000, taps_per_channel=P)
+            out = chan.process(x)
+
+            n = np.arange(len(x))
+            for k in range(K):
+                expected = np.convolve(x * np.exp(-2j * np.pi * k * n / K), chan.taps)[::K][:out.shape[1]]
+                self.assertTrue(np.allclose(out[k], expected, atol=1e-4), f"K={K}, channel {k}")
+
+    def test_chunks(self):
+        x = noise(20000)
+        whole = Channelizer(8, fs=8000).process(x)
+
+        chan = Channelizer(8, fs=8000)
+        blocks = [chan.process(x[i:j]) for i, j in [(0, 3), (3, 8), (8, 9999), (9999, 20000)]]
+        blocks = np.concatenate(blocks, axis=1)
+
+        self.assertEqual(blocks.shape, (8, 2500))
+        self.assertTrue(np.allclose(blocks, whole, atol=1e-5))
+
+    def test_prototype_cached(self):
+        self.assertIs(prototype_filter(8, 16), Channelizer(8, fs=1000).taps)
+
+    def test_bad_K(self):
+        with self.assertRaises(ValueError):
+            Channelizer(1, fs=1000)
+
+    def test_demod_channelize(self):
+        fs = 64000
+        n = np.arange(64000)
+        # Tones 500Hz above the centres of channels 3 and -2 (which is channel 6)
+        d = dsproc.Demod(fs=fs, f=24500)
+        d.samples = (np.exp(2j * np.pi * 24500 * n / fs) + np.exp(2j * np.pi * -15500 * n / fs)).astype(np.complex64)
+
+        chans = d.channelize(K=8, chunk_size=10000)
+        self.assertEqual(len(chans), 8)
+        self.assertEqual([c.fs for c in chans], [8000] * 8)
+        self.assertEqual(chans[3].f, 500)
+        self.assertEqual(chans[6].f, 24500 + 16000)
+
+        power = [np.mean(np.abs(c.samples[100:])) for c in chans]
+        self.assertEqual(sorted(np.argsort(power)[-2:]), [3, 6])
+
+        # The tone in channel 3 is at f in the channel
+        c = chans[3]
+        expected = np.exp(2j * np.pi * 500 * np.arange(len(c.samples)) / c.fs)
+        phase = np.angle(c.samples[200:] / expected[200:])
+        self.assertLess(np.std(phase), 0.01)
+
+        # Picking channels
+        self.assertEqual(len(d.channelize(K=8, channels=[1, 3])), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,33 @@
+import unittest
+import numpy as np
+from dsproc.util.convolve import convolve, choose_method
+
+
+class TestConvolve(unittest.TestCase):
+    def test_methods_match_numpy(self):
+        rng = np.random.default_rng(1)
+        for n, m in [(1, 1), (7, 3), (3, 7), (1000, 17), (5000, 129), (20000, 1001)]:
+            x = (rng.standard_normal(n) + 1j * rng.standard_normal(n)).astype(np.complex64)
+            h = rng.standard_normal(m)
+
+            for mode in ['full', 'same', 'valid']:
+                expected = np.convolve(x, h, mode=mode)
+                for method in ['direct', 'fft', 'overlap-save', 'auto']:
+                    y = convolve(x, h, mode=mode, method=method)
+                    self.assertEqual(y.dtype, np.complex64)
+                    self.assertEqual(len(y), len(expected), msg=f"{n}, {m}, {mode}, {method}")
+                    self.assertTrue(np.allclose(y, expected, atol=1e-3), msg=f"{n}, {m}, {mode}, {method}")
+
+    def test_dtypes(self):
+        x = np.random.randn(5000)
+        self.assertEqual(convolve(x.astype(np.float32), np.ones(100)).dtype, np.float32)
+        self.assertEqual(convolve(x, np.ones(100)).dtype, np.float64)
+        self.assertEqual(convolve(np.arange(10), np.ones(3)).dtype, np.float64)
+
+    def test_choose_method(self):
+        self.assertEqual(choose_method(10**6, 5), 'direct')
+        self.assertEqual(choose_method(10**8, 801), 'overlap-save')
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=1)
@@ -0,0 +1,107 @@
+import unittest
+import numpy as np
+from scipy import signal
+import dsproc
+from dsproc.sig.filters import SOSFilter, FIRFilter, rrc_taps
+
+
+def noise(n):
+    return (np.random.randn(n) + 1j * np.random.randn(n)).astype(np.complex64)
+
+
+def in_blocks(filt, x, sizes):
+    out = []
+    start = 0
+    for size in sizes:
+        out.append(filt.process(x[start:start + size]))
+        start += size
+    out.append(filt.process(x[start:]))
+    return np.concatenate(out)
+
+
+def rrc_loop(alpha, N, sps, fs):
+    """
+    The original sample by sample RRC tap generator, to test the vectorised one against
+    """
+    Ts = sps / fs
+    rrc = np.zeros(N)
+    for x in range(N):
+        t = (x - N / 2) * (1 / float(fs))
+        if t == 0.0:
+            rrc[x] = 1.0 - alpha + (4 * alpha / np.pi)
+        elif alpha != 0 and abs(t) == Ts / (4 * alpha):
+            rrc[x] = (alpha / np.sqrt(2)) * (((1 + 2 / np.pi) * (np.sin(np.pi / (4 * alpha)))) +
+                                             ((1 - 2 / np.pi) * (np.cos(np.pi / (4 * alpha)))))
+        else:
+            rrc[x] = (np.sin(np.pi * t * (1 - alpha) / Ts) +
+                      4 * alpha * (t / Ts) * np.cos(np.pi * t * (1 + alpha) / Ts)) / \
+                     (np.pi * t * (1 - (4 * alpha * t / Ts) * (4 * alpha * t / Ts)) / Ts)
+    return rrc
+
+
+class TestFilters(unittest.TestCase):
+    def test_rrc_taps(self):
+        for args in [(0.4, 81, 8, 10000), (0.5, 16, 8, 1000), (0.35, 161, 16, 48000), (0.0, 21, 2, 100)]:
+            taps = rrc_taps(*args)
+            self.assertTrue(np.allclose(taps, rrc_loop(*args), rtol=1e-12, atol=0), msg=f"{args}")
+            self.assertTrue(np.all(np.isfinite(taps)))
+
+        # Mod and Demod share the cached taps
+        m = dsproc.Mod(fs=10000, message=[0, 1], sps=8)
+        d = dsproc.Demod(fs=10000)
+        d.sps = 8
+        self.assertIs(m._gen_rrc(0.4, 81), d._gen_rrc(0.4, 81))
+
+    def test_sos_bit_identical(self):
+        x = noise(10000)
+        whole = signal.sosfilt(signal.butter(5, (1000, 3000), 'bandpass', fs=20000, output='sos'), x)
+        whole = whole.astype(np.complex64)
+
+        filt = SOSFilter.butterworth((1000, 3000), 'bandpass', fs=20000)
+        blocks = in_blocks(filt, x, [1, 999, 4000, 7])
+
+        self.assertTrue(np.array_equal(blocks, whole))
+
+    def test_sos_narrow(self):
+        # A cutoff this far below fs needs double precision coefficients, even when the samples are single precision
+        d = dsproc.Demod(fs=2e6)
+        d.samples = np.exp(2j * np.pi * 10 * np.arange(400000) / d.fs).astype(np.complex64)
+        d.butterworth_filter(100, 'lowpass')
+
+        self.assertEqual(d.samples.dtype, np.complex64)
+        self.assertTrue(np.allclose(np.abs(d.samples[200000:]), 1, atol=1e-4))
+
+    def test_fir_bit_identical(self):
+        x = noise(5000)
+        taps = signal.firwin(81, 0.2)
+
+        for mode in ['valid', 'full']:
+            filt = FIRFilter(taps, mode=mode)
+            whole = np.concatenate([filt.process(x), filt.flush()])
+            self.assertTrue(np.allclose(whole, np.convolve(x, taps, mode=mode), atol=1e-5))
+
+            filt = FIRFilter(taps, mode=mode)
+            blocks = np.concatenate([in_blocks(filt, x, [10, 50, 3000, 1]), filt.flush()])
+            self.assertTrue(np.array_equal(blocks, whole), msg=f"FIR mismatch in {mode} mode")
+
+    def test_signal_apply_filter(self):
+        s = dsproc.Mod(fs=20000, message=dsproc.create_message(500, 4), sps=8, f=3000)
+        s.QPSK()
+        x = s.samples.copy()
+
+        s.butterworth_filter(2000, 'lowpass')
+        whole = s.samples
+
+        filt = SOSFilter.butterworth(2000, 'lowpass', fs=20000)
+        d = dsproc.Demod(fs=20000)
+        d.samples = x
+        out = []
+        for chunk in d.chunks(chunk_size=333):
+            chunk.apply_filter(filt)
+            out.append(chunk.samples)
+
+        self.assertTrue(np.array_equal(np.concatenate(out), whole))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=1)
@@ -0,0 +1,98 @@
+import unittest
+import numpy as np
+from scipy import signal
+import dsproc
+
+
+def make_signal():
+    s = dsproc.Mod(fs=20000, message=dsproc.create_message(2000, 4), sps=16, f=3000)
+    s.QPSK()
+    s.samples += dsproc.AWGN(len(s.samples), power=0.01)
+    return s
+
+
+class TestGraph(unittest.TestCase):
+    def test_matches_eager(self):
+        eager = make_signal()
+        lazy = dsproc.Mod(fs=eager.fs, message=eager.message, sps=eager.sps, f=eager.f)
+        lazy.samples = eager.samples.copy()
+
+        eager.baseband()
+        eager.phase_offset(30)
+        eager.butterworth_filter(2000, "lowpass")
+        eager.freq_offset(500)
+        eager.rrc()
+
+        g = lazy.lazy().baseband().phase_offset(30).butterworth_filter(2000, "lowpass").freq_offset(500).rrc()
+        g.compute(chunk_size=1000)
+
+        self.assertEqual((lazy.f, lazy.fs, lazy.sps), (eager.f, eager.fs, eager.sps))
+        self.assertEqual(len(lazy.samples), len(eager.samples))
+        self.assertTrue(np.allclose(lazy.samples, eager.samples, atol=1e-4))
+
+    def test_source_untouched(self):
+        s = make_signal()
+        original = s.samples
+        copy = s.samples.copy()
+        s.lazy().baseband().phase_offset(10).compute(chunk_size=999)
+
+        self.assertTrue(np.all(original == copy))
+
+    def test_fusion(self):
+        s = make_signal()
+        g = s.lazy().freq_offset(100).phase_offset(20).freq_offset(-100).phase_offset(-20)
+        self.assertEqual(g.explain().splitlines()[0], "dropped: [freq_offset, phase_offset, freq_offset, "
+                                                      "phase_offset] cancel out")
+
+        g = s.lazy().normalise_amplitude().baseband().normalise_amplitude()
+        plan = g.explain().splitlines()
+        self.assertEqual(len(plan), 3)
+        self.assertTrue(plan[0].startswith("1. fused elementwise [baseband]"))
+
+    def test_decimate(self):
+        s = make_signal()
+        expected = signal.decimate(s.samples, 4, n=8, ftype='iir', zero_phase=False)
+
+        s.lazy().decimate(4).compute(chunk_size=1001)
+
+        self.assertEqual(s.fs, 5000)
+        self.assertEqual(s.sps, 4)
+        self.assertTrue(np.allclose(s.samples, expected, atol=1e-5))
+
+    def test_threads(self):
+        original = make_signal()
+
+        def run(threads):
+            s = dsproc.Mod(fs=original.fs, message=original.message, sps=original.sps, f=original.f)
+            s.samples = original.samples
+            g = s.lazy().baseband().rrc(normalise=False).phase_offset(20).butterworth_filter(3000, "lowpass")
+            g.freq_offset(250).rrc().decimate(2).freq_offset(-100)
+            return g.compute(chunk_size=1000, threads=threads).samples
+
+        serial = run(1)
+        # Chunks are the same however many threads there are, so the output matches bit for bit
+        for threads in (2, 7):
+            self.assertTrue(np.array_equal(run(threads), serial))
+
+        dsproc.set_threads(3)
+        self.assertEqual(dsproc.get_threads(), 3)
+        self.assertTrue(np.array_equal(run(None), serial))
+        dsproc.set_threads()
+        with self.assertRaises(ValueError):
+            dsproc.set_threads(-1)
+
+    def test_parallel_fir(self):
+        s = make_signal()
+        taps = signal.firwin(101, 0.2)
+        expected = np.convolve(s.samples * np.exp(-2j * np.pi * 3000 * np.arange(len(s.samples)) / s.fs), taps,
+                               mode='valid')
+
+        g = s.lazy().baseband()
+        g.ops.append(("fir", "fir", taps))
+        g.compute(chunk_size=512, threads=4)
+        self.assertEqual(len(s.samples), len(expected))
+        self.assertTrue(np.allclose(s.samples, expected, atol=1e-4))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=1)
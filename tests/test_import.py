@@ -0,0 +1,34 @@
+import os
+import subprocess
+import sys
+import unittest
+
+
+def run(code, **env):
+    """
+    Runs code in a fresh interpreter, so nothing is imported yet, and returns what it prints
+    """
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(sys.path), **env}
+    return subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True,
+                          check=True).stdout.strip()
+
+
+class TestImport(unittest.TestCase):
+    def test_import_is_lazy(self):
+        # scipy's submodules and matplotlib are only imported when they're first used
+        loaded = run("import sys, dsproc\n"
+                     "print([m for m in sys.modules if m.startswith(('matplotlib', 'scipy.'))])")
+        self.assertEqual(loaded, "[]")
+
+    def test_plot_respects_backend(self):
+        backend = run("import numpy as np, dsproc\n"
+                      "s = dsproc.Signal(fs=1000, message=np.array([0, 1]), sps=10, f=100)\n"
+                      "s.samples = s.create_samples(s.f)\n"
+                      "s.iq()\n"
+                      "import matplotlib\n"
+                      "print(matplotlib.get_backend())", MPLBACKEND="svg")
+        self.assertEqual(backend, "svg")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,178 @@
+import contextlib
+import io
+import unittest
+import numpy as np
+import dsproc
+from dsproc.message.encode import crc
+from dsproc.util import kernels
+
+
+def reference_lfsr(n, taps):
+    # Message.LFSR as it was before it used the kernels
+    start_state = (2 ** n) - 1
+    lfsr = start_state
+    random_code = bin(start_state)[2:]
+    for k in range((2 ** n) - 1):
+        start = lfsr >> (n - taps[0])
+        bit = lfsr
+        for j in range(1, len(taps)):
+            bit = (bit >> (n - taps[j])) ^ start
+        bit = bit & 1
+        lfsr = (lfsr >> 1) | (bit << (n - 1))
+        if lfsr == start_state:
+            break
+        random_code += f'{lfsr:b}'.zfill(n)
+
+    return np.array([i for i in random_code], dtype=np.uint8)
+
+
+def reference_markify(symbols):
+    index = np.arange(len(symbols))
+    return np.concatenate([index[symbols == s] for s in symbols])
+
+
+def reference_crc(data, poly):
+    # Long division a bit at a time
+    out = np.concatenate([data, np.zeros((data.shape[0], len(poly) - 1), dtype=np.uint8)], axis=1)
+    for row in out:
+        for i in range(data.shape[1]):
+            if row[i]:
+                row[i:i + len(poly)] ^= poly.astype(np.uint8)
+    return out[:, data.shape[1]:]
+
+
+def on_each_backend(func):
+    """
+    Runs func on every backend that's available here and returns the results by backend
+    """
+    results = {}
+    try:
+        for backend in kernels.available_backends():
+            kernels.set_backend(backend)
+            results[backend] = func()
+    finally:
+        kernels.set_backend()
+
+    return results
+
+
+class TestKernels(unittest.TestCase):
+    def assertSame(self, results):
+        # Every backend gives exactly the same answer as numpy
+        self.assertIn('python', results)
+        for backend, result in results.items():
+            with self.subTest(backend=backend):
+                self.assertEqual(type(result), type(results['numpy']))
+                if isinstance(result, np.ndarray):
+                    self.assertEqual(result.dtype, results['numpy'].dtype)
+                    self.assertTrue(np.array_equal(result, results['numpy']))
+                else:
+                    self.assertEqual(result, results['numpy'])
+
+    def test_backends(self):
+        self.assertIn(kernels.get_backend(), kernels.available_backends())
+        with self.assertRaises(ValueError):
+            dsproc.set_backend('fortran')
+
+    def test_lfsr(self):
+        m = dsproc.Message()
+        tap_sets = [(n, taps) for n, taps in ((int(k), v) for k, v in m.lfsr_lookup.items()) if n <= 12]
+        tap_sets += [(5, (5, 4, 3, 2)), (6, (6, 1)), (4, (4, 2)), (7, (7, 3, 2)), (5, (5,))]
+        for n, taps in tap_sets:
+            with self.subTest(n=n, taps=taps):
+                results = on_each_backend(lambda: kernels.lfsr(n, taps))
+                self.assertSame(results)
+                self.assertTrue(np.array_equal(results['numpy'], reference_lfsr(n, taps)))
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertTrue(np.array_equal(m.LFSR(10), reference_lfsr(10, m.lfsr_lookup["10"])))
+        with self.assertRaises(ValueError):
+            kernels.lfsr(4, (5, 3))
+
+    def test_crc(self):
+        rng = np.random.default_rng(0)
+        data = rng.integers(0, 2, (50, 61)).astype(np.uint8)
+        data[7] = 0
+        for poly in ("1", "3", "8", "16", "32"):
+            with self.subTest(poly=poly):
+                results = on_each_backend(lambda: crc(data, poly))
+                self.assertSame(results)
+                self.assertEqual(results['numpy'].shape, (50, 32 if poly == "32" else int(poly)))
+
+        poly = np.array([1, 0, 1, 1])
+        self.assertTrue(np.array_equal(crc(data, poly), reference_crc(data, poly)))
+        # CRC-32 of the bytes "123456789", without the reflection and inversion of the usual CRC-32
+        bits = np.unpackbits(np.frombuffer(b"123456789", dtype=np.uint8))
+        self.assertEqual(int("".join(map(str, crc(bits)[0])), 2), 0x89A1897F)
+        with self.assertRaises(ValueError):
+            crc(data, np.array([0, 1, 1]))
+
+    def test_replace_peaks(self):
+        rng = np.random.default_rng(1)
+        for dtype in (np.float32, np.float64):
+            freq = rng.standard_normal(5000).astype(dtype)
+            mask = rng.random(5000) < 0.5
+            results = on_each_backend(lambda: kernels.replace_peaks(freq.copy(), mask, 4, 0.25))
+            self.assertSame(results)
+
+            out = results['numpy']
+            self.assertTrue(np.array_equal(out[~mask], freq[~mask]))
+            # Each peak became either a later non-peak within 4 samples or the fill value
+            for i in np.flatnonzero(mask)[:200]:
+                ahead = np.flatnonzero(~mask[i:i + 4])
+                self.assertEqual(out[i], freq[i + ahead[0]] if len(ahead) else dtype(0.25))
+
+    def test_prefix_decode(self):
+        rng = np.random.default_rng(2)
+        codes = {'0': 'a', '10': 'b', '110': 'c', '111': 'd'}
+        words = rng.choice(list(codes), 2000)
+        bits = np.array([int(b) for b in "".join(words)], dtype=np.uint8)
+
+        results = on_each_backend(lambda: kernels.prefix_decode(bits, codes))
+        self.assertSame(results)
+        self.assertEqual(results['numpy'], [codes[w] for w in words])
+
+        m = dsproc.Message(data=bits)
+        m.decompression_codes = codes
+        self.assertEqual(m.apply_decompression(), "".join(codes[w] for w in words))
+
+        # A codeword that runs off the end, and one that doesn't exist
+        for bad, bad_codes in (([0, 1, 1], codes), ([0, 1, 1, 0], {'0': 'a', '10': 'b'})):
+            for backend in kernels.available_backends():
+                with self.subTest(bad=bad, backend=backend):
+                    kernels.set_backend(backend)
+                    try:
+                        with self.assertRaisesRegex(RuntimeError, "i is 1 code is 11$"):
+                            kernels.prefix_decode(np.array(bad), bad_codes)
+                    finally:
+                        kernels.set_backend()
+
+    def test_markify(self):
+        rng = np.random.default_rng(3)
+        for symbols in (rng.integers(0, 7, 300), np.array([5]), np.array([1.5, -2.0, 1.5, 1.5])):
+            results = on_each_backend(lambda: dsproc.markify(symbols))
+            self.assertSame(results)
+            self.assertTrue(np.array_equal(results['numpy'], reference_markify(symbols)))
+
+        self.assertIsNone(dsproc.markify(np.array([])))
+
+    def test_demod_FSK(self):
+        np.random.seed(4)
+        message = dsproc.create_message(500, 4)
+        s = dsproc.Mod(fs=10000, message=message, sps=20)
+        s.FSK(spacing=1000)
+        s.samples = s.samples + dsproc.AWGN(len(s.samples), power=0.01)
+
+        def demod():
+            d = dsproc.Demod(fs=s.fs)
+            d.samples = s.samples.copy()
+            np.random.seed(5)
+            return d.demod_FSK(4, sps=20, iterations=50)
+
+        results = on_each_backend(demod)
+        self.assertSame(results)
+        self.assertTrue(np.array_equal(dsproc.markify(results['numpy']), dsproc.markify(message)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,41 @@
+import unittest
+import numpy as np
+from dsproc.sig.nco import NCO
+
+
+class TestNCO(unittest.TestCase):
+    def test_tone(self):
+        for f in [1, 250, -1234, 3999]:
+            nco = NCO(f=f, fs=8000, block_size=100)
+            tone = nco.generate(1050)
+            exact = np.exp(2j * np.pi * f * np.arange(1050) / 8000)
+
+            self.assertEqual(tone.dtype, np.complex64)
+            self.assertTrue(np.allclose(tone, exact, atol=1e-5))
+
+    def test_continuous(self):
+        nco = NCO(f=1000.5, fs=44100, phase=0.3)
+        blocks = np.concatenate([nco.generate(n) for n in [10, 9000, 1, 333]])
+        whole = NCO(f=1000.5, fs=44100, phase=0.3).generate(len(blocks))
+
+        self.assertTrue(np.allclose(blocks, whole, atol=1e-5))
+
+    def test_large_offset(self):
+        # The phase is worked out from the sample count, so it doesn't drift at large sample numbers
+        start = 10**12 + 3
+        tone = NCO(f=1000, fs=8000, start=start).generate(8)
+        exact = np.exp(2j * np.pi * 1000 * (np.arange(8) + 3) / 8000)
+
+        self.assertTrue(np.allclose(tone, exact, atol=1e-5))
+
+    def test_mix(self):
+        x = (np.random.randn(5000) + 1j * np.random.randn(5000)).astype(np.complex64)
+        expected = x * np.exp(2j * np.pi * -300 * np.arange(5000) / 2000)
+
+        out = NCO(f=-300, fs=2000, block_size=256).mix(x)
+        self.assertIs(out, x)   # In place
+        self.assertTrue(np.allclose(x, expected, atol=1e-4))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=1)
@@ -0,0 +1,75 @@
+import os
+import tempfile
+import unittest
+import matplotlib
+import numpy as np
+import dsproc
+from dsproc.sig.plot import envelope, view_values, iq_density
+
+matplotlib.use("Agg")
+from matplotlib import pyplot as plt     # noqa: E402
+
+
+def random_samples(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return (rng.standard_normal(n) + 1j * rng.standard_normal(n)).astype(np.complex64)
+
+
+class TestPlot(unittest.TestCase):
+    def tearDown(self):
+        plt.close("all")
+
+    def test_envelope(self):
+        x = random_samples(10007)
+        amp = np.abs(x)
+        bin_size, lo, hi = envelope(view_values(x, "amp", chunk_size=999), len(x), points=100)
+
+        self.assertEqual(bin_size, 101)
+        self.assertEqual(len(lo), 100)
+        for i in [0, 57, 99]:
+            self.assertEqual(lo[i], amp[i * bin_size:(i + 1) * bin_size].min())
+            self.assertEqual(hi[i], amp[i * bin_size:(i + 1) * bin_size].max())
+
+        # Fewer values than points are left as they are
+        bin_size, lo, hi = envelope([amp[:50]], 50, points=100)
+        self.assertEqual(bin_size, 1)
+        self.assertTrue(np.array_equal(lo, amp[:50]))
+
+    def test_freq_values(self):
+        x = random_samples(5000)
+        chunked = np.concatenate(list(view_values(x, "freq", fs=1000, chunk_size=777)))
+        whole = np.diff(np.unwrap(np.angle(x))) / (2 * np.pi) * 1000
+        self.assertEqual(len(chunked), len(x) - 1)
+        self.assertTrue(np.allclose(chunked, whole, atol=1e-3))
+
+    def test_iq_density(self):
+        x = random_samples(30000)
+        counts, limit = iq_density(x, bins=64, chunk_size=4096)
+        self.assertEqual(counts.shape, (64, 64))
+        self.assertEqual(counts.sum(), len(x))
+        self.assertGreater(limit, np.max(np.abs(x)))
+
+    def test_views_of_memmap(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            fn = os.path.join(tmp, "capture.bin")
+            random_samples(300000).tofile(fn)
+            d = dsproc.Demod(fs=100000, fn=fn, mmap=True)
+
+            for view in [d.phase_view, d.freq_view, d.amp_view, d.time]:
+                view(points=500)
+                # The envelope is a few vertices per point, not one per sample
+                self.assertLessEqual(len(plt.gca().collections[0].get_paths()[0].vertices), 4 * 500 + 10)
+                plt.close("all")
+
+            d.iq(start_sample=1000)
+            self.assertEqual(len(plt.gca().images), 1)
+            plt.close("all")
+
+            d.amp_view(n=100, start_sample=5)
+            line = plt.gca().lines[0]
+            self.assertEqual(line.get_xdata()[0], 5)
+            self.assertTrue(np.allclose(line.get_ydata(), np.abs(d.samples[5:105])))
+
+
+if __name__ == "__main__":
+    unittest.main()
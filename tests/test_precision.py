@@ -0,0 +1,96 @@
+import tracemalloc
+import unittest
+import numpy as np
+import dsproc
+from dsproc.util.precision import count_allocations, complex_dtype, start_peak, stop_peak
+
+
+def make_signal(n_symbols=1000):
+    s = dsproc.Mod(fs=10000, message=np.array([0, 1, 2, 3] * (n_symbols // 4)), sps=100, f=2000)
+    s.QPSK()
+    return s
+
+
+class TestPrecision(unittest.TestCase):
+    def tearDown(self):
+        dsproc.set_precision('single')
+
+    def test_single_end_to_end(self):
+        s = make_signal(100)
+        self.assertEqual(s.samples.dtype, np.complex64)
+
+        s.baseband()
+        s.phase_offset(30)
+        s.normalise_amplitude()
+        s.butterworth_filter(1000, 'lowpass')
+        self.assertEqual(s.samples.dtype, np.complex64)
+        s.rrc()
+        self.assertEqual(s.samples.dtype, np.complex64)
+        s.decimate(2)
+        self.assertEqual(s.samples.dtype, np.complex64)
+
+        self.assertEqual(s.efficiency().dtype, np.float32)
+        self.assertEqual(s.power_spill(100, 1000).dtype, np.float32)
+
+    def test_double(self):
+        dsproc.set_precision('double')
+        self.assertEqual(dsproc.get_precision(), 'double')
+
+        s = make_signal(100)
+        self.assertEqual(s.samples.dtype, np.complex128)
+        s.baseband()
+        s.phase_offset(30)
+        s.butterworth_filter(1000, 'lowpass')
+        self.assertEqual(s.samples.dtype, np.complex128)
+
+        # The same processing in single precision should only differ by rounding
+        dsproc.set_precision('single')
+        single = make_signal(100)
+        single.baseband()
+        single.phase_offset(30)
+        single.butterworth_filter(1000, 'lowpass')
+        self.assertTrue(np.allclose(single.samples, s.samples, atol=1e-4))
+
+    def test_bad_precision(self):
+        with self.assertRaises(ValueError):
+            dsproc.set_precision('half')
+        self.assertEqual(complex_dtype(), np.complex64)
+
+    def test_allocation_counter(self):
+        s = make_signal()
+        # scipy.signal is imported on first use, which would be counted against the filter
+        make_signal(4).butterworth_filter(1000, 'lowpass')
+        with count_allocations() as counter:
+            s.baseband()
+            s.phase_offset(30)
+            s.normalise_amplitude()
+            s.butterworth_filter(1000, 'lowpass')
+
+        # These work in place
+        for name in ['baseband', 'phase_offset', 'normalise_amplitude']:
+            self.assertLess(counter.calls[name][0], 0.5, name)
+
+        # Filtering makes a new array, but only a piece at a time goes via complex128
+        self.assertLess(counter.calls['butterworth_filter'][0], 1.5)
+        self.assertIn('butterworth_filter', counter.report())
+
+        # Nothing is recorded outside the with block
+        s.phase_offset(30)
+        self.assertEqual(len(counter.calls['phase_offset']), 1)
+
+    def test_nested_peaks(self):
+        tracemalloc.start()
+        try:
+            outer = start_peak()
+            temporary = np.ones(10**6)
+            del temporary
+            # Starting another measurement resets tracemalloc's peak, which mustn't lose the outer one's temporary
+            inner = start_peak()
+            self.assertLess(stop_peak(inner), 10**6)
+            self.assertGreaterEqual(stop_peak(outer), 8 * 10**6)
+        finally:
+            tracemalloc.stop()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,156 @@
+import asyncio
+import inspect
+import json
+import os
+import tempfile
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import dsproc
+from dsproc.util.precision import count_allocations
+from dsproc.sig.stream import StreamSink
+from dsproc.util.profiling import profiling, enable_profiling, disable_profiling
+
+
+class SlowSink(StreamSink):
+    async def _write(self, samples, start):
+        await asyncio.sleep(0.01)
+
+
+def make_signal():
+    s = dsproc.Mod(fs=10000, message=np.array([0, 1, 2, 3] * 100), sps=10, f=1000)
+    s.QPSK()
+    return s
+
+
+class TestProfiling(unittest.TestCase):
+    def tearDown(self):
+        disable_profiling()
+
+    def test_stats(self):
+        with profiling() as prof:
+            s = make_signal()
+            s.phase_offset(10)
+            s.phase_offset(20)
+            s.resample(up=1, down=2)
+
+        qpsk = prof.stats['Mod.QPSK']
+        self.assertEqual((qpsk.calls, qpsk.samples_in, qpsk.samples_out), (1, 0, 4000))
+        # Methods called by another method are recorded too
+        self.assertEqual(prof.stats['Signal.create_samples'].calls, 1)
+        self.assertEqual(prof.stats['Signal.phase_offset'].calls, 2)
+        self.assertEqual(prof.stats['Signal.resample'].samples_out, 2000)
+        self.assertGreater(prof.stats['Signal.resample'].peak, 0)
+        self.assertGreaterEqual(qpsk.total, prof.stats['Signal.create_samples'].total)
+
+        self.assertEqual([r['method'] for r in prof.rows(sort='calls')][0], 'Signal.phase_offset')
+        self.assertIn('Mod.QPSK', prof.report())
+
+    def test_returned_arrays(self):
+        s = make_signal()
+        s.baseband()
+        c = dsproc.Constellation(M=4)
+        c.square()
+        c.normalise()
+        d = dsproc.Demod(fs=10000)
+        d.samples = s.samples
+
+        with profiling(memory=False) as prof:
+            d.QAM(c)
+            m = dsproc.Message(data=np.random.randint(0, 2, 800))
+            m.huffman_compress()
+
+        self.assertEqual(prof.stats['Demod.QAM'].samples_out, 4000)
+        self.assertEqual(prof.stats['Demod.QAM'].peak, 0)
+        # Recursive methods are only recorded once per outer call
+        self.assertEqual(prof.stats['Message.generate_huffman_codes'].calls, 1)
+
+    def test_disabled(self):
+        prof = enable_profiling(memory=False)
+        with self.assertRaises(RuntimeError):
+            enable_profiling()
+        self.assertIs(disable_profiling(), prof)
+
+        make_signal().baseband()
+        self.assertEqual(prof.stats, {})
+        self.assertIsNone(disable_profiling())
+        self.assertEqual(dsproc.Signal.baseband.__name__, 'baseband')
+
+    def test_dump(self):
+        with profiling(memory=False) as prof:
+            make_signal().baseband()
+
+        with tempfile.TemporaryDirectory() as tmp:
+            fn = os.path.join(tmp, 'stats.json')
+            prof.dump(fn)
+            with open(fn) as f:
+                rows = json.load(f)
+            self.assertEqual({r['method'] for r in rows}, {'Mod.QPSK', 'Signal.create_samples', 'Signal.baseband'})
+
+            fn = os.path.join(tmp, 'stats.csv')
+            prof.dump(fn)
+            with open(fn) as f:
+                self.assertTrue(f.readline().startswith('method,calls,total_s'))
+
+
+    def test_with_allocation_counter(self):
+        s = make_signal()
+        for outer_profiler in (True, False):
+            with self.subTest(outer_profiler=outer_profiler):
+                if outer_profiler:
+                    with profiling() as prof, count_allocations() as counter:
+                        s.resample(up=2, down=1)
+                else:
+                    with count_allocations() as counter, profiling() as prof:
+                        s.resample(up=2, down=1)
+
+                # Both see the new array, twice the size of the samples it was made from
+                self.assertGreater(counter.calls['resample'][0], 1.5)
+                self.assertGreater(prof.stats['Signal.resample'].peak, s.samples.nbytes)
+                s.samples = s.samples[::2].copy()
+
+    def test_threads(self):
+        def work(_):
+            s = make_signal()
+            for _ in range(10):
+                s.phase_offset(10)
+
+        with profiling() as prof, count_allocations() as counter:
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                list(pool.map(work, range(16)))
+
+        self.assertEqual(prof.stats['Signal.phase_offset'].calls, 160)
+        self.assertEqual(prof.stats['Mod.QPSK'].calls, 16)
+        self.assertEqual(len(counter.calls['phase_offset']), 160)
+
+    def test_coroutines_and_generators(self):
+        self.assertTrue(inspect.iscoroutinefunction(dsproc.Mod.stream))
+        self.assertTrue(inspect.isgeneratorfunction(dsproc.Demod.chunks))
+
+        s = make_signal()
+        d = dsproc.Demod(fs=10000)
+        d.samples = s.samples.copy()
+        with profiling(memory=False) as prof:
+            # The time spent sending the five blocks is the coroutine's
+            asyncio.run(s.stream(SlowSink(), block_size=800))
+            # but the time spent with each chunk is the caller's
+            chunks = 0
+            for chunk in d.chunks(chunk_size=800):
+                time.sleep(0.01)
+                chunks += 1
+
+        self.assertEqual(chunks, 5)
+        self.assertEqual(prof.stats['Mod.stream'].calls, 1)
+        self.assertGreaterEqual(prof.stats['Mod.stream'].total, 0.05)
+        self.assertEqual(prof.stats['Demod.chunks'].calls, 1)
+        self.assertLess(prof.stats['Demod.chunks'].total, 0.04)
+
+        # Stopping early still records the call
+        with profiling(memory=False) as prof:
+            next(d.chunks(chunk_size=800))
+        self.assertEqual(prof.stats['Demod.chunks'].calls, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+import unittest
+import numpy as np
+from scipy import signal
+import dsproc
+from dsproc.sig.resample import Resampler, polyphase_filter, factorise
+
+
+def noise(n):
+    return (np.random.randn(n) + 1j * np.random.randn(n)).astype(np.complex64)
+
+
+def in_blocks(resampler, x, sizes):
+    out = []
+    start = 0
+    for size in sizes:
+        out.append(resampler.process(x[start:start + size]))
+        start += size
+    out.append(resampler.process(x[start:]))
+    out.append(resampler.flush())
+    return np.concatenate(out)
+
+
+class TestResampler(unittest.TestCase):
+    def test_matches_resample_poly(self):
+        # A single stage uses the same filter as resample_poly, so the output should be identical however it is split
+        for up, down in [(1, 2), (1, 10), (3, 2), (2, 3), (10, 1), (147, 160)]:
+            for n in [1, 37, 4097]:
+                x = noise(n)
+                expected = signal.resample_poly(x, up, down)
+
+                r = Resampler(up, down, multistage=False)
+                out = in_blocks(r, x, [1, 3, 100, 7, 2000])
+
+                self.assertEqual(out.dtype, np.complex64)
+                self.assertTrue(np.array_equal(out, expected), f"{up}/{down}, {n} samples")
+
+    def test_reusable(self):
+        x = noise(1000)
+        r = Resampler(2, 3)
+        first = r.resample(x)
+        second = r.resample(x)
+        self.assertTrue(np.array_equal(first, second))
+
+    def test_multistage_plan(self):
+        self.assertEqual(Resampler(1, 64).plan, [(1, 8), (1, 8)])
+        self.assertEqual(Resampler(100, 1).plan, [(10, 1), (10, 1)])
+        self.assertEqual(Resampler(1, 64, multistage=False).plan, [(1, 64)])
+        # Mixed ratios are done in one go, after dividing out the common factor
+        self.assertEqual(Resampler(320, 480).plan, [(2, 3)])
+        self.assertEqual(Resampler(7, 7).plan, [])
+
+        self.assertEqual(factorise(1000, 13), [10, 10, 10])
+        self.assertEqual(factorise(26, 13), [13, 2])
+
+    def test_multistage(self):
+        fs = 64000
+        t = np.arange(64000) / fs
+        x = np.exp(2j * np.pi * 100 * t).astype(np.complex64)
+
+        r = Resampler(1, 64)
+        out = in_blocks(r, x, [5000, 1, 20000])
+        self.assertEqual(len(out), len(signal.resample_poly(x, 1, 64)))
+
+        # The tone is well within the passband so should come through untouched, away from the edges
+        expected = np.exp(2j * np.pi * 100 * t[::64])
+        self.assertTrue(np.allclose(out[50:-50], expected[50:-50], atol=1e-3))
+
+    def test_design_cached(self):
+        self.assertIs(polyphase_filter(1, 10)[0], polyphase_filter(1, 10)[0])
+        self.assertIs(Resampler(1, 10).stages[0].taps, Resampler(1, 10).stages[0].taps)
+        with self.assertRaises(ValueError):
+            polyphase_filter(1, 10)[0][0] = 1
+
+    def test_precision(self):
+        try:
+            dsproc.set_precision('double')
+            x = np.exp(2j * np.pi * 10 * np.arange(1000) / 64000)
+            for up, down in ((1, 4), (1, 64), (3, 2), (1, 1)):
+                r = Resampler(up, down)
+                self.assertEqual(r.flush().dtype, np.complex128)
+                self.assertEqual(r.process(x).dtype, np.complex128)
+                self.assertEqual(r.flush().dtype, np.complex128)
+        finally:
+            dsproc.set_precision('single')
+
+    def test_bad_factors(self):
+        with self.assertRaises(ValueError):
+            Resampler(0, 1)
+        with self.assertRaises(ValueError):
+            Resampler(1.5, 1)
+
+    def test_signal_methods(self):
+        s = dsproc.Mod(fs=64000, message=np.array([0, 1, 2, 3] * 10), sps=640, f=2000)
+        s.QPSK()
+        s.decimate(64)
+        self.assertEqual((s.fs, s.sps, len(s.samples)), (1000, 10, 400))
+
+        # Each stage (36 is done as 9 then 4) is scipy's decimate, with the filter designed once
+        for ftype in ('iir', 'fir'):
+            s = dsproc.Mod(fs=36000, message=np.array([0, 1, 2, 3] * 10), sps=360, f=2000)
+            s.QPSK()
+            expected = signal.decimate(s.samples.astype(np.complex128), 9, n=8, ftype=ftype)
+            expected = signal.decimate(expected, 4, n=8, ftype=ftype)
+            s.decimate(36, ftype=ftype)
+            self.assertTrue(np.allclose(s.samples, expected, atol=1e-5), ftype)
+
+        s = dsproc.Mod(fs=17000, message=np.array([0, 1, 2, 3] * 10), sps=170, f=2000)
+        s.QPSK()
+        with self.assertWarns(RuntimeWarning):
+            s.decimate(17)
+
+        s = dsproc.Mod(fs=10000, message=np.array([0, 1, 2, 3] * 10), sps=10, f=2000)
+        s.QPSK()
+        expected = signal.resample_poly(s.samples, 3, 2)
+        s.resample(up=3, down=2)
+        self.assertTrue(np.allclose(s.samples, expected, atol=1e-5))
+        self.assertEqual((s.fs, s.sps), (15000, 15))
+
+
+if __name__ == "__main__":
+    unittest.main()
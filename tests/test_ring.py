@@ -0,0 +1,88 @@
+import threading
+import unittest
+import numpy as np
+import dsproc
+from dsproc.sig.ring import RingBuffer, Overrun
+
+
+def random_samples(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return (rng.standard_normal(n) + 1j * rng.standard_normal(n)).astype(np.complex64)
+
+
+class TestRing(unittest.TestCase):
+    def test_views_across_the_wrap(self):
+        x = random_samples(1000)
+        ring = RingBuffer(capacity=64, max_read=16)
+        reader = ring.reader()
+        out = []
+        for block in np.array_split(x, 100):
+            ring.write(block)
+            while reader.available:
+                start, view = reader.read()
+                self.assertEqual(start, sum(map(len, out)))
+                # A view of the buffer, not a copy, and one the consumers can't write to
+                self.assertTrue(np.shares_memory(view, ring._buffer))
+                self.assertFalse(view.flags.writeable)
+                out.append(view.copy())
+
+        self.assertTrue(np.array_equal(np.concatenate(out), x))
+        self.assertEqual(reader.overruns, 0)
+
+    def test_overrun(self):
+        ring = RingBuffer(capacity=100, max_read=10)
+        reader = ring.reader(on_overrun='raise')
+        ring.write(np.zeros(80))
+        start, view = reader.read()
+        ring.write(np.ones(80))
+        self.assertTrue(ring.overwritten(start))
+        with self.assertRaises(Overrun) as e:
+            reader.read()
+        self.assertEqual(e.exception.lost, 50)
+        self.assertEqual(reader.read()[0], 60)
+
+        late = ring.reader(start='oldest')
+        self.assertEqual(late.read()[0], 60)
+
+    def test_threads(self):
+        x = random_samples(200000)
+        ring = RingBuffer(capacity=8192, max_read=1024)
+        f = 1500
+        readers = [ring.reader() for _ in range(3)]
+        results = [None] * 3
+
+        def baseband(i):
+            out = []
+            for d in dsproc.Demod.from_ring(readers[i], fs=10000, f=f):
+                d.baseband()
+                out.append(d.samples)
+            results[i] = np.concatenate(out)
+
+        def power(i):
+            total = 0.0
+            for start, view in readers[i]:
+                total += float(np.sum(np.abs(view) ** 2))
+            results[i] = total
+
+        threads = [threading.Thread(target=baseband, args=(0,)), threading.Thread(target=baseband, args=(1,)),
+                   threading.Thread(target=power, args=(2,))]
+        for t in threads:
+            t.start()
+        # Waiting for the slowest reader means nothing is lost
+        for block in np.array_split(x, 300):
+            ring.write(block, wait=True, timeout=10)
+        ring.close()
+        for t in threads:
+            t.join(10)
+
+        whole = dsproc.Demod(fs=10000, f=f)
+        whole.samples = x.copy()
+        whole.baseband()
+        self.assertTrue(np.allclose(results[0], whole.samples, atol=1e-5))
+        self.assertTrue(np.allclose(results[0], results[1], atol=1e-5))
+        self.assertAlmostEqual(results[2], float(np.sum(np.abs(x) ** 2)), delta=1)
+        self.assertEqual(sum(r.lost for r in readers), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -42,6 +42,28 @@ class TestSig(unittest.TestCase):
         s.message = MESSAGE[0:400]
         self.assertEqual(len(s.t), len(1 / s.fs * np.arange(s.dur * s.fs)))
 
+    def test_cached_properties(self):
+        s = Signal(fs=100, message=MESSAGE, sps=2)
+        t = s.t
+        self.assertIs(s.t, t)
+        self.assertIs(s.M, s.M)
+        with self.assertRaises(ValueError):
+            t[0] = 1
+
+        # Changing the samples only recalculates t, not M
+        cache = s.__dict__["_cache"]
+        s.samples = np.zeros(10, dtype=np.complex64)
+        self.assertNotIn("t", cache)
+        self.assertIn("M", cache)
+        self.assertEqual(len(s.t), 10)
+
+        s.sample_offset = 5
+        self.assertEqual(s.t[0], 5 / s.fs)
+
+        # Other attributes don't touch the cache
+        s.f = 10
+        self.assertIn("t", cache)
+
     def test_create_samples(self):
         s = Signal(fs=100, message=MESSAGE, sps=2)
 
@@ -81,7 +103,8 @@ class TestSig(unittest.TestCase):
         offset_wave = create_wave(s.t, f=-100, amp=1, phase=0)
         wave = wave * offset_wave
 
-        self.assertTrue(np.all(s.samples == wave))
+        # The mixing tone comes from an NCO, so it matches the exact wave to within complex64 rounding
+        self.assertTrue(np.allclose(s.samples, wave, atol=1e-5))
 
         # Shift up
         s = Signal(fs=100, message=MESSAGE, sps=2, f=-100)
@@ -92,7 +115,8 @@ class TestSig(unittest.TestCase):
         offset_wave = create_wave(s.t, f=100, amp=1, phase=0)
         wave = wave * offset_wave
 
-        self.assertTrue(np.all(s.samples == wave))
+        # The mixing tone comes from an NCO, so it matches the exact wave to within complex64 rounding
+        self.assertTrue(np.allclose(s.samples, wave, atol=1e-5))
 
     def test_phase_offsets(self):
 
@@ -126,7 +150,8 @@ class TestSig(unittest.TestCase):
 
             # Test
             s.freq_offset(freq=freq)
-            self.assertTrue(np.all(s.samples == wave))
+            # The mixing tone comes from an NCO, so it matches the exact wave to within complex64 rounding
+            self.assertTrue(np.allclose(s.samples, wave, atol=1e-5))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,145 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import dsproc
+from dsproc.sig.source import from_iq, to_iq, read_iq, write_iq, IQView
+
+
+class TestSource(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.fn = os.path.join(self.dir.name, "capture")
+
+        s = dsproc.Mod(fs=10000, message=dsproc.create_message(500, 4), sps=8, f=1500)
+        s.QPSK()
+        self.samples = s.samples
+        self.samples.tofile(self.fn)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_window(self):
+        source = dsproc.SampleSource(self.fn, offset=100, count=50)
+        self.assertEqual(len(source), 50)
+        self.assertTrue(np.all(source.read() == self.samples[100:150]))
+
+        # A count past the end of the file is clipped
+        source = dsproc.SampleSource(self.fn, offset=3000, count=5000)
+        self.assertEqual(len(source), len(self.samples) - 3000)
+
+        with self.assertRaises(ValueError):
+            dsproc.SampleSource(self.fn, offset=len(self.samples) + 1)
+
+    def test_mmap_demod(self):
+        d = dsproc.Demod(fs=10000, fn=self.fn, mmap=True, offset=10, count=1000)
+        self.assertIsInstance(d.samples, np.memmap)
+        self.assertTrue(np.all(d.samples == self.samples[10:1010]))
+
+        d = dsproc.Demod(fs=10000, fn=self.fn, offset=10, count=1000)
+        self.assertTrue(np.all(d.samples == self.samples[10:1010]))
+
+    def test_chunks(self):
+        whole = dsproc.Demod(fs=10000, fn=self.fn, f=1500)
+        whole.baseband()
+        whole.quadrature_demod()
+
+        d = dsproc.Demod(fs=10000, fn=self.fn, f=1500, mmap=True)
+        out = []
+        for chunk in d.chunks(chunk_size=777, overlap=1):
+            chunk.baseband()
+            chunk.quadrature_demod()
+            out.append(chunk.samples)
+        out = np.concatenate(out)
+
+        self.assertEqual(len(out), len(whole.samples))
+        # Compare the phases on the unit circle so values either side of +-pi match
+        self.assertTrue(np.allclose(np.exp(1j * out), np.exp(1j * whole.samples), atol=1e-4))
+
+    def test_chunks_in_memory(self):
+        # Baseband works in place, which mustn't reach back into the capture the chunks came from
+        d = dsproc.Demod(fs=1000, f=123)
+        d.samples = np.ones(1000, dtype=np.complex64)
+        out = []
+        for chunk in d.chunks(chunk_size=100, overlap=1):
+            chunk.baseband()
+            out.append(chunk.samples[:100])
+
+        self.assertTrue(np.all(d.samples == 1))
+        self.assertTrue(np.allclose(np.concatenate(out), np.exp(-2j * np.pi * 123 * np.arange(1000) / 1000), atol=1e-5))
+
+    def test_chunks_keep_parameters(self):
+        d = dsproc.Demod(fs=1000, f=123, fmt='cs16', full_scale=0.5)
+        d.samples = np.ones(1000, dtype=np.complex64)
+        d.sps = 8
+        for chunk in d.chunks(chunk_size=300):
+            self.assertEqual((chunk.fs, chunk.f, chunk.sps, chunk.fmt, chunk.full_scale), (1000, 123, 8, 'cs16', 0.5))
+
+    def test_quantised_formats(self):
+        x = self.samples / np.max(np.abs(self.samples))
+        for fmt, bits in [('cs16', 16), ('cs8', 8), ('cu8', 8)]:
+            raw = to_iq(x, fmt)
+            self.assertEqual(raw.itemsize * 8, bits)
+            self.assertEqual(len(raw), 2 * len(x))
+            # Rounding error is at most half a step on each of I and Q
+            self.assertLess(np.max(np.abs(from_iq(raw, fmt) - x)), 1.5 / 2**bits)
+
+            fn = self.fn + "." + fmt
+            write_iq(fn, x, chunk_size=1000)
+            self.assertEqual(os.path.getsize(fn), len(x) * bits // 4)
+            self.assertTrue(np.array_equal(read_iq(fn, offset=10, count=100), from_iq(raw, fmt)[10:110]))
+
+            d = dsproc.Demod(fs=10000, fn=fn, mmap=True)
+            self.assertIsInstance(d.samples, IQView)
+            self.assertEqual(d.samples.shape, x.shape)
+            self.assertTrue(np.array_equal(d.samples[100:200], from_iq(raw, fmt)[100:200]))
+            self.assertTrue(np.array_equal(np.asarray(d.samples), from_iq(raw, fmt)))
+
+        # Clipping and scaling
+        self.assertTrue(np.array_equal(to_iq(np.array([4 - 4j]), 'cs16'), [32767, -32768]))
+        self.assertTrue(np.array_equal(to_iq(np.array([4 - 4j]), 'cs16', full_scale=8), [16384, -16384]))
+        self.assertTrue(np.allclose(from_iq(np.array([16384, -16384]), 'cs16', full_scale=8), 4 - 4j))
+        with self.assertRaises(ValueError):
+            to_iq(x, 'cs4')
+
+    def test_dither(self):
+        # A tone smaller than one step rounds to nothing without dither, but survives in the noise with it
+        x = 0.003 * np.exp(2j * np.pi * 0.01 * np.arange(100000))
+        plain = from_iq(to_iq(x, 'cs8'), 'cs8')
+        dithered = from_iq(to_iq(x, 'cs8', dither=True, rng=np.random.default_rng(0)), 'cs8')
+        self.assertEqual(np.count_nonzero(plain), 0)
+        self.assertGreater(np.abs(np.vdot(x, dithered)) / np.vdot(x, x).real, 0.9)
+
+    def test_quantised_chunks(self):
+        fn = self.fn + ".cs16"
+        write_iq(fn, self.samples, full_scale=2)
+        whole = dsproc.Demod(fs=10000, fn=fn, f=1500, full_scale=2)
+        whole.baseband()
+
+        d = dsproc.Demod(fs=10000, fn=fn, f=1500, mmap=True, full_scale=2)
+        out = []
+        for chunk in d.chunks(chunk_size=777):
+            chunk.baseband()
+            out.append(chunk.samples)
+        self.assertTrue(np.allclose(np.concatenate(out), whole.samples, atol=1e-6))
+        loaded = dsproc.Demod(fs=10000, fn=fn, f=1500, full_scale=2)
+        self.assertEqual(d.spectrum(nfft=256).peak(), loaded.spectrum(nfft=256).peak())
+
+    def test_quantised_mmap_in_place(self):
+        # The in place methods turn the lazily converted samples into an array first
+        fn = self.fn + ".cs16"
+        write_iq(fn, self.samples, full_scale=2)
+        whole = dsproc.Demod(fs=10000, fn=fn, f=1500, full_scale=2)
+        d = dsproc.Demod(fs=10000, fn=fn, f=1500, mmap=True, full_scale=2)
+        self.assertIsInstance(d.samples, IQView)
+        for sig in (whole, d):
+            sig.baseband()
+            sig.phase_offset(30)
+            sig.freq_offset(100)
+            sig.normalise_amplitude()
+
+        self.assertTrue(np.allclose(d.samples, whole.samples, atol=1e-6))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=1)
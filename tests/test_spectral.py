@@ -0,0 +1,85 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from scipy import signal
+import dsproc
+from dsproc.sig.spectral import Welch, welch, stft, spectrogram, get_window
+
+
+def noisy_tone(n, f=1000, fs=10000, seed=0):
+    rng = np.random.default_rng(seed)
+    tone = np.exp(2j * np.pi * f * np.arange(n) / fs)
+    return (tone + 0.1 * (rng.standard_normal(n) + 1j * rng.standard_normal(n))).astype(np.complex64)
+
+
+class TestSpectral(unittest.TestCase):
+    def test_welch_matches_scipy(self):
+        x = noisy_tone(50001)
+        psd = welch(x, fs=10000, nfft=512, chunk_size=3000)
+        freqs, expected = signal.welch(x, fs=10000, window='hann', nperseg=512, noverlap=256, return_onesided=False,
+                                       detrend=False)
+
+        self.assertEqual(psd.density.dtype, np.float32)
+        self.assertTrue(np.allclose(psd.freqs, np.fft.fftshift(freqs)))
+        self.assertTrue(np.allclose(psd.density, np.fft.fftshift(expected), rtol=1e-4))
+
+    def test_welch_blocks(self):
+        x = noisy_tone(20000)
+        whole = welch(x, fs=10000, nfft=256)
+        w = Welch(fs=10000, nfft=256)
+        for block in np.array_split(x, 13):
+            w.update(block)
+        self.assertEqual(w.frames, (len(x) - 256) // 128 + 1)
+        self.assertTrue(np.allclose(w.result().density, whole.density, rtol=1e-5))
+
+        # Shorter than one frame
+        self.assertEqual(len(welch(x[:100], fs=10000, nfft=256).density), 100)
+
+    def test_psd_questions(self):
+        psd = welch(noisy_tone(100000), fs=10000, nfft=1024)
+        self.assertAlmostEqual(psd.peak(), 1000, delta=psd.df)
+        # The tone has power 1 and the noise 0.02
+        self.assertAlmostEqual(float(psd.total_power()), 1.02, delta=0.01)
+        self.assertAlmostEqual(float(psd.band_power(900, 1100)), 1.0, delta=0.01)
+
+    def test_stft(self):
+        x = noisy_tone(10000)
+        freqs, times, S = stft(x, fs=10000, nfft=256, chunk_size=1000)
+        self.assertEqual(S.shape, ((len(x) - 256) // 128 + 1, 256))
+        self.assertEqual(S.dtype, np.complex64)
+
+        frame = np.fft.fftshift(np.fft.fft(x[128 * 7:128 * 7 + 256] * get_window('hann', 256)))
+        self.assertTrue(np.allclose(S[7], frame, atol=1e-3))
+        self.assertAlmostEqual(times[0], 128 / 10000)
+
+        freqs, times, power = spectrogram(x, fs=10000, nfft=256, max_frames=10)
+        self.assertEqual(power.shape, (10, 256))
+        self.assertTrue(np.all(np.abs(freqs[np.argmax(power, axis=1)] - 1000) < 40))
+
+    def test_signal_methods(self):
+        s = dsproc.Mod(fs=10000, message=np.random.default_rng(0).integers(0, 4, 2000), sps=8, f=1000)
+        s.QPSK()
+        psd = s.spectrum()
+        self.assertEqual(s.efficiency(psd=psd), s.efficiency())
+        # Nearly all the power is inside a band round the carrier
+        spill = s.power_spill(-1000, 3000, psd=psd)
+        self.assertGreaterEqual(spill, 0)
+        self.assertLess(spill, 0.05 * psd.total_power())
+        self.assertGreater(s.power_spill(2000, 3000, psd=psd), 0.5 * psd.total_power())
+        # A band crossing 0 Hz overlaps its mirror image, which is only taken out once
+        self.assertAlmostEqual(s.power_spill(-5000, 5000, psd=psd), 0)
+        self.assertAlmostEqual(s.power_spill(-500, 500, psd=psd), psd.total_power() - psd.band_power(-500, 500),
+                               places=5)
+
+    def test_memmap(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            fn = os.path.join(tmp, "capture.bin")
+            noisy_tone(300000, f=-1500).tofile(fn)
+            d = dsproc.Demod(fs=10000, fn=fn, mmap=True)
+            self.assertEqual(d.spectrum(nfft=1000).peak(), -1500)
+            self.assertEqual(d.exponentiate(order=2, nfft=1000), -3000)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+import asyncio
+import os
+import tempfile
+import unittest
+import numpy as np
+import dsproc
+from dsproc.sig.stream import ReplaySource, FileSource, SocketSource, SocketSink, CaptureSink, replay
+
+
+def random_samples(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return (rng.standard_normal(n) + 1j * rng.standard_normal(n)).astype(np.complex64) / 4
+
+
+async def collect(source, delay=0):
+    blocks = []
+    async for block in source:
+        blocks.append(block)
+        await asyncio.sleep(delay)
+    return blocks
+
+
+class TestStream(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.fn = os.path.join(self.tmp.name, "capture.cf32")
+        self.x = random_samples(50000)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    async def test_replay(self):
+        source = ReplaySource(self.x, fs=1e6, block_size=4096, start_time=1000.0)
+        blocks = await collect(source)
+
+        self.assertTrue(np.array_equal(np.concatenate([b.samples for b in blocks]), self.x))
+        self.assertEqual([b.start for b in blocks[:3]], [0, 4096, 8192])
+        self.assertAlmostEqual(blocks[1].time, 1000.0 + 4096 / 1e6)
+        self.assertEqual((source.stats.blocks, source.stats.samples, source.stats.dropped), (13, 50000, 0))
+
+    async def test_backpressure_and_drops(self):
+        # A slow consumer makes a blocking source wait...
+        source = ReplaySource(self.x, fs=1e6, block_size=1000, queue_size=2)
+        blocks = await collect(source, delay=0.001)
+        self.assertEqual(len(blocks), 50)
+        self.assertGreater(source.stats.waited, 0)
+        self.assertEqual(source.stats.max_backlog, 2)
+
+        # ...and a dropping one lose blocks, which leave gaps in the sample numbers
+        source = ReplaySource(self.x, fs=1e6, block_size=1000, queue_size=2, overflow='drop')
+        blocks = await collect(source, delay=0.001)
+        self.assertGreater(source.stats.dropped, 0)
+        self.assertEqual(source.stats.samples + source.stats.dropped_samples, len(self.x))
+        starts = [b.start for b in blocks]
+        self.assertTrue(any(b - a > 1000 for a, b in zip(starts, starts[1:])))
+
+    async def test_real_time(self):
+        source = ReplaySource(self.x[:20000], fs=200000, block_size=2000, speed=1.0)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await collect(source)
+        self.assertGreaterEqual(loop.time() - started, 0.09)
+
+    async def test_file_and_capture(self):
+        with dsproc.CaptureWriter(self.fn, fs=48000, fmt='cs16', full_scale=2) as w:
+            w.write(self.x)
+
+        source = FileSource(self.fn, block_size=10000)
+        self.assertEqual(source.fs, 48000)
+        out = os.path.join(self.tmp.name, "copy.cf32")
+        stats = await replay(source, CaptureSink(out, fs=source.fs))
+
+        self.assertEqual(stats.samples, len(self.x))
+        c = dsproc.Capture(out)
+        self.assertTrue(np.allclose(c.read(), self.x, atol=1e-4))
+
+    async def test_tcp(self):
+        s = dsproc.Mod(fs=10000, message=dsproc.create_message(1000, 4), sps=8, f=1000)
+        s.QPSK()
+
+        source = SocketSource(fs=s.fs, protocol='tcp', fmt='cs16', block_size=3000)
+        await source.start()
+        receiving = asyncio.create_task(collect(source))
+        async with SocketSink(source.port, protocol='tcp', fmt='cs16') as sink:
+            await s.stream(sink, block_size=1234)
+        blocks = await receiving
+
+        received = np.concatenate([b.samples for b in blocks])
+        self.assertEqual(len(received), len(s.samples))
+        self.assertTrue(np.allclose(received, s.samples, atol=1e-4))
+        self.assertEqual(source.stats.dropped, 0)
+
+    async def test_udp(self):
+        source = SocketSource(fs=1e6, protocol='udp', queue_size=1000)
+        await source.start()
+        receiving = asyncio.create_task(collect(source))
+
+        sink = SocketSink(source.port, protocol='udp', packet_size=1000)
+        await sink.write(self.x[:10000])
+        # Pretend the network lost a datagram
+        await sink.write(dsproc.sig.stream.Block(self.x[12000:20000], 12000, 0, 0))
+        await sink.close()
+        blocks = await receiving
+
+        self.assertEqual(len(blocks), 18)
+        self.assertEqual((source.stats.dropped, source.stats.dropped_samples), (1, 2000))
+        self.assertTrue(np.array_equal(blocks[-1].samples, self.x[19000:20000]))
+
+    async def test_demod_from_stream(self):
+        f = 1500
+        x = np.exp(2j * np.pi * f * np.arange(20000) / 10000).astype(np.complex64)
+        out = []
+        async for d in dsproc.Demod.from_stream(ReplaySource(x, fs=10000, block_size=3000), f=f):
+            d.baseband()
+            out.append(d.samples)
+        self.assertTrue(np.allclose(np.concatenate(out), 1, atol=1e-4))
+
+
+if __name__ == "__main__":
+    unittest.main()